@@ -0,0 +1,5 @@
+"""
+性能基准测试工具：本地的 NapCat 与大模型接口模拟服务，以及驱动 PictureSniffer 的基准测试脚本
+
+用法: python -m benchmark.run --help
+"""
@@ -0,0 +1,252 @@
+import argparse
+import errno
+import hashlib
+import json
+import os
+import random
+import shutil
+import sys
+import time
+from typing import Dict, List, Optional
+from functions.blob_storage import PICTURES_PREFIX, sharded_key, thumbnail_key
+from functions.database import DatabaseManager
+from functions.labels import CATEGORIES, LABEL_VERSION
+from .stub_napcat import make_png
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 描述模板的组成部分，组合出足够多样的中文描述，便于测试关键词搜索
+STYLES = ["中世纪", "现代", "奇幻童话", "写实生存", "赛博朋克", "复古像素", "史诗宏大", "东方古风", "蒸汽朋克", "极简"]
+SUBJECTS = [
+    "城堡", "生存小屋", "红石机械", "樱花林村落", "沙漠绿洲", "雪地渔村", "下界堡垒", "海底神殿", "空岛",
+    "地铁站", "摩天大楼", "寺庙", "农场", "矿洞", "像素画", "桥梁", "港口", "图书馆", "教堂", "花园"
+]
+MATERIALS = ["石砖", "深色橡木", "白桦木", "下界石英", "玻璃", "混凝土", "砂岩", "云杉木", "铜块", "紫珀块", "苔石", "羊毛"]
+DETAILS = [
+    "屋顶用台阶方块模拟瓦片", "南瓜灯散发暖光", "周围环绕着小麦田", "墙角蔓延着藤蔓", "窗户内侧摆放着书架",
+    "塔楼错落分布", "萤石点缀在小径两侧", "水流从高处倾泻而下", "红石灯在夜晚闪烁", "远处是云雾缭绕的雪山",
+    "拱门上刻有自定义花纹", "走廊延伸到湖面之上", "地下隐藏着刷怪塔", "屋檐下挂着灯笼"
+]
+MOODS = ["氛围宁静", "充满史诗感", "色彩明快", "细节丰富", "光影柔和", "气势恢宏", "温馨治愈", "略显荒凉"]
+
+# 分类的Zipf分布指数，少数热门分类占大部分图片
+CATEGORY_SKEW = 1.1
+# 图片时间的平均“年龄”（天），越新的时间段图片越多
+MEAN_AGE_DAYS = 120
+MAX_AGE_DAYS = 3 * 365
+
+
+def _description(rng: random.Random, category: str) -> str:
+    return (
+        f"{rng.choice(STYLES)}风格的{rng.choice(SUBJECTS)}，以{rng.choice(MATERIALS)}和{rng.choice(MATERIALS)}为主要材质，"
+        f"{rng.choice(DETAILS)}，{rng.choice(DETAILS)}，整体{rng.choice(MOODS)}，属于{category}类作品"
+    )
+
+
+def _category_weights() -> List[float]:
+    return [1 / (rank + 1) ** CATEGORY_SKEW for rank in range(len(CATEGORIES))]
+
+
+def _create_time(rng: random.Random, now: int) -> int:
+    # 指数分布的图片年龄，叠加白天/晚上的活跃度差异
+    age_days = min(rng.expovariate(1 / MEAN_AGE_DAYS), MAX_AGE_DAYS)
+    timestamp = now - int(age_days * 86400)
+    hour = rng.choices(range(24), weights=[1, 1, 1, 1, 1, 1, 2, 3, 4, 5, 5, 6, 7, 6, 6, 6, 7, 8, 9, 10, 10, 9, 6, 3])[0]
+    return timestamp - timestamp % 86400 + hour * 3600 + rng.randrange(3600)
+
+
+class PlaceholderWriter:
+    def __init__(self, root: str, mode: str = "link"):
+        """
+        写入与数据库记录对应的占位图片文件
+
+        Args:
+            root: 存储根目录（包含 pictures/ 与 cache/）
+            mode: link 使用硬链接（默认，几乎不占用磁盘空间）；copy 复制文件内容；none 不写入文件
+        """
+        self.root = root
+        self.mode = mode
+        self._sources: Dict[str, str] = {}
+        self._originals = make_png(128, 96, seed=1)
+        self._thumbnails = make_png(64, 48, seed=2)
+
+    def _source(self, ext: str, content: bytes) -> str:
+        source = self._sources.get(ext)
+        if source is None:
+            source = os.path.join(self.root, f".placeholder{len(self._sources)}{ext}")
+            with open(source, "wb") as f:
+                f.write(content)
+            self._sources[ext] = source
+        return source
+
+    def _place(self, key: str, content: bytes):
+        path = os.path.join(self.root, *key.split("/"))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if self.mode == "copy":
+            with open(path, "wb") as f:
+                f.write(content)
+            return
+        ext = os.path.splitext(key)[1]
+        try:
+            os.link(self._source(ext, content), path)
+        except FileExistsError:
+            pass
+        except OSError as e:
+            if e.errno != errno.EMLINK:
+                raise
+            # 硬链接数达到文件系统上限，换一个新的源文件
+            self._sources.pop(ext, None)
+            os.link(self._source(ext, content), path)
+
+    def write(self, image_key: str):
+        if self.mode == "none":
+            return
+        self._place(image_key, self._originals)
+        self._place(thumbnail_key(image_key), self._thumbnails)
+
+    def close(self):
+        for source in self._sources.values():
+            os.remove(source)
+        self._sources = {}
+
+
+def generate(
+    db_path: str,
+    rows: int,
+    groups: int = 50,
+    root: Optional[str] = None,
+    files: str = "link",
+    local_ratio: float = 0.1,
+    batch_size: int = 10000,
+    seed: int = 0
+) -> Dict[str, float]:
+    """
+    向图库数据库写入合成数据：images、image_meta、groups，以及对应的占位图片
+
+    Args:
+        db_path: 数据库路径，不存在时创建
+        rows: 图片记录数量
+        groups: 群数量
+        root: 占位图片的存储根目录，默认为数据库所在目录
+        files: 占位图片写入方式，link/copy/none
+        local_ratio: 本地导入图片（ID为A+MD5）的比例
+        batch_size: 每个事务写入的记录数
+        seed: 随机数种子
+
+    Returns:
+        Dict[str, float]: 统计，包含rows与seconds
+    """
+    rng = random.Random(seed)
+    root = root or os.path.dirname(os.path.abspath(db_path))
+    db_manager = DatabaseManager(db_path)
+    writer = PlaceholderWriter(root, files)
+    weights = _category_weights()
+    cumulative_weights = [sum(weights[:index + 1]) for index in range(len(weights))]
+    now = int(time.time())
+    group_ids = [str(600000000 + index * 7919) for index in range(groups)]
+    last_message_ids: Dict[str, int] = {}
+
+    start = time.perf_counter()
+    conn = db_manager.get_connection()
+    # 生成数据时不需要每个事务都同步到磁盘
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=OFF")
+    try:
+        written = 0
+        while written < rows:
+            count = min(batch_size, rows - written)
+            images: List[tuple] = []
+            metas: List[tuple] = []
+            for index in range(written, written + count):
+                md5 = hashlib.md5(f"{seed}-{index}".encode()).hexdigest()
+                if rng.random() < local_ratio:
+                    image_id = f"A{md5}"
+                    ext = os.path.splitext(rng.choice(["a.jpg", "a.png", "a.jpg", "a.webp"]))[1]
+                else:
+                    group_id = rng.choice(group_ids)
+                    message_id = 1000000000 + index
+                    last_message_ids[group_id] = max(last_message_ids.get(group_id, 0), message_id)
+                    image_id = str(message_id)
+                    ext = ".jpg"
+                category = rng.choices(CATEGORIES, cum_weights=cumulative_weights)[0]
+                create_time = _create_time(rng, now)
+                image_key = sharded_key(PICTURES_PREFIX, md5, ext)
+                images.append((image_id, image_key, category, _description(rng, category), create_time, LABEL_VERSION))
+                metas.append((image_id, "true", md5, create_time))
+                writer.write(image_key)
+            db_manager.insert_images_with_meta(images, metas, conn)
+            conn.commit()
+            written += count
+            elapsed = time.perf_counter() - start
+            print(f"已写入 {written}/{rows} 条，{written / max(elapsed, 1e-6):.0f} 条/秒", file=sys.stderr)
+        conn.executemany(
+            "INSERT OR REPLACE INTO groups (group_id, last_message_id) VALUES (?, ?)",
+            [(group_id, str(last_message_ids.get(group_id, 0))) for group_id in group_ids]
+        )
+        conn.commit()
+        conn.execute("ANALYZE")
+    finally:
+        conn.close()
+        writer.close()
+    return {"rows": rows, "seconds": round(time.perf_counter() - start, 2)}
+
+
+def write_server_config(directory: str, webui_token: str):
+    """
+    在数据目录中写入 server.py 所需的 config.json，存储根目录指向该目录
+
+    Args:
+        directory: 数据目录
+        webui_token: 前端认证令牌，压测脚本使用同一个令牌
+    """
+    config_path = os.path.join(directory, "config.json")
+    if os.path.exists(config_path):
+        return
+    example = os.path.join(REPO_DIR, "config.json.example")
+    with open(example, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    config.update({
+        "db_path": "picture_sniffer.db",
+        "storage_root": os.path.abspath(directory),
+        "webui_token": webui_token,
+        "log_level": "WARNING"
+    })
+    with open(config_path, "w", encoding="utf-8") as f:
+        json.dump(config, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="生成图库的合成数据集，用于数据库与Web接口的性能测试")
+    parser.add_argument("directory", help="数据目录，数据库为 <directory>/picture_sniffer.db，占位图片写入 pictures/ 与 cache/")
+    parser.add_argument("--rows", type=int, default=10000, help="图片记录数量（1万到500万）")
+    parser.add_argument("--groups", type=int, default=50, help="群数量")
+    parser.add_argument("--files", choices=["link", "copy", "none"], default="link", help="占位图片写入方式")
+    parser.add_argument("--local-ratio", type=float, default=0.1, help="本地导入图片的比例")
+    parser.add_argument("--batch-size", type=int, default=10000, help="每个事务写入的记录数")
+    parser.add_argument("--webui-token", default="bench", help="写入 config.json 的 webui_token")
+    parser.add_argument("--seed", type=int, default=0, help="随机数种子")
+    parser.add_argument("--force", action="store_true", help="删除数据目录中已有的数据库与图片")
+    args = parser.parse_args()
+
+    os.makedirs(args.directory, exist_ok=True)
+    db_file = os.path.join(args.directory, "picture_sniffer.db")
+    if args.force:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(db_file + suffix):
+                os.remove(db_file + suffix)
+        for name in ("pictures", "cache"):
+            shutil.rmtree(os.path.join(args.directory, name), ignore_errors=True)
+    elif os.path.exists(db_file):
+        parser.error(f"数据库已存在: {db_file}，使用 --force 重新生成")
+
+    stats = generate(
+        db_file,
+        args.rows,
+        groups=args.groups,
+        files=args.files,
+        local_ratio=args.local_ratio,
+        batch_size=args.batch_size,
+        seed=args.seed
+    )
+    write_server_config(args.directory, args.webui_token)
+    print(f"生成完成: {stats['rows']} 条记录，耗时 {stats['seconds']} 秒，数据目录: {os.path.abspath(args.directory)}")
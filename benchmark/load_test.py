@@ -0,0 +1,307 @@
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import quote, urlsplit
+from functions.blob_storage import thumbnail_key
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_ENDPOINTS = "images_by_time:4,search:2,random:2,category:1,pictures:1,cache:3"
+DEFAULT_KEYWORDS = "城堡,红石,樱花,沙漠,赛博朋克,下界,像素画,不存在的关键词"
+PAGE_SIZE = 20
+
+
+def _percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, int(round(q * (len(values) - 1)))))
+    return values[index]
+
+
+class LoadTest:
+    def __init__(
+        self,
+        base_url: str,
+        token: str,
+        endpoints: Dict[str, float],
+        keywords: List[str],
+        max_offset: int = 2000,
+        seed: int = 0
+    ):
+        """
+        对 server.py 的查询接口和图片文件接口施加并发负载，并统计每个接口的延迟
+
+        Args:
+            base_url: 服务器地址，如 http://127.0.0.1:5000
+            token: webui_token
+            endpoints: 接口名称到权重的映射
+            keywords: 搜索接口随机使用的关键词
+            max_offset: 列表接口随机偏移量的上限，偏移量偏向前几页
+            seed: 随机数种子
+        """
+        parts = urlsplit(base_url)
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port or 80
+        self.headers = {"Authorization": f"Bearer {token}", "Connection": "keep-alive"}
+        self.names = list(endpoints)
+        self.weights = [endpoints[name] for name in self.names]
+        self.keywords = keywords
+        self.max_offset = max_offset
+        self.seed = seed
+        self.image_paths: List[str] = []
+        self.categories: List[str] = []
+        self._lock = threading.Lock()
+        self._latencies: Dict[str, List[float]] = {}
+        self._errors: Dict[str, int] = {}
+        self._bytes: Dict[str, int] = {}
+
+    def _connection(self) -> http.client.HTTPConnection:
+        return http.client.HTTPConnection(self.host, self.port, timeout=60)
+
+    def _get_json(self, conn: http.client.HTTPConnection, path: str) -> dict:
+        conn.request("GET", path, headers=self.headers)
+        response = conn.getresponse()
+        body = response.read()
+        if response.status != 200:
+            raise RuntimeError(f"GET {path} 返回 {response.status}: {body[:200]!r}")
+        return json.loads(body)
+
+    def prepare(self, sample_pages: int = 20):
+        """
+        预先读取分类列表和若干页图片路径，供文件接口和分类接口随机选择
+        """
+        conn = self._connection()
+        try:
+            data = self._get_json(conn, "/api/categories")["data"]
+            self.categories = [item["category"] for item in data if item["count"]]
+            rng = random.Random(self.seed)
+            for _ in range(sample_pages):
+                offset = rng.randrange(max(1, self.max_offset))
+                page = self._get_json(conn, f"/api/images_by_time?offset={offset}&limit=100")["data"]
+                self.image_paths.extend(item["image_path"] for item in page if item["image_path"])
+        finally:
+            conn.close()
+        if not self.image_paths:
+            raise RuntimeError("数据库中没有图片，请先运行 python -m benchmark.gen_dataset 生成数据")
+
+    def _offset(self, rng: random.Random) -> int:
+        # 大部分请求浏览前几页，少量请求翻到很深的位置
+        if rng.random() < 0.8:
+            return rng.randrange(10) * PAGE_SIZE
+        return rng.randrange(max(1, self.max_offset))
+
+    def _path(self, name: str, rng: random.Random) -> str:
+        if name == "images_by_time":
+            return f"/api/images_by_time?offset={self._offset(rng)}&limit={PAGE_SIZE}"
+        if name == "search":
+            keyword = quote(rng.choice(self.keywords))
+            return f"/api/search?keyword={keyword}&offset={self._offset(rng) // 10}&limit={PAGE_SIZE}"
+        if name == "random":
+            return f"/api/random-image?offset={rng.randrange(max(1, self.max_offset))}&limit={PAGE_SIZE}"
+        if name == "category":
+            category = quote(rng.choice(self.categories)) if self.categories else ""
+            return f"/api/images_by_category?category={category}&limit={PAGE_SIZE}"
+        if name == "categories":
+            return "/api/categories"
+        if name == "pictures":
+            return "/" + rng.choice(self.image_paths)
+        if name == "cache":
+            return "/" + thumbnail_key(rng.choice(self.image_paths))
+        raise ValueError(f"未知接口: {name}")
+
+    def _worker(self, index: int, deadline: float, counter: List[int], total: Optional[int]):
+        rng = random.Random(self.seed * 1000 + index)
+        conn = self._connection()
+        latencies: Dict[str, List[float]] = {name: [] for name in self.names}
+        errors: Dict[str, int] = {name: 0 for name in self.names}
+        received: Dict[str, int] = {name: 0 for name in self.names}
+        try:
+            while time.perf_counter() < deadline:
+                if total is not None:
+                    with self._lock:
+                        if counter[0] >= total:
+                            break
+                        counter[0] += 1
+                name = rng.choices(self.names, weights=self.weights)[0]
+                path = self._path(name, rng)
+                start = time.perf_counter()
+                try:
+                    conn.request("GET", path, headers=self.headers)
+                    response = conn.getresponse()
+                    body = response.read()
+                    ok = response.status == 200 or (name == "random" and response.status == 404)
+                    if response.will_close:
+                        conn.close()
+                except (OSError, http.client.HTTPException):
+                    ok, body = False, b""
+                    conn.close()
+                    conn = self._connection()
+                latencies[name].append(time.perf_counter() - start)
+                received[name] += len(body)
+                if not ok:
+                    errors[name] += 1
+        finally:
+            conn.close()
+            with self._lock:
+                for name in self.names:
+                    self._latencies[name].extend(latencies[name])
+                    self._errors[name] += errors[name]
+                    self._bytes[name] += received[name]
+
+    def run(self, concurrency: int, duration: float, total: Optional[int] = None) -> Dict[str, Dict[str, float]]:
+        """
+        以指定并发运行负载，直到达到持续时间或请求总数
+
+        Args:
+            concurrency: 并发连接数
+            duration: 持续时间（秒）
+            total: 请求总数，为None时只按持续时间结束
+
+        Returns:
+            Dict[str, Dict[str, float]]: 每个接口及汇总（total）的请求数、错误数、每秒请求数和延迟分位数（毫秒）
+        """
+        # 每轮使用新的统计，避免不同并发度的结果混在一起
+        self._latencies = {name: [] for name in self.names}
+        self._errors = {name: 0 for name in self.names}
+        self._bytes = {name: 0 for name in self.names}
+        counter = [0]
+        start = time.perf_counter()
+        deadline = start + duration
+        threads = [
+            threading.Thread(target=self._worker, args=(index, deadline, counter, total), daemon=True)
+            for index in range(concurrency)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        results: Dict[str, Dict[str, float]] = {}
+        all_latencies: List[float] = []
+        for name in self.names + ["total"]:
+            if name == "total":
+                latencies = sorted(all_latencies)
+                errors = sum(self._errors.values())
+                received = sum(self._bytes.values())
+            else:
+                latencies = sorted(self._latencies[name])
+                errors = self._errors[name]
+                received = self._bytes[name]
+                all_latencies.extend(latencies)
+            results[name] = {
+                "requests": len(latencies),
+                "errors": errors,
+                "rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+                "mb_per_s": round(received / elapsed / 1048576, 2) if elapsed else 0.0,
+                "p50_ms": round(_percentile(latencies, 0.5) * 1000, 2),
+                "p90_ms": round(_percentile(latencies, 0.9) * 1000, 2),
+                "p99_ms": round(_percentile(latencies, 0.99) * 1000, 2),
+                "max_ms": round(latencies[-1] * 1000, 2) if latencies else 0.0
+            }
+        return results
+
+
+def _parse_endpoints(text: str) -> Dict[str, float]:
+    endpoints = {}
+    for item in text.split(","):
+        name, _, weight = item.strip().partition(":")
+        if name:
+            endpoints[name] = float(weight or 1)
+    return endpoints
+
+
+def _wait_for_port(host: str, port: int, process: subprocess.Popen, timeout: float):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"server.py 启动失败，退出码 {process.returncode}")
+        try:
+            with socket.create_connection((host, port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.5)
+    raise RuntimeError(f"等待 server.py 监听 {host}:{port} 超时")
+
+
+def start_server(directory: str, host: str, port: int, timeout: float = 600) -> Tuple[subprocess.Popen, float]:
+    """
+    在数据目录中启动 server.py（waitress），等待端口可用
+
+    Returns:
+        (子进程, 启动耗时秒数)
+    """
+    start = time.perf_counter()
+    process = subprocess.Popen([sys.executable, os.path.join(REPO_DIR, "server.py")], cwd=directory)
+    try:
+        _wait_for_port(host, port, process, timeout)
+    except Exception:
+        process.terminate()
+        process.wait()
+        raise
+    return process, time.perf_counter() - start
+
+
+def _print_results(results: Dict[str, Dict[str, float]]):
+    header = f"{'接口':<16}{'请求数':>10}{'错误':>8}{'请求/秒':>10}{'MB/秒':>8}{'p50(ms)':>10}{'p90(ms)':>10}{'p99(ms)':>10}{'max(ms)':>10}"
+    print(header)
+    for name, row in results.items():
+        print(
+            f"{name:<16}{row['requests']:>10}{row['errors']:>8}{row['rps']:>10}{row['mb_per_s']:>8}"
+            f"{row['p50_ms']:>10}{row['p90_ms']:>10}{row['p99_ms']:>10}{row['max_ms']:>10}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="对图库Web接口进行并发压测")
+    parser.add_argument("--url", default="http://127.0.0.1:5000", help="服务器地址")
+    parser.add_argument("--token", default="bench", help="webui_token")
+    parser.add_argument("--start-server", metavar="DIRECTORY", help="在该数据目录（gen_dataset 的输出目录）中启动 server.py")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[8], help="并发连接数，可给出多个值依次测试")
+    parser.add_argument("--duration", type=float, default=30, help="每轮的持续时间（秒）")
+    parser.add_argument("--requests", type=int, help="每轮的请求总数，达到后提前结束")
+    parser.add_argument("--endpoints", default=DEFAULT_ENDPOINTS, help="接口及权重，可选 images_by_time/search/random/category/categories/pictures/cache")
+    parser.add_argument("--keywords", default=DEFAULT_KEYWORDS, help="搜索关键词，逗号分隔")
+    parser.add_argument("--max-offset", type=int, default=2000, help="列表接口随机偏移量的上限")
+    parser.add_argument("--seed", type=int, default=0, help="随机数种子")
+    parser.add_argument("--json", dest="json_path", help="将结果写入JSON文件")
+    args = parser.parse_args()
+
+    server_process = None
+    report: Dict[str, object] = {"url": args.url, "endpoints": args.endpoints, "rounds": []}
+    try:
+        if args.start_server:
+            parts = urlsplit(args.url)
+            server_process, startup = start_server(args.start_server, parts.hostname or "127.0.0.1", parts.port or 80)
+            report["server_startup_seconds"] = round(startup, 2)
+            print(f"server.py 已启动，耗时 {startup:.1f} 秒")
+
+        load_test = LoadTest(
+            args.url,
+            args.token,
+            _parse_endpoints(args.endpoints),
+            [keyword for keyword in args.keywords.split(",") if keyword],
+            max_offset=args.max_offset,
+            seed=args.seed
+        )
+        load_test.prepare()
+        for concurrency in args.concurrency:
+            results = load_test.run(concurrency, args.duration, args.requests)
+            print(f"\n并发 {concurrency}:")
+            _print_results(results)
+            report["rounds"].append({"concurrency": concurrency, "results": results})
+    finally:
+        if server_process is not None:
+            server_process.terminate()
+            server_process.wait()
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
@@ -0,0 +1,297 @@
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Dict, List, Optional
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCENARIOS = ("backfill", "folder", "ws")
+
+
+def _parse_value(text: str) -> Any:
+    try:
+        return json.loads(text)
+    except ValueError:
+        return text
+
+
+def _merge_histograms(snapshots: List[Dict[str, Any]], name: str):
+    """
+    合并多个进程快照中同名直方图的所有标签组合
+
+    Returns:
+        (分桶上界, 各分桶计数, 总和, 次数)
+    """
+    bounds, counts, total, count = [], [], 0.0, 0
+    for snapshot in snapshots:
+        for hist_name, _, hist_bounds, hist_counts, hist_total, hist_count in snapshot.get("histograms", []):
+            if hist_name != name:
+                continue
+            if not counts:
+                bounds, counts = list(hist_bounds), [0] * len(hist_counts)
+            counts = [a + b for a, b in zip(counts, hist_counts)]
+            total += hist_total
+            count += hist_count
+    return bounds, counts, total, count
+
+
+def _interpolated_quantile(bounds: List[float], counts: List[int], count: int, q: float) -> Optional[float]:
+    # 在分位数所在的分桶内线性插值，比直接取分桶上界更接近真实值
+    if not count:
+        return None
+    target = q * count
+    cumulative = 0
+    lower = 0.0
+    for bound, bucket_count in zip(bounds, counts):
+        if bucket_count and cumulative + bucket_count >= target:
+            return lower + (bound - lower) * (target - cumulative) / bucket_count
+        cumulative += bucket_count
+        lower = bound
+    return bounds[-1] if bounds else None
+
+
+def _peak_rss_mb(who: int) -> float:
+    # Linux 上 ru_maxrss 的单位是KB，macOS 上是字节
+    peak = resource.getrusage(who).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_child(scenario: str, workdir: str, workers: int, folder: Optional[str]) -> Dict[str, Any]:
+    """
+    在独立进程中执行一个场景，指标只包含本场景的数据
+
+    Args:
+        scenario: backfill、folder 或 ws
+        workdir: 工作目录，包含config.json，数据库与图片也写在这里
+        workers: backfill 场景的工作进程数
+        folder: folder 场景导入的文件夹
+
+    Returns:
+        Dict[str, Any]: 场景结果
+    """
+    sys.path.insert(0, REPO_DIR)
+    os.chdir(workdir)
+    from functions.config_loader import load_config
+    from functions.database import DatabaseManager
+    from functions.metrics import metrics
+
+    config = load_config("config.json")
+    error = None
+    start = time.perf_counter()
+    if scenario == "ws":
+        import asyncio
+        import ws_server
+        try:
+            asyncio.run(ws_server.main())
+        except Exception as e:
+            # 模拟服务推送完消息后关闭连接，ConnectionClosedOK 属于正常结束
+            if type(e).__name__ != "ConnectionClosedOK":
+                error = repr(e)
+    else:
+        from main import PictureSniffer
+        sniffer = PictureSniffer(config)
+        if scenario == "folder":
+            sniffer.process_local_images(folder)
+        else:
+            sniffer.run(workers=workers)
+    elapsed = time.perf_counter() - start
+
+    # 多进程模式下各工作进程的指标保存在数据库中。ws_server.main() 结束时也会把本进程的指标
+    # 以 ws_server 的名称写入数据库，与 /metrics 相同排除本进程保存的快照，避免重复计数
+    own_process = "ws_server" if scenario == "ws" else None
+    snapshots = [metrics.snapshot()] + [
+        snapshot for _, snapshot, _ in DatabaseManager(config["db_path"]).get_metrics_snapshots(exclude_process=own_process)
+    ]
+    results: Dict[str, float] = {}
+    for snapshot in snapshots:
+        for name, labels, value in snapshot.get("counters", []):
+            if name == "images_total":
+                results[labels["result"]] = results.get(labels["result"], 0) + value
+    bounds, counts, total, count = _merge_histograms(snapshots, "image_seconds")
+    llm_bounds, llm_counts, _, llm_count = _merge_histograms(snapshots, "llm_request_seconds")
+    processed = sum(value for result, value in results.items() if result != "error")
+    return {
+        "scenario": scenario,
+        "images": int(processed),
+        "errors": int(results.get("error", 0)),
+        "results": {key: int(value) for key, value in sorted(results.items())},
+        "seconds": round(elapsed, 3),
+        "images_per_sec": round(processed / elapsed, 3) if elapsed else 0.0,
+        "image_mean_seconds": round(total / count, 4) if count else None,
+        "image_p50_seconds": _interpolated_quantile(bounds, counts, count, 0.5),
+        "image_p95_seconds": _interpolated_quantile(bounds, counts, count, 0.95),
+        "llm_p95_seconds": _interpolated_quantile(llm_bounds, llm_counts, llm_count, 0.95),
+        "peak_rss_mb": round(_peak_rss_mb(resource.RUSAGE_SELF), 1),
+        "children_peak_rss_mb": round(_peak_rss_mb(resource.RUSAGE_CHILDREN), 1),
+        "error": error
+    }
+
+
+def _write_folder_images(stub, folder: str, count: int):
+    # 本地导入场景的图片与群图片使用相同的生成方式，每个文件内容不同
+    os.makedirs(folder, exist_ok=True)
+    for index in range(count):
+        with open(os.path.join(folder, f"local_{index:06d}.png"), "wb") as f:
+            f.write(stub.image_bytes(f"local-{index}"))
+
+
+def run_scenario(args, scenario: str, napcat, llm) -> Dict[str, Any]:
+    """
+    准备工作目录并在子进程中运行场景
+
+    Args:
+        args: 命令行参数
+        scenario: 场景名称
+        napcat: 模拟 NapCat 服务
+        llm: 模拟大模型服务
+
+    Returns:
+        Dict[str, Any]: 场景结果，附加模拟服务的请求统计
+    """
+    workdir = tempfile.mkdtemp(prefix=f"picture_sniffer_bench_{scenario}_", dir=args.workdir)
+    config = {
+        "napcat_base_url": napcat.url,
+        "napcat_ws_uri": napcat.ws_url,
+        "napcat_token": "bench",
+        "openai_token": "bench",
+        "openai_base_url": llm.url,
+        "db_path": "picture_sniffer.db",
+        "log_file": "logs/picture_sniffer.log",
+        "log_level": "WARNING",
+        "webui_token": "bench",
+        # 基准测试期间不输出周期摘要，结束时统一汇总
+        "metrics_interval": 86400,
+        # 模拟服务推送完消息后关闭连接，ws 场景随之结束，不重连
+        "ws_reconnect": False
+    }
+    config.update(args.set)
+    with open(os.path.join(workdir, "config.json"), "w", encoding="utf-8") as f:
+        json.dump(config, f, ensure_ascii=False, indent=2)
+
+    folder = os.path.join(workdir, "import")
+    if scenario == "folder":
+        _write_folder_images(napcat, folder, args.folder_images)
+
+    llm_before = dict(llm.counts)
+    command = [
+        sys.executable, "-m", "benchmark.run",
+        "--child", scenario, "--child-workdir", workdir, "--child-folder", folder,
+        "--workers", str(args.workers)
+    ]
+    log_path = os.path.join(workdir, "benchmark.log")
+    with open(log_path, "w", encoding="utf-8") as log_file:
+        completed = subprocess.run(command, cwd=REPO_DIR, stdout=subprocess.PIPE, stderr=log_file, text=True)
+    if completed.returncode != 0 or not completed.stdout.strip():
+        return {"scenario": scenario, "error": f"子进程退出码 {completed.returncode}，日志: {log_path}"}
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    result["llm_requests"] = {key: llm.counts[key] - llm_before.get(key, 0) for key in llm.counts}
+    result["workdir"] = workdir
+    return result
+
+
+def _format_seconds(value: Optional[float]) -> str:
+    return "-" if value is None else f"{value:.3f}"
+
+
+def print_report(results: List[Dict[str, Any]]):
+    header = f"{'场景':<10}{'图片':>8}{'失败':>6}{'耗时(s)':>10}{'图片/s':>10}{'p50(s)':>10}{'p95(s)':>10}{'峰值RSS(MB)':>14}"
+    print(header)
+    print("-" * len(header))
+    for result in results:
+        if "images" not in result:
+            print(f"{result['scenario']:<10}失败: {result.get('error')}")
+            continue
+        rss = max(result["peak_rss_mb"], result["children_peak_rss_mb"])
+        print(
+            f"{result['scenario']:<10}{result['images']:>8}{result['errors']:>6}{result['seconds']:>10.2f}"
+            f"{result['images_per_sec']:>10.2f}{_format_seconds(result['image_p50_seconds']):>10}"
+            f"{_format_seconds(result['image_p95_seconds']):>10}{rss:>14.1f}"
+        )
+        print(f"{'':<10}结果: {result['results']}，大模型请求: {result['llm_requests']}")
+        if result.get("error"):
+            print(f"{'':<10}异常: {result['error']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Picture Sniffer 端到端性能基准测试（使用本地模拟的 NapCat 与大模型接口）")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="逗号分隔: backfill（群历史回填）、folder（本地导入）、ws（WebSocket实时消息）")
+    parser.add_argument("--groups", type=int, default=5, help="群数量")
+    parser.add_argument("--messages-per-group", type=int, default=100, help="每个群的历史消息数量（首次运行每群读取最近100条）")
+    parser.add_argument("--image-ratio", type=float, default=0.5, help="包含图片的消息比例")
+    parser.add_argument("--image-size", type=int, default=256, help="模拟图片的边长（像素）")
+    parser.add_argument("--folder-images", type=int, default=200, help="本地导入场景的图片数量")
+    parser.add_argument("--ws-messages", type=int, default=50, help="WebSocket 场景推送的图片消息数量")
+    parser.add_argument("--ws-rate", type=float, default=0, help="WebSocket 每秒推送的消息数，0表示不限速")
+    parser.add_argument("--napcat-latency-ms", type=float, default=30, help="NapCat 接口与图片下载的延迟")
+    parser.add_argument("--llm-latency-ms", type=float, default=800, help="大模型接口的延迟")
+    parser.add_argument("--llm-jitter-ms", type=float, default=200, help="大模型接口延迟的随机波动")
+    parser.add_argument("--llm-error-rate", type=float, default=0.0, help="大模型接口返回500的比例")
+    parser.add_argument("--llm-429-rate", type=float, default=0.0, help="大模型接口返回429的比例")
+    parser.add_argument("--mc-ratio", type=float, default=0.7, help="分类结果为MC图片的比例")
+    parser.add_argument("--workers", type=int, default=1, help="backfill 场景的工作进程数（main.py --workers）")
+    parser.add_argument("--set", action="append", default=[], metavar="KEY=VALUE", help="覆盖配置项，值按JSON解析，例如 --set speculative_download=true")
+    parser.add_argument("--seed", type=int, default=0, help="随机数种子")
+    parser.add_argument("--workdir", default=None, help="工作目录的父目录，默认为系统临时目录")
+    parser.add_argument("--json", dest="json_path", help="将结果写入JSON文件，便于与之前的结果对比")
+    parser.add_argument("--child", choices=SCENARIOS, help=argparse.SUPPRESS)
+    parser.add_argument("--child-workdir", help=argparse.SUPPRESS)
+    parser.add_argument("--child-folder", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        result = run_child(args.child, args.child_workdir, args.workers, args.child_folder)
+        print(json.dumps(result, ensure_ascii=False))
+        return
+
+    args.set = dict(
+        (key, _parse_value(value)) for key, value in (item.split("=", 1) for item in args.set)
+    )
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"未知场景: {', '.join(sorted(unknown))}")
+
+    sys.path.insert(0, REPO_DIR)
+    from .stub_llm import StubLLM
+    from .stub_napcat import StubNapCat
+    napcat = StubNapCat(
+        groups=args.groups,
+        messages_per_group=args.messages_per_group,
+        image_ratio=args.image_ratio,
+        image_size=args.image_size,
+        latency_ms=args.napcat_latency_ms,
+        jitter_ms=args.napcat_latency_ms / 3,
+        ws_messages=args.ws_messages,
+        ws_rate=args.ws_rate,
+        seed=args.seed
+    ).start()
+    llm = StubLLM(
+        latency_ms=args.llm_latency_ms,
+        jitter_ms=args.llm_jitter_ms,
+        error_rate=args.llm_error_rate,
+        rate_limit_rate=args.llm_429_rate,
+        mc_ratio=args.mc_ratio,
+        seed=args.seed
+    ).start()
+
+    results = []
+    try:
+        for scenario in scenarios:
+            print(f"运行场景: {scenario} ...", file=sys.stderr)
+            results.append(run_scenario(args, scenario, napcat, llm))
+    finally:
+        napcat.stop()
+        llm.stop()
+
+    print_report(results)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump({"args": {key: value for key, value in vars(args).items() if not key.startswith("child")}, "results": results}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+import argparse
+import http.client
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 入口模块及导入时不应加载的重量级依赖，这些依赖只在真正用到时才导入
+IMPORT_BUDGETS = {
+    "functions": ["requests", "PIL", "tqdm"],
+    "functions.logger_config": ["requests", "PIL", "tqdm"],
+    "functions.database": ["requests", "PIL", "tqdm"],
+    "functions.labels": ["requests", "PIL", "tqdm"],
+    "server": ["requests", "PIL", "tqdm"],
+    "main": ["requests", "PIL", "tqdm", "multiprocessing"],
+    "ws_server": ["requests", "PIL", "tqdm", "multiprocessing"],
+}
+
+
+def import_report(module: str, cwd: str) -> Dict[str, object]:
+    """
+    使用 python -X importtime 在新进程中导入模块，统计导入耗时和加载的模块
+
+    Args:
+        module: 模块名
+        cwd: 子进程的工作目录（server.py 在导入时读取 config.json 并打开数据库）
+
+    Returns:
+        Dict[str, object]: total_ms 为导入总耗时，modules 为加载的全部模块名，
+            top 为累计耗时最长的模块列表 [(模块名, 毫秒)]，error 为导入失败时的错误输出
+    """
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [REPO_DIR, os.environ.get("PYTHONPATH")])))
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=cwd,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True
+    )
+    modules: List[str] = []
+    cumulative: List[Tuple[str, float]] = []
+    other_lines: List[str] = []
+    total_us = 0
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:"):
+            other_lines.append(line)
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+        self_us, cumulative_us, name = int(fields[0]), int(fields[1]), fields[2]
+        total_us += self_us
+        modules.append(name.strip())
+        cumulative.append((name.strip(), cumulative_us / 1000))
+    cumulative.sort(key=lambda item: item[1], reverse=True)
+    return {
+        "module": module,
+        "total_ms": round(total_us / 1000, 1),
+        "modules": modules,
+        "top": [(name, round(ms, 1)) for name, ms in cumulative[:10]],
+        "error": "\n".join(other_lines[-5:]) if completed.returncode else None
+    }
+
+
+def check_budgets(reports: List[Dict[str, object]]) -> List[str]:
+    """
+    检查各入口模块是否在导入时加载了不应加载的依赖
+
+    Returns:
+        List[str]: 违反约束的说明，为空表示全部通过
+    """
+    violations = []
+    for report in reports:
+        loaded = {name.split(".")[0] for name in report["modules"]}
+        for forbidden in IMPORT_BUDGETS.get(report["module"], []):
+            if forbidden in loaded:
+                violations.append(f"导入 {report['module']} 时加载了 {forbidden}")
+    return violations
+
+
+def time_first_request(directory: str, url: str, token: str, timeout: float = 600) -> Optional[float]:
+    """
+    在数据目录中启动 server.py，测量从启动进程到第一个接口请求成功返回的时间
+
+    Returns:
+        Optional[float]: 秒数，超时返回None
+    """
+    parts = urlsplit(url)
+    host, port = parts.hostname or "127.0.0.1", parts.port or 80
+    start = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(REPO_DIR, "server.py")],
+        cwd=directory,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    try:
+        while time.perf_counter() - start < timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f"server.py 启动失败，退出码 {process.returncode}")
+            try:
+                conn = http.client.HTTPConnection(host, port, timeout=5)
+                conn.request("GET", "/api/categories", headers={"Authorization": f"Bearer {token}"})
+                response = conn.getresponse()
+                response.read()
+                conn.close()
+                if response.status == 200:
+                    return time.perf_counter() - start
+            except OSError:
+                time.sleep(0.05)
+        return None
+    finally:
+        process.terminate()
+        process.wait()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="统计各入口模块的导入耗时，并检查导入时是否加载了不应加载的依赖")
+    parser.add_argument("--modules", nargs="+", default=list(IMPORT_BUDGETS), help="要统计的模块")
+    parser.add_argument("--top", type=int, default=5, help="每个模块输出累计耗时最长的前几个依赖")
+    parser.add_argument("--server", metavar="DIRECTORY", help="同时在该数据目录中启动 server.py，测量到第一个请求返回的时间")
+    parser.add_argument("--url", default="http://127.0.0.1:5000", help="--server 时的服务器地址")
+    parser.add_argument("--token", default="bench", help="--server 时的 webui_token")
+    parser.add_argument("--json", dest="json_path", help="将结果写入JSON文件")
+    args = parser.parse_args()
+
+    reports = []
+    with tempfile.TemporaryDirectory(prefix="startup-") as workdir:
+        # server.py 导入时读取工作目录中的 config.json
+        from .gen_dataset import write_server_config
+        write_server_config(workdir, args.token)
+        for module in args.modules:
+            report = import_report(module, workdir)
+            reports.append(report)
+            if report["error"]:
+                print(f"{module}: 导入失败\n{report['error']}")
+                continue
+            print(f"{module}: {report['total_ms']} ms，加载 {len(report['modules'])} 个模块")
+            for name, ms in [item for item in report["top"] if item[0] != module][:args.top]:
+                print(f"    {name:<40}{ms:>10} ms")
+
+    result = {"imports": [{key: value for key, value in report.items() if key != "modules"} for report in reports]}
+    if args.server:
+        seconds = time_first_request(args.server, args.url, args.token)
+        result["server_first_request_seconds"] = round(seconds, 2) if seconds is not None else None
+        print(f"server.py 启动到第一个请求返回: {seconds:.2f} 秒" if seconds is not None else "server.py 启动超时")
+
+    violations = check_budgets([report for report in reports if not report["error"]])
+    result["violations"] = violations
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    for violation in violations:
+        print(f"检查未通过: {violation}")
+    failed = bool(violations) or any(report["error"] for report in reports)
+    sys.exit(1 if failed else 0)
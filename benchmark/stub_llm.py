@@ -0,0 +1,108 @@
+import argparse
+import json
+import time
+from functions.labels import CATEGORIES
+from .stub_server import StubHandler, StubServer
+
+
+class _LLMHandler(StubHandler):
+    def do_POST(self):
+        stub: StubLLM = self.server.stub
+        request = self.read_json()
+        stub.delay()
+
+        roll = stub.uniform()
+        if roll < stub.rate_limit_rate:
+            stub.count("rate_limited")
+            self.send_response(429)
+            self.send_header("Retry-After", "1")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if roll < stub.rate_limit_rate + stub.error_rate:
+            stub.count("errors")
+            self.send_json({"error": {"message": "stub internal error"}}, status=500)
+            return
+
+        messages = request.get("messages") or [{}]
+        system_prompt = str(messages[0].get("content", ""))
+        if "is_mc_pic" in system_prompt:
+            stub.count("classify")
+            is_mc_pic = stub.uniform() < stub.mc_ratio
+            category = CATEGORIES[int(stub.uniform() * len(CATEGORIES))]
+            content = json.dumps({
+                "is_mc_pic": is_mc_pic,
+                "category": category if is_mc_pic else "其他",
+                "description": f"模拟的{category}截图，用于性能测试" if is_mc_pic else "与MC无关的图片"
+            }, ensure_ascii=False)
+        else:
+            stub.count("describe")
+            content = "这是一张用于性能测试的模拟图片描述。" * 8
+
+        self.send_json({
+            "id": f"stub-{time.time_ns()}",
+            "model": request.get("model", "stub"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 1200, "completion_tokens": len(content), "total_tokens": 1200 + len(content)}
+        })
+
+
+class StubLLM(StubServer):
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        latency_ms: float = 800,
+        jitter_ms: float = 200,
+        error_rate: float = 0.0,
+        rate_limit_rate: float = 0.0,
+        mc_ratio: float = 0.7,
+        seed: int = 0
+    ):
+        """
+        模拟的 chat/completions 接口：按配置的延迟返回分类结果或细化描述，并按比例返回500和429
+
+        Args:
+            host: 监听地址
+            port: 监听端口，0表示随机端口
+            latency_ms: 每个请求的基础延迟（毫秒）
+            jitter_ms: 延迟的随机波动范围（毫秒）
+            error_rate: 返回500的比例
+            rate_limit_rate: 返回429的比例
+            mc_ratio: 分类结果为MC图片的比例
+            seed: 随机数种子
+        """
+        super().__init__(_LLMHandler, host, port, latency_ms, jitter_ms, seed)
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.mc_ratio = mc_ratio
+        self.counts = {"classify": 0, "describe": 0, "errors": 0, "rate_limited": 0}
+
+    @property
+    def url(self) -> str:
+        return f"{super().url}/api/paas/v4/chat/completions"
+
+    def count(self, key: str):
+        with self._random_lock:
+            self.counts[key] += 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="模拟的大模型接口")
+    parser.add_argument("--port", type=int, default=6120)
+    parser.add_argument("--latency-ms", type=float, default=800)
+    parser.add_argument("--jitter-ms", type=float, default=200)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0)
+    parser.add_argument("--mc-ratio", type=float, default=0.7)
+    args = parser.parse_args()
+    server = StubLLM(
+        port=args.port,
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        mc_ratio=args.mc_ratio
+    )
+    print(f"模拟大模型接口: {server.url}")
+    server.httpd.serve_forever()
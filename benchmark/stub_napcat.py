@@ -0,0 +1,357 @@
+import argparse
+import base64
+import hashlib
+import json
+import random
+import socket
+import socketserver
+import struct
+import threading
+import time
+import zlib
+from typing import Any, Dict, List, Optional
+from urllib.parse import urlparse
+from .stub_server import StubHandler, StubServer
+
+# 消息ID = 群序号 * MESSAGE_ID_STRIDE + 群内序号，同时作为 message_seq
+MESSAGE_ID_STRIDE = 10_000_000
+GROUP_ID_BASE = 100000
+# WebSocket 推送的消息属于单独的群，避免与历史消息的ID冲突
+WS_GROUP_INDEX = 999
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+
+
+def _png_chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack("!I", len(data)) + kind + data + struct.pack("!I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+
+def make_png(width: int, height: int, seed: int = 0) -> bytes:
+    """
+    生成渐变加噪点的RGB PNG图片，不依赖Pillow
+
+    Args:
+        width: 宽度
+        height: 高度
+        seed: 随机数种子
+
+    Returns:
+        bytes: PNG文件内容
+    """
+    rng = random.Random(seed)
+    noise = rng.getrandbits(8 * width * height).to_bytes(width * height, "little")
+    rows = []
+    for y in range(height):
+        row = bytearray(1 + width * 3)
+        for x in range(width):
+            n = noise[y * width + x] >> 2
+            offset = 1 + x * 3
+            row[offset] = (x * 255 // max(1, width - 1) + n) & 0xFF
+            row[offset + 1] = (y * 255 // max(1, height - 1) + n) & 0xFF
+            row[offset + 2] = (128 + n) & 0xFF
+        rows.append(bytes(row))
+    header = struct.pack("!IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + _png_chunk(b"IHDR", header)
+        + _png_chunk(b"IDAT", zlib.compress(b"".join(rows), 6))
+        + _png_chunk(b"IEND", b"")
+    )
+
+
+class _NapCatHandler(StubHandler):
+    def do_POST(self):
+        stub: StubNapCat = self.server.stub
+        action = urlparse(self.path).path.strip("/")
+        payload = self.read_json()
+        stub.delay()
+        if action == "get_group_list":
+            self.send_json({"status": "ok", "retcode": 0, "data": stub.group_list()})
+        elif action == "get_group_msg_history":
+            messages = stub.history(int(payload.get("group_id", 0)), payload.get("message_seq"), int(payload.get("count", 20)))
+            self.send_json({"status": "ok", "retcode": 0, "data": {"messages": messages}})
+        elif action == "get_msg":
+            message = stub.message(int(payload.get("message_id", 0)))
+            self.send_json({"status": "ok", "retcode": 0, "data": message or {}})
+        else:
+            self.send_json({"status": "failed", "retcode": 404, "message": f"unknown action {action}"}, status=404)
+
+    def do_GET(self):
+        stub: StubNapCat = self.server.stub
+        path = urlparse(self.path).path
+        if not path.startswith("/image/"):
+            self.send_bytes(404, b"not found", "text/plain")
+            return
+        stub.delay()
+        message_id = path.rsplit("/", 1)[-1].split(".", 1)[0]
+        self.send_bytes(200, stub.image_bytes(message_id), "image/png")
+
+
+class _WebSocketHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        stub: StubNapCat = self.server.stub
+        sock: socket.socket = self.request
+        if not self._handshake(sock):
+            return
+        send_lock = threading.Lock()
+        closed = threading.Event()
+        reader = threading.Thread(target=self._read_frames, args=(sock, send_lock, closed), daemon=True)
+        reader.start()
+
+        interval = 1 / stub.ws_rate if stub.ws_rate > 0 else 0
+        for seq in range(1, stub.ws_messages + 1):
+            if closed.is_set():
+                return
+            event = stub.build_message(WS_GROUP_INDEX, seq, force_image=True)
+            event.update({"post_type": "message", "message_type": "group", "self_id": 10000})
+            with send_lock:
+                sock.sendall(self._frame(0x1, json.dumps(event, ensure_ascii=False).encode("utf-8")))
+            if interval:
+                time.sleep(interval)
+
+        # 推送完成后关闭连接，等待客户端处理完已收到的消息并回复关闭帧
+        with send_lock:
+            sock.sendall(self._frame(0x8, struct.pack("!H", 1000)))
+        closed.wait(stub.ws_close_timeout)
+
+    @staticmethod
+    def _handshake(sock: socket.socket) -> bool:
+        data = b""
+        while b"\r\n\r\n" not in data:
+            chunk = sock.recv(4096)
+            if not chunk:
+                return False
+            data += chunk
+        headers = {}
+        for line in data.split(b"\r\n")[1:]:
+            if b":" in line:
+                key, value = line.split(b":", 1)
+                headers[key.strip().lower()] = value.strip()
+        key = headers.get(b"sec-websocket-key")
+        if not key:
+            sock.sendall(b"HTTP/1.1 400 Bad Request\r\nContent-Length: 0\r\n\r\n")
+            return False
+        accept = base64.b64encode(hashlib.sha1(key + WS_GUID.encode()).digest()).decode()
+        sock.sendall(
+            "HTTP/1.1 101 Switching Protocols\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            f"Sec-WebSocket-Accept: {accept}\r\n\r\n".encode()
+        )
+        return True
+
+    @staticmethod
+    def _frame(opcode: int, payload: bytes) -> bytes:
+        length = len(payload)
+        if length < 126:
+            header = struct.pack("!BB", 0x80 | opcode, length)
+        elif length < 65536:
+            header = struct.pack("!BBH", 0x80 | opcode, 126, length)
+        else:
+            header = struct.pack("!BBQ", 0x80 | opcode, 127, length)
+        return header + payload
+
+    @staticmethod
+    def _recv_exact(sock: socket.socket, size: int) -> Optional[bytes]:
+        data = b""
+        while len(data) < size:
+            chunk = sock.recv(size - len(data))
+            if not chunk:
+                return None
+            data += chunk
+        return data
+
+    def _read_frames(self, sock: socket.socket, send_lock: threading.Lock, closed: threading.Event):
+        # 客户端发来的帧：回复ping，收到关闭帧或连接断开时结束
+        try:
+            while True:
+                header = self._recv_exact(sock, 2)
+                if header is None:
+                    break
+                opcode = header[0] & 0x0F
+                length = header[1] & 0x7F
+                if length == 126:
+                    length = struct.unpack("!H", self._recv_exact(sock, 2))[0]
+                elif length == 127:
+                    length = struct.unpack("!Q", self._recv_exact(sock, 8))[0]
+                mask = self._recv_exact(sock, 4) if header[1] & 0x80 else b"\0\0\0\0"
+                payload = bytes(b ^ mask[i % 4] for i, b in enumerate(self._recv_exact(sock, length) or b""))
+                if opcode == 0x8:
+                    break
+                if opcode == 0x9:
+                    with send_lock:
+                        sock.sendall(self._frame(0xA, payload))
+        except (OSError, TypeError, struct.error):
+            pass
+        finally:
+            closed.set()
+
+
+class StubNapCat(StubServer):
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        ws_port: int = 0,
+        groups: int = 5,
+        messages_per_group: int = 100,
+        image_ratio: float = 0.5,
+        image_size: int = 256,
+        image_variants: int = 8,
+        latency_ms: float = 30,
+        jitter_ms: float = 10,
+        ws_messages: int = 100,
+        ws_rate: float = 0,
+        ws_close_timeout: float = 600,
+        seed: int = 0
+    ):
+        """
+        模拟的 NapCat HTTP 与 WebSocket 服务：生成合成的群列表、群历史消息和图片URL
+
+        每张图片的内容唯一（同一批基础图片加上不同的PNG文本块），不会被MD5去重。
+
+        Args:
+            host: 监听地址
+            port: HTTP端口，0表示随机端口
+            ws_port: WebSocket端口，0表示随机端口
+            groups: 群数量
+            messages_per_group: 每个群的历史消息数量
+            image_ratio: 包含图片的消息比例
+            image_size: 图片边长（像素）
+            image_variants: 预先生成的基础图片数量
+            latency_ms: HTTP请求（接口与图片下载）的基础延迟（毫秒）
+            jitter_ms: 延迟的随机波动范围（毫秒）
+            ws_messages: 每个WebSocket连接推送的图片消息数量
+            ws_rate: WebSocket每秒推送的消息数，0表示不限速
+            ws_close_timeout: 推送完成后等待客户端关闭连接的时间（秒）
+            seed: 随机数种子
+        """
+        super().__init__(_NapCatHandler, host, port, latency_ms, jitter_ms, seed)
+        self.groups = groups
+        self.messages_per_group = messages_per_group
+        self.image_ratio = image_ratio
+        self.ws_messages = ws_messages
+        self.ws_rate = ws_rate
+        self.ws_close_timeout = ws_close_timeout
+        self.seed = seed
+        self._base_images = [make_png(image_size, image_size, seed + index) for index in range(max(1, image_variants))]
+
+        self.ws_server = socketserver.ThreadingTCPServer((host, ws_port), _WebSocketHandler)
+        self.ws_server.daemon_threads = True
+        self.ws_server.stub = self
+        self._ws_thread: Optional[threading.Thread] = None
+
+    @property
+    def ws_url(self) -> str:
+        host, port = self.ws_server.server_address[:2]
+        return f"ws://{host}:{port}/"
+
+    @property
+    def expected_images(self) -> int:
+        """
+        首次运行时 PictureSniffer.run 会读取的图片数量（每个群最近100条消息）
+        """
+        return sum(
+            1
+            for group_index in range(self.groups)
+            for seq in range(max(1, self.messages_per_group - 99), self.messages_per_group + 1)
+            if self._has_image(group_index, seq)
+        )
+
+    def start(self):
+        super().start()
+        self._ws_thread = threading.Thread(target=self.ws_server.serve_forever, name="StubNapCatWS", daemon=True)
+        self._ws_thread.start()
+        return self
+
+    def stop(self):
+        self.ws_server.shutdown()
+        self.ws_server.server_close()
+        super().stop()
+
+    def group_list(self) -> List[Dict[str, Any]]:
+        return [
+            {"group_id": GROUP_ID_BASE + index, "group_name": f"测试群{index}", "member_count": 100}
+            for index in range(self.groups)
+        ]
+
+    def _has_image(self, group_index: int, seq: int) -> bool:
+        return random.Random(f"{self.seed}-{group_index}-{seq}").random() < self.image_ratio
+
+    def build_message(self, group_index: int, seq: int, force_image: bool = False) -> Dict[str, Any]:
+        message_id = group_index * MESSAGE_ID_STRIDE + seq
+        if force_image or self._has_image(group_index, seq):
+            host, port = self.address
+            segment = {
+                "type": "image",
+                "data": {
+                    "file": f"{message_id}.png",
+                    "url": f"http://{host}:{port}/image/{group_index}/{message_id}.png"
+                }
+            }
+        else:
+            segment = {"type": "text", "data": {"text": f"消息 {seq}"}}
+        return {
+            "message_id": message_id,
+            "message_seq": message_id,
+            "group_id": GROUP_ID_BASE + group_index,
+            "time": 1700000000 + seq * 60,
+            "sender": {"user_id": 20000 + seq % 50, "nickname": f"用户{seq % 50}"},
+            "message": [segment]
+        }
+
+    def history(self, group_id: int, message_seq: Optional[Any], count: int) -> List[Dict[str, Any]]:
+        """
+        按 NapCat 的 get_group_msg_history 语义返回 message_seq 及之前的count条消息（时间正序）
+        """
+        group_index = group_id - GROUP_ID_BASE
+        if not 0 <= group_index < self.groups:
+            return []
+        end = self.messages_per_group
+        if message_seq:
+            end = min(end, int(message_seq) - group_index * MESSAGE_ID_STRIDE)
+        start = max(1, end - count + 1)
+        return [self.build_message(group_index, seq) for seq in range(start, end + 1)]
+
+    def message(self, message_id: int) -> Optional[Dict[str, Any]]:
+        group_index, seq = divmod(message_id, MESSAGE_ID_STRIDE)
+        if seq <= 0:
+            return None
+        return self.build_message(group_index, seq, force_image=group_index == WS_GROUP_INDEX)
+
+    def image_bytes(self, message_id: str) -> bytes:
+        """
+        图片内容：基础图片加上包含消息ID的tEXt块，每条消息的图片MD5不同
+        """
+        base = self._base_images[zlib.crc32(message_id.encode()) % len(self._base_images)]
+        text = _png_chunk(b"tEXt", b"Comment\0" + message_id.encode())
+        # 插入到IEND之前
+        return base[:-12] + text + base[-12:]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="模拟的 NapCat HTTP/WebSocket 服务")
+    parser.add_argument("--port", type=int, default=6111)
+    parser.add_argument("--ws-port", type=int, default=6112)
+    parser.add_argument("--groups", type=int, default=5)
+    parser.add_argument("--messages-per-group", type=int, default=100)
+    parser.add_argument("--image-ratio", type=float, default=0.5)
+    parser.add_argument("--latency-ms", type=float, default=30)
+    parser.add_argument("--ws-messages", type=int, default=100)
+    parser.add_argument("--ws-rate", type=float, default=1)
+    args = parser.parse_args()
+    server = StubNapCat(
+        port=args.port,
+        ws_port=args.ws_port,
+        groups=args.groups,
+        messages_per_group=args.messages_per_group,
+        image_ratio=args.image_ratio,
+        latency_ms=args.latency_ms,
+        ws_messages=args.ws_messages,
+        ws_rate=args.ws_rate
+    ).start()
+    print(f"模拟 NapCat: {server.url}，WebSocket: {server.ws_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
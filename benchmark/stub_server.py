@@ -0,0 +1,90 @@
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Tuple
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # 使用HTTP/1.1保持连接，与requests的连接池行为一致
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        # 不输出每个请求的访问日志
+        pass
+
+    def read_json(self) -> Dict[str, Any]:
+        length = int(self.headers.get("Content-Length") or 0)
+        if not length:
+            return {}
+        try:
+            return json.loads(self.rfile.read(length))
+        except ValueError:
+            return {}
+
+    def send_bytes(self, status: int, body: bytes, content_type: str):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_json(self, data: Any, status: int = 200):
+        self.send_bytes(status, json.dumps(data, ensure_ascii=False).encode("utf-8"), "application/json")
+
+
+class StubServer:
+    def __init__(self, handler_class, host: str = "127.0.0.1", port: int = 0, latency_ms: float = 0, jitter_ms: float = 0, seed: int = 0):
+        """
+        在后台线程中运行的HTTP模拟服务，每个请求按配置的延迟响应
+
+        Args:
+            handler_class: 请求处理类，通过 self.server.stub 访问本对象
+            host: 监听地址
+            port: 监听端口，0表示随机端口
+            latency_ms: 每个请求的基础延迟（毫秒）
+            jitter_ms: 延迟的随机波动范围（毫秒）
+            seed: 随机数种子，保证多次运行的结果可复现
+        """
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.random = random.Random(seed)
+        self._random_lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), handler_class)
+        self.httpd.daemon_threads = True
+        self.httpd.stub = self
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def address(self) -> Tuple[str, int]:
+        return self.httpd.server_address[:2]
+
+    @property
+    def url(self) -> str:
+        host, port = self.address
+        return f"http://{host}:{port}"
+
+    def uniform(self) -> float:
+        with self._random_lock:
+            return self.random.random()
+
+    def delay(self):
+        """
+        按配置的延迟阻塞当前请求线程
+        """
+        latency = self.latency_ms + (self.uniform() * 2 - 1) * self.jitter_ms
+        if latency > 0:
+            time.sleep(latency / 1000)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name=type(self).__name__, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
@@ -1,23 +1,57 @@
-from .database import DatabaseManager
-from .data_fetcher import DataFetcher
-from .image_analyzer import ImageAnalyzer
-from .data_storage import DataStorage
-from .config_loader import load_config
-from .logger_config import setup_logger
-from .cache import compress_to_webp
-from .make_cache import generate_cache
-from .zip import compress_two_folders
+import importlib
 
+# 按需导入子模块：访问 functions.DatabaseManager 等属性时才导入对应模块，
+# 只用到日志、数据库等轻量模块的程序不会因此导入 requests、Pillow 和 tqdm
+_EXPORTS = {
+    'DatabaseManager': '.database',
+    'DataFetcher': '.data_fetcher',
+    'ImageAnalyzer': '.image_analyzer',
+    'DataStorage': '.data_storage',
+    'JobQueue': '.job_queue',
+    'ImagePipeline': '.pipeline',
+    'PipelineStage': '.pipeline',
+    'PrefetchArea': '.prefetch',
+    'WriteBatcher': '.write_batcher',
+    'DescribeJobManager': '.describe_jobs',
+    'Relabeler': '.relabel',
+    'FolderWatcher': '.folder_watcher',
+    'GroupScheduler': '.group_scheduler',
+    'ImageEventBroadcaster': '.image_events',
+    'ThumbnailPack': '.thumbnail_pack',
+    'Metrics': '.metrics',
+    'MetricsReporter': '.metrics',
+    'BlobStorage': '.blob_storage',
+    'LocalBlobStorage': '.blob_storage',
+    'S3BlobStorage': '.blob_storage',
+    'PackedThumbnailStorage': '.blob_storage',
+    'create_blob_storage': '.blob_storage',
+    'create_thumbnail_pack': '.blob_storage',
+    'migrate_to_sharded': '.blob_storage',
+    'load_config': '.config_loader',
+    'setup_logger': '.logger_config',
+    'configure_logging': '.logger_config',
+    'configure_logging_from_config': '.logger_config',
+    'forward_logs': '.logger_config',
+    'compress_to_webp': '.cache',
+    'compress_to_webp_bytes': '.cache',
+    'generate_cache': '.make_cache',
+    'generate_packed_cache': '.make_cache',
+    'compress_two_folders': '.zip',
+}
 
 
-__all__ = [
-    'DatabaseManager',
-    'DataFetcher',
-    'ImageAnalyzer',
-    'DataStorage',
-    'load_config',
-    'setup_logger',
-    'compress_to_webp',
-    'generate_cache',
-    'compress_two_folders',
-    ]
+def __getattr__(name: str):
+    module_name = _EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(module_name, __name__), name)
+    # 缓存到模块字典中，之后的访问不再经过 __getattr__
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_EXPORTS))
+
+
+__all__ = list(_EXPORTS)
@@ -0,0 +1,507 @@
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+from contextlib import contextmanager
+from typing import Iterator, Optional
+from .logger_config import setup_logger
+
+# 存储键的前缀：原图与缩略图。存储键即数据库中的image_path（相对路径）
+PICTURES_PREFIX = "pictures"
+CACHE_PREFIX = "cache"
+
+_SHARDED_NAME = re.compile(r"^([0-9a-f]{32})\.[A-Za-z0-9]+$")
+
+
+def sharded_key(prefix: str, md5: str, ext: str) -> str:
+    """
+    生成按内容哈希分片的存储键，例如 pictures/ab/cd/abcd....jpg，避免单个目录中文件过多
+
+    Args:
+        prefix: 键前缀（pictures 或 cache）
+        md5: 文件内容MD5
+        ext: 扩展名（带点）
+
+    Returns:
+        str: 存储键
+    """
+    return f"{prefix}/{md5[:2]}/{md5[2:4]}/{md5}{ext.lower()}"
+
+
+def md5_from_key(key: str) -> Optional[str]:
+    """
+    从分片存储键中取出内容MD5
+
+    Args:
+        key: 存储键
+
+    Returns:
+        Optional[str]: MD5，旧的平铺路径返回None
+    """
+    match = _SHARDED_NAME.match(os.path.basename(key.replace("\\", "/")))
+    return match.group(1) if match else None
+
+
+def normalize_key(key: str) -> str:
+    """
+    将数据库中的路径（可能带有 ./ 前缀或Windows分隔符）规范化为存储键
+
+    Args:
+        key: 路径或存储键
+
+    Returns:
+        str: 存储键
+    """
+    key = key.replace("\\", "/")
+    while key.startswith("./"):
+        key = key[2:]
+    return key.lstrip("/")
+
+
+def thumbnail_key(image_key: str) -> str:
+    """
+    由原图存储键得到缩略图存储键：pictures/ab/cd/x.jpg -> cache/ab/cd/x.webp，旧的平铺路径映射到 cache/x.webp
+
+    Args:
+        image_key: 原图存储键
+
+    Returns:
+        str: 缩略图存储键
+    """
+    key = normalize_key(image_key)
+    if key.startswith(PICTURES_PREFIX + "/") and md5_from_key(key):
+        relative = key[len(PICTURES_PREFIX) + 1:]
+    else:
+        relative = os.path.basename(key)
+    return f"{CACHE_PREFIX}/{os.path.splitext(relative)[0]}.webp"
+
+
+class BlobStorage:
+    """
+    图片存储后端接口。键为 "/" 分隔的相对路径
+    """
+
+    def put_bytes(self, key: str, data: bytes):
+        raise NotImplementedError
+
+    def put_file(self, key: str, path: str, move: bool = False):
+        raise NotImplementedError
+
+    def get_bytes(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def exists(self, key: str) -> bool:
+        raise NotImplementedError
+
+    def delete(self, key: str):
+        raise NotImplementedError
+
+    def iter_keys(self, prefix: str) -> Iterator[str]:
+        raise NotImplementedError
+
+    def local_path(self, key: str) -> Optional[str]:
+        """
+        本地存储返回文件路径，远程存储返回None
+        """
+        return None
+
+    def url(self, key: str) -> Optional[str]:
+        """
+        远程存储返回可直接访问的URL，本地存储返回None（由Web服务器发送文件）
+        """
+        return None
+
+    @contextmanager
+    def open_local(self, key: str) -> Iterator[Optional[str]]:
+        """
+        获取可读的本地文件路径，远程存储会下载到临时文件并在退出时删除。对象不存在时得到None
+        """
+        data = self.get_bytes(key)
+        if data is None:
+            yield None
+            return
+        fd, path = tempfile.mkstemp(suffix=os.path.splitext(key)[1])
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            yield path
+        finally:
+            os.remove(path)
+
+    @contextmanager
+    def write_local(self, key: str) -> Iterator[str]:
+        """
+        获取可写的本地文件路径，正常退出且文件已写入时保存到key
+        """
+        fd, path = tempfile.mkstemp(suffix=os.path.splitext(key)[1])
+        os.close(fd)
+        try:
+            yield path
+            if os.path.getsize(path) > 0:
+                self.put_file(key, path, move=True)
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+class LocalBlobStorage(BlobStorage):
+    def __init__(self, root: str = "."):
+        """
+        初始化本地文件存储
+
+        Args:
+            root: 存储根目录，键为相对于该目录的路径
+        """
+        self.root = root
+
+    def local_path(self, key: str) -> str:
+        return os.path.join(self.root, *normalize_key(key).split("/"))
+
+    def put_bytes(self, key: str, data: bytes):
+        path = self.local_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 先写临时文件再替换，读取方不会看到写了一半的文件
+        with open(path + ".tmp", "wb") as f:
+            f.write(data)
+        os.replace(path + ".tmp", path)
+
+    def put_file(self, key: str, path: str, move: bool = False):
+        dest = self.local_path(key)
+        if os.path.abspath(dest) == os.path.abspath(path):
+            return
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        if move:
+            shutil.move(path, dest)
+        else:
+            shutil.copyfile(path, dest + ".tmp")
+            os.replace(dest + ".tmp", dest)
+
+    def get_bytes(self, key: str) -> Optional[bytes]:
+        try:
+            with open(self.local_path(key), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self.local_path(key))
+
+    def delete(self, key: str):
+        path = self.local_path(key)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def iter_keys(self, prefix: str) -> Iterator[str]:
+        pending_dirs = [self.local_path(prefix)]
+        while pending_dirs:
+            directory = pending_dirs.pop()
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            pending_dirs.append(entry.path)
+                        elif entry.is_file():
+                            yield os.path.relpath(entry.path, self.root).replace(os.sep, "/")
+            except FileNotFoundError:
+                continue
+
+    @contextmanager
+    def open_local(self, key: str) -> Iterator[Optional[str]]:
+        path = self.local_path(key)
+        yield path if os.path.exists(path) else None
+
+    @contextmanager
+    def write_local(self, key: str) -> Iterator[str]:
+        path = self.local_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        yield path
+
+
+class S3BlobStorage(BlobStorage):
+    def __init__(
+        self,
+        bucket: str,
+        prefix: str = "",
+        endpoint_url: Optional[str] = None,
+        access_key: Optional[str] = None,
+        secret_key: Optional[str] = None,
+        region: Optional[str] = None,
+        url_expires: int = 3600
+    ):
+        """
+        初始化S3兼容对象存储（AWS S3、MinIO等），需要安装 boto3
+
+        Args:
+            bucket: 存储桶名称
+            prefix: 对象键前缀
+            endpoint_url: 自定义端点，例如本地MinIO的 http://127.0.0.1:9000
+            access_key: 访问密钥ID，为空时使用boto3默认的凭证链
+            secret_key: 访问密钥
+            region: 区域
+            url_expires: 预签名URL的有效期（秒）
+        """
+        import boto3
+        from botocore.exceptions import ClientError
+        self._client_error = ClientError
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url,
+            aws_access_key_id=access_key,
+            aws_secret_access_key=secret_key,
+            region_name=region
+        )
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.url_expires = url_expires
+
+    def _object_key(self, key: str) -> str:
+        key = normalize_key(key)
+        return f"{self.prefix}/{key}" if self.prefix else key
+
+    def put_bytes(self, key: str, data: bytes):
+        self.client.put_object(Bucket=self.bucket, Key=self._object_key(key), Body=data)
+
+    def put_file(self, key: str, path: str, move: bool = False):
+        self.client.upload_file(path, self.bucket, self._object_key(key))
+        if move:
+            os.remove(path)
+
+    def get_bytes(self, key: str) -> Optional[bytes]:
+        try:
+            response = self.client.get_object(Bucket=self.bucket, Key=self._object_key(key))
+        except self._client_error as e:
+            if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+                return None
+            raise
+        return response["Body"].read()
+
+    def exists(self, key: str) -> bool:
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._object_key(key))
+            return True
+        except self._client_error as e:
+            if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404", "NotFound"):
+                return False
+            raise
+
+    def delete(self, key: str):
+        self.client.delete_object(Bucket=self.bucket, Key=self._object_key(key))
+
+    def iter_keys(self, prefix: str) -> Iterator[str]:
+        paginator = self.client.get_paginator("list_objects_v2")
+        strip = len(self.prefix) + 1 if self.prefix else 0
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self._object_key(prefix)):
+            for item in page.get("Contents", []):
+                yield item["Key"][strip:]
+
+    def url(self, key: str) -> str:
+        return self.client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": self.bucket, "Key": self._object_key(key)},
+            ExpiresIn=self.url_expires
+        )
+
+
+class PackedThumbnailStorage(BlobStorage):
+    def __init__(self, base: BlobStorage, pack):
+        """
+        缩略图（cache/ 键）保存在打包存储中，其余键交给原存储后端
+
+        Args:
+            base: 原图所在的存储后端
+            pack: 缩略图打包存储（ThumbnailPack）
+        """
+        self.base = base
+        self.pack = pack
+
+    @staticmethod
+    def _is_thumbnail(key: str) -> bool:
+        return normalize_key(key).startswith(CACHE_PREFIX + "/")
+
+    def put_bytes(self, key: str, data: bytes):
+        if self._is_thumbnail(key):
+            self.pack.put(normalize_key(key), data)
+        else:
+            self.base.put_bytes(key, data)
+
+    def put_file(self, key: str, path: str, move: bool = False):
+        if not self._is_thumbnail(key):
+            self.base.put_file(key, path, move=move)
+            return
+        with open(path, "rb") as f:
+            self.pack.put(normalize_key(key), f.read())
+        if move:
+            os.remove(path)
+
+    def get_bytes(self, key: str) -> Optional[bytes]:
+        if self._is_thumbnail(key):
+            return self.pack.get(normalize_key(key))
+        return self.base.get_bytes(key)
+
+    def exists(self, key: str) -> bool:
+        if self._is_thumbnail(key):
+            return self.pack.exists(normalize_key(key))
+        return self.base.exists(key)
+
+    def delete(self, key: str):
+        if self._is_thumbnail(key):
+            self.pack.delete(normalize_key(key))
+        else:
+            self.base.delete(key)
+
+    def iter_keys(self, prefix: str) -> Iterator[str]:
+        if self._is_thumbnail(prefix + "/"):
+            return self.pack.iter_keys(normalize_key(prefix))
+        return self.base.iter_keys(prefix)
+
+    def local_path(self, key: str) -> Optional[str]:
+        return None if self._is_thumbnail(key) else self.base.local_path(key)
+
+    def url(self, key: str) -> Optional[str]:
+        return None if self._is_thumbnail(key) else self.base.url(key)
+
+    @contextmanager
+    def open_local(self, key: str) -> Iterator[Optional[str]]:
+        if self._is_thumbnail(key):
+            with super().open_local(key) as path:
+                yield path
+        else:
+            with self.base.open_local(key) as path:
+                yield path
+
+
+def create_thumbnail_pack(config: dict, base_dir: str = "."):
+    """
+    根据配置创建缩略图打包存储
+
+    配置项：
+        thumbnail_pack_dir: 段文件和索引所在目录，默认为 storage_root 下的 cache.pack
+        thumbnail_pack_segment_mb: 单个段文件的大小上限（MB），默认64
+
+    Args:
+        config: 配置字典
+        base_dir: 相对路径的基准目录
+
+    Returns:
+        ThumbnailPack: 打包存储实例
+    """
+    from .thumbnail_pack import ThumbnailPack
+    directory = config.get("thumbnail_pack_dir") or os.path.join(config.get("storage_root", "."), "cache.pack")
+    return ThumbnailPack(
+        os.path.join(base_dir, directory),
+        segment_size=int(config.get("thumbnail_pack_segment_mb", 64) * 1024 * 1024)
+    )
+
+
+def create_blob_storage(config: dict, base_dir: str = ".") -> BlobStorage:
+    """
+    根据配置创建存储后端
+
+    配置项：
+        storage_backend: local（默认）或 s3
+        storage_root: 本地存储根目录，默认为当前目录
+        s3_bucket / s3_prefix / s3_endpoint_url / s3_access_key / s3_secret_key / s3_region: S3配置
+        thumbnail_store: files（默认，每张缩略图一个文件/对象）或 packed（缩略图保存在本地打包存储中）
+
+    Args:
+        config: 配置字典
+        base_dir: storage_root为相对路径时的基准目录
+
+    Returns:
+        BlobStorage: 存储后端实例
+    """
+    backend = config.get("storage_backend", "local")
+    thumbnail_store = config.get("thumbnail_store", "files")
+    if thumbnail_store not in ("files", "packed"):
+        raise ValueError(f"Unknown thumbnail store: {thumbnail_store}")
+    if backend == "s3":
+        storage = S3BlobStorage(
+            config["s3_bucket"],
+            prefix=config.get("s3_prefix", ""),
+            endpoint_url=config.get("s3_endpoint_url"),
+            access_key=config.get("s3_access_key"),
+            secret_key=config.get("s3_secret_key"),
+            region=config.get("s3_region")
+        )
+    elif backend == "local":
+        storage = LocalBlobStorage(os.path.join(base_dir, config.get("storage_root", ".")))
+    else:
+        raise ValueError(f"Unknown storage backend: {backend}")
+    if thumbnail_store == "packed":
+        return PackedThumbnailStorage(storage, create_thumbnail_pack(config, base_dir))
+    return storage
+
+
+def _file_md5(path: str) -> str:
+    md5_hash = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(65536), b""):
+            md5_hash.update(chunk)
+    return md5_hash.hexdigest()
+
+
+def migrate_to_sharded(db_manager, source: BlobStorage, target: BlobStorage, batch_size: int = 200) -> dict:
+    """
+    将旧的平铺存储（pictures/x.jpg、cache/x.webp）中的文件迁移到分片布局，并更新images表中的image_path。
+    每批图片的文件复制完成后在一个事务中更新路径，再删除旧文件；中断后重新运行会跳过已迁移的图片
+
+    Args:
+        db_manager: 数据库管理器实例
+        source: 旧文件所在的存储
+        target: 目标存储，可以与source相同（本地重新布局）或为S3
+        batch_size: 每批更新的图片数量
+
+    Returns:
+        dict: 统计，包含moved、skipped、missing
+    """
+    logger = setup_logger("blob_storage")
+    stats = {"moved": 0, "skipped": 0, "missing": 0}
+    for batch in db_manager.iter_image_paths(batch_size):
+        updates = []
+        for image_id, image_path, md5 in batch:
+            if not image_path:
+                continue
+            old_key = normalize_key(image_path)
+            if old_key.startswith(PICTURES_PREFIX + "/") and md5_from_key(old_key):
+                stats["skipped"] += 1
+                continue
+            with source.open_local(old_key) as local_path:
+                if local_path is None:
+                    logger.warning("原图不存在，跳过: %s, %s", image_id, image_path)
+                    stats["missing"] += 1
+                    continue
+                new_key = sharded_key(PICTURES_PREFIX, md5 or _file_md5(local_path), os.path.splitext(old_key)[1] or ".jpg")
+                target.put_file(new_key, local_path)
+
+            old_thumbnail = thumbnail_key(old_key)
+            with source.open_local(old_thumbnail) as thumbnail_path:
+                if thumbnail_path is not None:
+                    target.put_file(thumbnail_key(new_key), thumbnail_path)
+            updates.append((image_id, new_key, old_key, old_thumbnail))
+
+        if not updates:
+            continue
+        # 先提交新路径再删除旧文件，删除前中断只会留下多余的旧文件
+        db_manager.update_image_paths([(new_key, image_id) for image_id, new_key, _, _ in updates])
+        for _, _, old_key, old_thumbnail in updates:
+            source.delete(old_key)
+            source.delete(old_thumbnail)
+        stats["moved"] += len(updates)
+        logger.info("存储迁移进度: 已迁移 %s, 缺失 %s", stats['moved'], stats['missing'])
+    return stats
+
+
+if __name__ == "__main__":
+    # 用法: python -m functions.blob_storage [config.json]
+    # 将旧的平铺目录中的图片迁移到配置的存储后端（分片布局），旧文件从 storage_root 读取
+    import sys
+    from .config_loader import load_config
+    from .database import DatabaseManager
+    migrate_config = load_config(sys.argv[1] if len(sys.argv) > 1 else "config.json")
+    result = migrate_to_sharded(
+        DatabaseManager(migrate_config.get("db_path", "picture_sniffer.db")),
+        LocalBlobStorage(migrate_config.get("storage_root", ".")),
+        create_blob_storage(migrate_config)
+    )
+    print(f"迁移完成: {result}")
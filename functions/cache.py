@@ -1,5 +1,10 @@
 import os
+import io
+import time
+import base64
+from typing import Optional, Tuple
 from PIL import Image
+from .metrics import metrics, COUNT_BUCKETS
 
 def compress_to_webp(input_path: str, output_path: str, max_size_kb: int = 50) -> bool:
     """
@@ -11,15 +16,41 @@ def compress_to_webp(input_path: str, output_path: str, max_size_kb: int = 50) -
     :param max_size_kb: 最大文件大小限制（KB），默认为50KB
     :return: 成功返回True，失败返回False
     """
+    data = compress_to_webp_bytes(input_path, max_size_kb)
+    if data is None:
+        return False
+    # 确保输出目录存在
+    output_dir = os.path.dirname(output_path)
+    if output_dir and not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+    with open(output_path, 'wb') as f:
+        f.write(data)
+    return True
+
+
+def compress_to_webp_bytes(input_path: str, max_size_kb: int = 50) -> Optional[bytes]:
+    """
+    将输入图片压缩为WebP缩略图，返回缩略图内容，用于写入打包存储等不需要中间文件的场景。
+
+    :param input_path: 输入图片的绝对路径
+    :param max_size_kb: 最大文件大小限制（KB），默认为50KB
+    :return: 缩略图内容，失败返回None
+    """
+    start = time.perf_counter()
+    data, passes = _compress_to_webp(input_path, max_size_kb)
+    metrics.observe("thumbnail_seconds", time.perf_counter() - start, result="ok" if data is not None else "failed")
+    if passes:
+        metrics.observe("thumbnail_passes", passes, COUNT_BUCKETS)
+    return data
+
+
+def _compress_to_webp(input_path: str, max_size_kb: int) -> Tuple[Optional[bytes], int]:
+    # 返回 (缩略图内容，失败为None, 编码WebP的次数)
+    passes = 0
     try:
         if not os.path.exists(input_path):
             print(f"错误: 输入文件不存在 - {input_path}")
-            return False
-
-        # 确保输出目录存在
-        output_dir = os.path.dirname(output_path)
-        if output_dir and not os.path.exists(output_dir):
-            os.makedirs(output_dir)
+            return None, passes
 
         with Image.open(input_path) as img:
             # 格式转换：处理特殊模式
@@ -40,13 +71,15 @@ def compress_to_webp(input_path: str, output_path: str, max_size_kb: int = 50) -
             target_size_bytes = max_size_kb * 1024
             
             while True:
-                # 保存当前状态
-                img.save(output_path, 'WEBP', quality=quality)
+                # 在内存中编码当前状态
+                buffer = io.BytesIO()
+                img.save(buffer, 'WEBP', quality=quality)
+                passes += 1
                 
                 # 检查大小
-                file_size = os.path.getsize(output_path)
+                file_size = buffer.tell()
                 if file_size <= target_size_bytes:
-                    return True
+                    return buffer.getvalue(), passes
                 
                 # 策略调整
                 if quality > 30:
@@ -58,7 +91,7 @@ def compress_to_webp(input_path: str, output_path: str, max_size_kb: int = 50) -
                     if w < 100 or h < 100:
                         # 尺寸过小，无法继续压缩，返回当前结果
                         print(f"警告: 无法压缩至 {max_size_kb}KB 以下，当前大小: {file_size/1024:.2f}KB")
-                        return True
+                        return buffer.getvalue(), passes
                     
                     # 每次缩小 20%
                     new_w, new_h = int(w * 0.8), int(h * 0.8)
@@ -67,7 +100,32 @@ def compress_to_webp(input_path: str, output_path: str, max_size_kb: int = 50) -
     
     except ImportError:
         print("错误: 未安装 Pillow 库。请运行 `pip install Pillow` 安装。")
-        return False
+        return None, passes
     except Exception as e:
         print(f"压缩图片时发生未知错误: {e}")
-        return False
+        return None, passes
+
+
+def encode_for_analysis(input_path: str, max_dimension: int = 1024, quality: int = 85) -> Optional[str]:
+    """
+    将本地图片缩放后编码为JPEG的base64字符串，用于发送给大模型分析。
+    动图与无法解码的图片返回None（大模型同样不支持这类图片）。
+
+    :param input_path: 输入图片路径
+    :param max_dimension: 长边最大像素
+    :param quality: JPEG质量
+    :return: base64字符串，失败返回None
+    """
+    try:
+        with Image.open(input_path) as img:
+            if getattr(img, "is_animated", False):
+                return None
+            if img.mode != 'RGB':
+                img = img.convert('RGB')
+            img.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
+            buffer = io.BytesIO()
+            img.save(buffer, 'JPEG', quality=quality)
+        return base64.b64encode(buffer.getvalue()).decode("utf-8")
+    except Exception as e:
+        print(f"编码图片失败: {input_path}, 错误: {e}")
+        return None
@@ -0,0 +1,123 @@
+import gzip
+import os
+import sys
+from typing import Optional, Iterable
+from .logger_config import setup_logger
+
+# 可选依赖：安装 brotli 后额外生成/协商 br 编码，否则只使用 gzip
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# 文本类静态资源才值得压缩，图片和字体本身已经是压缩格式
+COMPRESSIBLE_EXTENSIONS = {'.html', '.js', '.css', '.txt', '.json', '.svg', '.map', '.ico', '.xml'}
+
+# 编码名 -> 预压缩文件后缀，按优先级排列
+ENCODING_SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+
+def available_encodings() -> list:
+    """
+    获取当前环境支持的压缩编码，按优先级排列
+
+    Returns:
+        list: 编码名列表
+    """
+    return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+
+def compress_bytes(data: bytes, encoding: str, static: bool = False) -> bytes:
+    """
+    压缩数据
+
+    Args:
+        data: 原始数据
+        encoding: 'br' 或 'gzip'
+        static: 为True时使用最高压缩级别（只压缩一次的静态资源），否则使用较快的级别
+
+    Returns:
+        bytes: 压缩后的数据
+    """
+    if encoding == 'br':
+        return brotli.compress(data, quality=11 if static else 5)
+    # mtime固定为0，保证相同内容生成相同的文件
+    return gzip.compress(data, compresslevel=9 if static else 6, mtime=0)
+
+
+def choose_encoding(accept_encoding: str, encodings: Iterable[str]) -> Optional[str]:
+    """
+    根据请求的 Accept-Encoding 选择压缩编码
+
+    Args:
+        accept_encoding: Accept-Encoding 请求头
+        encodings: 可用的编码，按服务端优先级排列
+
+    Returns:
+        Optional[str]: 选中的编码，客户端不接受任何可用编码时返回None
+    """
+    accepted = {}
+    for item in (accept_encoding or '').split(','):
+        name, _, params = item.strip().partition(';')
+        if not name:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+
+    for encoding in encodings:
+        if accepted.get(encoding, accepted.get('*', 0.0)) > 0:
+            return encoding
+    return None
+
+
+def precompress_directory(directory: str, min_size: int = 1024) -> int:
+    """
+    为目录中的文本类静态资源生成 .gz / .br 预压缩文件，已是最新的文件会跳过
+
+    Args:
+        directory: 静态资源目录
+        min_size: 小于该大小（字节）的文件不压缩
+
+    Returns:
+        int: 新生成的预压缩文件数量
+    """
+    logger = setup_logger("compression")
+    created = 0
+    for root, _, files in os.walk(directory):
+        for name in files:
+            if os.path.splitext(name)[1].lower() not in COMPRESSIBLE_EXTENSIONS:
+                continue
+            path = os.path.join(root, name)
+            stat = os.stat(path)
+            if stat.st_size < min_size:
+                continue
+
+            data = None
+            for encoding in available_encodings():
+                target = path + ENCODING_SUFFIXES[encoding]
+                if os.path.exists(target) and os.path.getmtime(target) >= stat.st_mtime:
+                    continue
+                if data is None:
+                    with open(path, 'rb') as f:
+                        data = f.read()
+                compressed = compress_bytes(data, encoding, static=True)
+                # 压缩后没有变小的文件不生成，直接返回原文件
+                if len(compressed) >= len(data):
+                    continue
+                with open(target + '.tmp', 'wb') as f:
+                    f.write(compressed)
+                os.replace(target + '.tmp', target)
+                created += 1
+    logger.info("静态资源预压缩完成: %s, 新生成 %s 个文件", directory, created)
+    return created
+
+
+if __name__ == "__main__":
+    # 用法: python -m functions.compression [静态资源目录]，可在前端构建后执行
+    precompress_directory(sys.argv[1] if len(sys.argv) > 1 else os.path.join('website', 'dist'))
@@ -1,5 +1,6 @@
 import requests
 from typing import List, Dict, Any, Optional
+from .metrics import metrics
 
 
 class DataFetcher:
@@ -7,10 +8,15 @@ class DataFetcher:
         self.base_url = base_url
         self.token = token
 
+    def _post(self, action: str, payload: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        # 记录每个 NapCat 接口的耗时和HTTP状态
+        with metrics.timer("napcat_request_seconds", action=action, status="ok") as labels:
+            response = requests.post(f"{self.base_url}/{action}", headers={"Authorization": self.token}, json=payload)
+            labels["status"] = str(response.status_code)
+            return response.json()
+
     def get_group_list(self) -> Dict[str, Any]:
-        url = f"{self.base_url}/get_group_list"
-        response = requests.post(url, headers={"Authorization": self.token})
-        return response.json()
+        return self._post("get_group_list")
 
     def get_group_message_history(
         self,
@@ -18,7 +24,6 @@ class DataFetcher:
         message_seq: str,
         count: int = 100
     ) -> Dict[str, Any]:
-        url = f"{self.base_url}/get_group_msg_history"
         payload = {
             "group_id": group_id,
             "count": count,
@@ -26,8 +31,7 @@ class DataFetcher:
         }
         if message_seq:
             payload["message_seq"] = message_seq
-        response = requests.post(url, headers={"Authorization": self.token}, json=payload)
-        return response.json()
+        return self._post("get_group_msg_history", payload)
 
     def get_new_messages(
         self,
@@ -70,30 +74,41 @@ class DataFetcher:
         
         return result.get("data", {}).get("messages", [])
 
+    def extract_image_message(self, msg: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        提取单条消息中的第一张图片
+
+        Args:
+            msg: 消息事件或历史消息
+
+        Returns:
+            Optional[Dict[str, Any]]: 图片消息，消息中没有图片时返回None
+        """
+        for item in msg.get("message", []):
+            if item.get("type") == "image":
+                image_data = item.get("data", {})
+                return {
+                    "message_id": str(msg.get("message_id", "")),
+                    "group_id": str(msg.get("group_id", "")),
+                    "url": image_data.get("url", ""),
+                    "file": image_data.get("file", ""),
+                    "time": str(msg.get("time", ""))
+                }
+        return None
+
     def extract_image_messages(self, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         image_messages = []
         
         for msg in messages:
-            message_list = msg.get("message", [])
-            for item in message_list:
-                if item.get("type") == "image":
-                    image_data = item.get("data", {})
-                    image_messages.append({
-                        "message_id": str(msg.get("message_id", "")),
-                        "group_id": str(msg.get("group_id", "")),
-                        "url": image_data.get("url", ""),
-                        "file": image_data.get("file", ""),
-                        "time": str(msg.get("time", ""))
-                    })
-                    break
+            image_message = self.extract_image_message(msg)
+            if image_message is not None:
+                image_messages.append(image_message)
         
         return image_messages
 
     def fetch_message_body(self, message_id: str) -> Optional[str]:
-        url = f"{self.base_url}/get_msg"
         payload = {
             "message_id": message_id
         }
-        response = requests.post(url, headers={"Authorization": self.token}, json=payload)
-        data = response.json().get("data", {})
+        data = self._post("get_msg", payload).get("data", {})
         return data.get("message", "")
@@ -2,38 +2,63 @@ from types import NoneType
 import requests
 import os
 import json
-from datetime import datetime
+import hashlib
+import time
 from typing import Dict, Any, Optional
 from .database import DatabaseManager
+from .labels import LABEL_VERSION
+from .blob_storage import BlobStorage, LocalBlobStorage, PICTURES_PREFIX, sharded_key, thumbnail_key, md5_from_key
+from .metrics import metrics, BYTES_BUCKETS
 from .logger_config import setup_logger
 
 
 class DataStorage:
-    def __init__(self, db_manager: DatabaseManager, data_fetcher, pictures_dir: str = "pictures"):
+    def __init__(
+        self,
+        db_manager: DatabaseManager,
+        data_fetcher,
+        pictures_dir: str = "pictures",
+        blob_storage: Optional[BlobStorage] = None
+    ):
         """
         初始化DataStorage实例
         
         Args:
             db_manager: 数据库管理器实例
             data_fetcher: 数据获取器实例
-            pictures_dir: 图片存储目录，默认为"pictures"
+            pictures_dir: 旧版平铺布局的图片目录，仅用于兼容已有路径
+            blob_storage: 图片存储后端，默认为当前目录下的本地存储
         """
         self.logger = setup_logger("data_storage")
         self.db_manager = db_manager
         self.data_fetcher = data_fetcher
         self.pictures_dir = pictures_dir
-        self._ensure_pictures_dir()
+        self.blob_storage = blob_storage or LocalBlobStorage()
+        # 删除图片时使用同一个存储后端
+        self.db_manager.blob_storage = self.blob_storage
+        # 可选的写入合并器，设置后图片记录由其批量提交
+        self.write_batcher = None
 
-    def _ensure_pictures_dir(self):
+    def download_image(self, url: str, group_id: str, message_id: str) -> str:
         """
-        确保图片存储目录存在，如果不存在则创建
+        下载图片到存储，并且生成webp格式缓存
+        
+        Args:
+            url: 图片URL地址
+            group_id: 群组ID
+            message_id: 消息ID
+        
+        Returns:
+            str: 图片存储路径，下载失败则返回空字符串
         """
-        if not os.path.exists(self.pictures_dir):
-            os.makedirs(self.pictures_dir)
+        file_path = self.fetch_image(url, group_id, message_id)
+        if file_path:
+            self.make_thumbnail(file_path)
+        return file_path
 
-    def download_image(self, url: str, group_id: str, message_id: str) -> str:
+    def fetch_image(self, url: str, group_id: str, message_id: str) -> str:
         """
-        下载图片到本地，并且保存webp格式缓存到./cache路径下。
+        仅下载原图到存储，不生成缩略图。URL过期（400）时会重新获取消息体中的新URL
         
         Args:
             url: 图片URL地址
@@ -41,25 +66,66 @@ class DataStorage:
             message_id: 消息ID
         
         Returns:
-            str: 图片文件路径，下载失败则返回空字符串
+            str: 图片存储路径（pictures/ab/cd/<md5>.jpg），下载失败则返回空字符串
+        """
+        content = self.download_content(url, message_id)
+        if content is None:
+            return ""
+        return self.store_original(content)
+
+    def store_original(self, content: bytes, ext: str = ".jpg") -> str:
+        """
+        按内容MD5分片保存原图，内容相同的图片只保存一份
+        
+        Args:
+            content: 图片二进制内容
+            ext: 扩展名
+        
+        Returns:
+            str: 图片存储路径
+        """
+        key = sharded_key(PICTURES_PREFIX, hashlib.md5(content).hexdigest(), ext)
+        if not self.blob_storage.exists(key):
+            self.blob_storage.put_bytes(key, content)
+        return key
+
+    def store_original_file(self, path: str, md5: Optional[str] = None, ext: Optional[str] = None) -> str:
+        """
+        按内容MD5分片保存本地文件（移动），内容相同的图片已存在时删除本地文件
+        
+        Args:
+            path: 本地文件路径
+            md5: 文件MD5，为空时计算
+            ext: 扩展名，为空时使用文件原扩展名
+        
+        Returns:
+            str: 图片存储路径
         """
-        filename = f"{group_id}_{message_id}.jpg"
-        file_path = os.path.join(self.pictures_dir, filename)
+        key = sharded_key(PICTURES_PREFIX, md5 or self.file_md5(path), ext or os.path.splitext(path)[1] or ".jpg")
+        if self.blob_storage.exists(key):
+            os.remove(path)
+        else:
+            self.blob_storage.put_file(key, path, move=True)
+        return key
 
-        response = requests.get(url, timeout=30)
+    def download_content(self, url: str, message_id: str) -> Optional[bytes]:
+        """
+        下载图片内容到内存。URL过期（400）时会重新获取消息体中的新URL
+        
+        Args:
+            url: 图片URL地址
+            message_id: 消息ID
+        
+        Returns:
+            Optional[bytes]: 图片二进制内容，下载失败返回None
+        """
+        response = self._get(url)
         try:
             response.raise_for_status()
-            with open(file_path, "wb") as f:
-                f.write(response.content)
-            # 保存webp格式缓存
-            webp_file_path = os.path.join("./cache", filename.replace(".jpg", ".webp"))
-            os.makedirs(os.path.dirname(webp_file_path), exist_ok=True)
-            from .cache import compress_to_webp
-            compress_to_webp(file_path, webp_file_path, max_size_kb=50)
-            return file_path
+            return response.content
         except requests.exceptions.HTTPError as e:
             if response.status_code == 400:
-                self.logger.warning(f"遇到400错误，尝试获取新的消息体: {url}")
+                self.logger.warning("遇到400错误，尝试获取新的消息体: %s", url)
                 message_body = self.data_fetcher.fetch_message_body(message_id)
                 if message_body:
                     try:
@@ -69,22 +135,77 @@ class DataStorage:
                             if msg.get("type") == "image":
                                 new_url = msg.get("data", {}).get("url", "")
                                 if new_url and new_url != url:
-                                    self.logger.info(f"获取到新的URL: {new_url}")
+                                    self.logger.info("获取到新的URL: %s", new_url)
                                     try:
-                                        new_response = requests.get(new_url, timeout=30)
+                                        new_response = self._get(new_url)
                                         new_response.raise_for_status()
-                                        with open(file_path, "wb") as f:
-                                            f.write(new_response.content)
-                                        return file_path
+                                        return new_response.content
                                     except requests.exceptions.RequestException as new_e:
-                                        self.logger.error(f"使用新URL下载失败: {new_e}")
+                                        self.logger.error("使用新URL下载失败: %s", new_e)
                     except json.JSONDecodeError as json_e:
-                        self.logger.error(f"解析消息体失败: {json_e}")
-            self.logger.error(f"下载图片失败: {url}, 错误: {e}")
-            return ""
+                        self.logger.error("解析消息体失败: %s", json_e)
+            self.logger.error("下载图片失败: %s, 错误: %s", url, e)
+            return None
         except requests.exceptions.RequestException as e:
-            self.logger.error(f"下载图片失败: {url}, 错误: {e}")
+            self.logger.error("下载图片失败: %s, 错误: %s", url, e)
+            return None
+
+    def _get(self, url: str) -> requests.Response:
+        """
+        下载URL，记录耗时、HTTP状态和下载的字节数
+        
+        Args:
+            url: 图片URL地址
+        
+        Returns:
+            requests.Response: 响应对象
+        """
+        with metrics.timer("download_seconds", status="ok") as labels:
+            response = requests.get(url, timeout=30)
+            labels["status"] = str(response.status_code)
+        if response.ok:
+            metrics.observe("download_bytes", len(response.content), BYTES_BUCKETS)
+        return response
+
+    def make_thumbnail(self, image_path: str) -> str:
+        """
+        为图片生成webp格式缓存，保存在与原图对应的 cache/ 路径下
+        
+        Args:
+            image_path: 图片存储路径
+        
+        Returns:
+            str: 缩略图存储路径，生成失败返回空字符串
+        """
+        from .cache import compress_to_webp_bytes
+        webp_key = thumbnail_key(image_path)
+        with self.blob_storage.open_local(image_path) as source_path:
+            if source_path is None:
+                self.logger.error("生成缩略图失败，原图不存在: %s", image_path)
+                return ""
+            # 在内存中编码后一次写入，打包存储不产生中间文件
+            data = compress_to_webp_bytes(source_path, max_size_kb=50)
+        if data is None:
             return ""
+        self.blob_storage.put_bytes(webp_key, data)
+        return webp_key
+
+    @staticmethod
+    def file_md5(image_path: str) -> str:
+        """
+        以二进制读取图片，计算MD5
+        
+        Args:
+            image_path: 图片文件路径
+        
+        Returns:
+            str: MD5十六进制字符串
+        """
+        with open(image_path, "rb") as f:
+            md5_hash = hashlib.md5()
+            for chunk in iter(lambda: f.read(65536), b""):
+                md5_hash.update(chunk)
+        return md5_hash.hexdigest()
 
     def save_image_info(
         self,
@@ -92,22 +213,34 @@ class DataStorage:
         image_path: str,
         category: str,
         description: str,
-        create_time: str|NoneType = None
-    ):
+        create_time: int|str|NoneType = None,
+        md5: str|NoneType = None
+    ) -> bool:
         """
-        保存图片信息到数据库
+        保存图片信息到数据库。提供md5时图片记录和元数据记录在同一个事务中写入
         
         Args:
             image_id: 图片ID（消息ID）
             image_path: 图片文件路径
             category: 图片分类
             description: 图片描述
-            create_time: 创建时间，如果为None则使用当前时间
+            create_time: 创建时间（Unix时间戳），如果为None则使用当前时间
+            md5: 图片MD5值，可选
+        
+        Returns:
+            bool: 相同MD5的图片正在等待写入时返回False，否则返回True
         """
         if create_time is None:
-            create_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            create_time = int(time.time())
+        
+        # 入库的分类和描述都来自当前版本的分类提示词
+        image_row = (image_id, image_path, category, description, create_time, LABEL_VERSION)
+        meta_row = (image_id, 'true', md5, create_time) if md5 else None
+        if self.write_batcher is not None:
+            return self.write_batcher.add_image(image_row, meta_row)
         
-        self.db_manager.insert_image(image_id, image_path, category, description, create_time)
+        self.db_manager.insert_images_with_meta([image_row], [meta_row] if meta_row else [])
+        return True
 
     def process_and_save_image(
         self,
@@ -130,7 +263,6 @@ class DataStorage:
         image_id = image_data.get("message_id", "")
         group_id = image_data.get("group_id", "")
         url = image_data.get("url", "")
-        time_str = image_data.get("time", "")
         
         if self.db_manager.image_exists(image_id):
             return True
@@ -139,25 +271,42 @@ class DataStorage:
         if not image_path:
             return False
         
-        # 以二进制读取图片，计算MD5
-        with open(image_path, "rb") as f:
-            md5_hash = hashlib.md5()
-            for chunk in iter(lambda: f.read(4096), b""):
-                md5_hash.update(chunk)
-        md5 = md5_hash.hexdigest()
+        self.store_downloaded_image(image_data, analysis_result, image_path)
+        return True
+
+    def store_downloaded_image(
+        self,
+        image_data: Dict[str, Any],
+        analysis_result: Dict[str, Any],
+        image_path: str
+    ) -> bool:
+        """
+        计算已下载图片的MD5并写入数据库，MD5重复的图片不会重复入库
+        
+        Args:
+            image_data: 图片数据字典，包含message_id、time等信息
+            analysis_result: 图片分析结果，包含category、description等
+            image_path: 已下载的图片存储路径
+        
+        Returns:
+            bool: 新写入返回True，MD5重复返回False
+        """
+        md5 = md5_from_key(image_path)
+        if md5 is None:
+            with self.blob_storage.open_local(image_path) as local_path:
+                md5 = self.file_md5(local_path)
         
         # 检查MD5是否已存在
         if self.db_manager.md5_exists(md5):
-            # self.logger.info(f"MD5已存在，跳过重复图片: {md5}")
-            return True
+            # self.logger.info("MD5已存在，跳过重复图片: %s", md5)
+            return False
         
+        image_id = image_data.get("message_id", "")
+        time_str = image_data.get("time", "")
         category = analysis_result.get("category", "")
         description = analysis_result.get("description", "")
         
-        self.save_image_info(image_id, image_path, category, description, time_str)
-        self.db_manager.insert_image_meta(image_id, 'true', md5, time_str)
-
-        return True
+        return self.save_image_info(image_id, image_path, category, description, time_str, md5)
 
     def update_group_last_message_id(self, group_id: str, last_message_id: str):
         """
@@ -167,14 +316,14 @@ class DataStorage:
             group_id: 群组ID
             last_message_id: 最新消息ID
         """
-        self.db_manager.update_group_last_message_id(group_id, last_message_id)
+        self.db_manager.upsert_group(group_id, last_message_id)
 
     def insert_group(self, group_id: str, last_message_id: str):
         """
-        插入新群组记录到数据库
+        插入新群组记录到数据库，已存在时更新最新消息ID
         
         Args:
             group_id: 群组ID
             last_message_id: 最新消息ID
         """
-        self.db_manager.insert_group(group_id, last_message_id)        
\ No newline at end of file
+        self.db_manager.upsert_group(group_id, last_message_id)        
\ No newline at end of file
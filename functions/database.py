@@ -1,7 +1,132 @@
 import sqlite3
-import os
 import hashlib
-from typing import Optional, List, Dict, Any
+import time
+from typing import Optional, List, Dict, Any, Tuple, Iterator
+from .migrations import migrate, to_epoch
+from .blob_storage import BlobStorage, LocalBlobStorage, thumbnail_key, normalize_key
+from .metrics import metrics
+from . import json_codec
+
+
+# 数据库中的create_time为Unix时间戳，对外返回时保持"%Y-%m-%d %H:%M:%S"格式
+CREATE_TIME_COLUMN = "strftime('%Y-%m-%d %H:%M:%S', create_time, 'unixepoch', 'localtime')"
+IMAGE_COLUMNS = f"image_id, image_path, category, description, {CREATE_TIME_COLUMN}"
+
+# 批量查询时可选择返回的字段及对应的SQL表达式，img_webp由image_path计算得到
+IMAGE_FIELDS = {
+    'image_id': 'image_id',
+    'image_path': 'image_path',
+    'category': 'category',
+    'description': 'description',
+    'create_time': CREATE_TIME_COLUMN,
+    'img_webp': 'image_path',
+}
+
+# 列表查询逐行返回的字段顺序，前5项与IMAGE_COLUMNS对应，img_webp由image_path计算得到
+IMAGE_ROW_KEYS = ('image_id', 'image_path', 'category', 'description', 'create_time', 'img_webp')
+
+# 写入图片记录，使用UPSERT而不是INSERT OR REPLACE，保证分类计数触发器正确执行
+INSERT_IMAGE_SQL = (
+    'INSERT INTO images (image_id, image_path, category, description, create_time, label_version) VALUES (?, ?, ?, ?, ?, ?) '
+    'ON CONFLICT(image_id) DO UPDATE SET image_path = excluded.image_path, category = excluded.category, '
+    'description = excluded.description, create_time = excluded.create_time, label_version = excluded.label_version'
+)
+
+# 热点查询的SQL，DatabaseManager 执行的语句与 migrations.check_query_plans 检查的语句为同一份
+MD5_EXISTS_SQL = 'SELECT 1 FROM image_meta WHERE md5 = ?'
+IMAGE_EXISTS_SQL = 'SELECT 1 FROM images WHERE image_id = ?'
+IMAGES_BY_IDS_SQL = 'SELECT {columns} FROM images WHERE image_id IN ({placeholders})'
+LIST_IMAGES_SQL = f'SELECT {IMAGE_COLUMNS} FROM images ORDER BY create_time DESC LIMIT ? OFFSET ?'
+SEARCH_IMAGES_SQL = f'SELECT {IMAGE_COLUMNS} FROM images WHERE description LIKE ? OR category LIKE ? ORDER BY create_time DESC LIMIT ? OFFSET ?'
+CATEGORY_PAGE_SQL = (
+    f'SELECT {IMAGE_COLUMNS}, create_time, rowid FROM images WHERE category = ? '
+    'ORDER BY create_time DESC, rowid DESC LIMIT ? OFFSET ?'
+)
+CATEGORY_AFTER_CURSOR_SQL = (
+    f'SELECT {IMAGE_COLUMNS}, create_time, rowid FROM images WHERE category = ? AND (create_time, rowid) < (?, ?) '
+    'ORDER BY create_time DESC, rowid DESC LIMIT ?'
+)
+CATEGORY_UNTIMED_SQL = (
+    f'SELECT {IMAGE_COLUMNS}, create_time, rowid FROM images WHERE category = ? AND create_time IS NULL AND rowid < ? '
+    'ORDER BY rowid DESC LIMIT ?'
+)
+GROUP_LAST_MESSAGE_ID_SQL = 'SELECT last_message_id FROM groups WHERE group_id = ?'
+IMAGE_PATH_REFERENCED_SQL = 'SELECT 1 FROM images WHERE image_path = ? LIMIT 1'
+IMAGE_EVENTS_SQL = 'SELECT event_id, image_id, kind FROM image_events WHERE event_id > ? ORDER BY event_id LIMIT ?'
+
+# 热点查询及检查执行计划时使用的示例参数：这些查询不允许退化为全表扫描或临时排序。
+# search_images 的 LIKE '%关键词%' 无法使用索引，按 create_time 索引顺序扫描，取满一页即停止；
+# category_counts 只有几十行，不在此列。
+HOT_QUERIES: List[Tuple[str, str, tuple]] = [
+    ("md5_exists", MD5_EXISTS_SQL, ('',)),
+    ("image_exists", IMAGE_EXISTS_SQL, ('',)),
+    ("get_images_by_ids", IMAGES_BY_IDS_SQL.format(columns=IMAGE_COLUMNS, placeholders='?, ?, ?'), ('', '', '')),
+    ("get_random_images", LIST_IMAGES_SQL, (20, 0)),
+    ("search_images", SEARCH_IMAGES_SQL, ('%a%', '%a%', 20, 0)),
+    ("get_images_by_category", CATEGORY_PAGE_SQL, ('', 20, 0)),
+    ("get_images_by_category_cursor", CATEGORY_AFTER_CURSOR_SQL, ('', 0, 0, 20)),
+    ("get_images_by_category_untimed", CATEGORY_UNTIMED_SQL, ('', 0, 20)),
+    ("get_group_last_message_id", GROUP_LAST_MESSAGE_ID_SQL, ('',)),
+    ("get_image_events", IMAGE_EVENTS_SQL, (0, 500)),
+    ("image_path_referenced", IMAGE_PATH_REFERENCED_SQL, ('',)),
+]
+
+# 批量重新标注时记录版本的列
+VERSION_COLUMNS = ('label_version', 'detail_version')
+
+# 单条SQL中IN (...) 参数数量上限，低于旧版SQLite的999个变量限制
+MAX_IN_PARAMS = 500
+
+
+def cache_path_for(raw_path: str) -> str:
+    """
+    根据原始图片路径计算缓存图片路径
+
+    Args:
+        raw_path: 原始图片路径
+
+    Returns:
+        str: 缓存图片路径，原始路径为空时返回空字符串
+    """
+    if not raw_path:
+        return ''
+    # 分片存储的 pictures/ab/cd/x.jpg 对应 ./cache/ab/cd/x.webp，旧的平铺路径对应 ./cache/x.webp
+    return './' + thumbnail_key(raw_path)
+
+
+def image_row_dict(cursor: sqlite3.Cursor, row: tuple) -> Dict[str, Any]:
+    """
+    sqlite3 行工厂：将IMAGE_COLUMNS查询结果转换为字典
+
+    Args:
+        cursor: 游标
+        row: 原始行
+
+    Returns:
+        Dict[str, Any]: 以IMAGE_ROW_KEYS为键的图片记录
+    """
+    return {
+        'image_id': row[0],
+        'image_path': row[1],
+        'category': row[2],
+        'description': row[3],
+        'create_time': row[4],
+        'img_webp': cache_path_for(row[1])
+    }
+
+
+def image_row_tuple(cursor: sqlite3.Cursor, row: tuple) -> tuple:
+    """
+    sqlite3 行工厂：紧凑模式，按IMAGE_ROW_KEYS顺序返回元组，省去每行重复的键名
+
+    Args:
+        cursor: 游标
+        row: 原始行
+
+    Returns:
+        tuple: 图片记录
+    """
+    return (row[0], row[1], row[2], row[3], row[4], cache_path_for(row[1]))
 
 
 class DatabaseManager:
@@ -13,6 +138,8 @@ class DatabaseManager:
             db_path: SQLite数据库文件路径，默认为"picture_sniffer.db"
         """
         self.db_path = db_path
+        # 图片文件所在的存储后端，删除图片时同时删除原图和缩略图
+        self.blob_storage: BlobStorage = LocalBlobStorage()
         self.init_database()
 
     def get_connection(self):
@@ -22,13 +149,26 @@ class DatabaseManager:
         Returns:
             sqlite3.Connection: 数据库连接对象
         """
-        return sqlite3.connect(self.db_path)
+        # 多个线程/进程并发写入时等待锁释放，而不是立即报错
+        return sqlite3.connect(self.db_path, timeout=30)
 
     def init_database(self):
         """
-        初始化数据库架构，创建必要的表
+        初始化数据库架构，创建必要的表，并执行尚未应用的迁移
         """
         conn = self.get_connection()
+        self.create_tables(conn)
+        migrate(conn)
+        conn.close()
+
+    @staticmethod
+    def create_tables(conn: sqlite3.Connection):
+        """
+        创建初始版本的数据表，后续的架构变更由 migrations 模块完成
+        
+        Args:
+            conn: 数据库连接
+        """
         cursor = conn.cursor()
         
         cursor.execute('''
@@ -58,7 +198,6 @@ class DatabaseManager:
         ''')
         
         conn.commit()
-        conn.close()
 
     def group_exists(self, group_id: str) -> bool:
         """
@@ -94,6 +233,43 @@ class DatabaseManager:
         conn.commit()
         conn.close()
 
+    def upsert_group(self, group_id: str, last_message_id: str):
+        """
+        插入群组记录，已存在时只更新最新消息ID
+        
+        Args:
+            group_id: 群组ID
+            last_message_id: 最新消息ID
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            'INSERT INTO groups (group_id, last_message_id) VALUES (?, ?) '
+            'ON CONFLICT(group_id) DO UPDATE SET last_message_id = excluded.last_message_id',
+            (group_id, last_message_id)
+        )
+        conn.commit()
+        conn.close()
+
+    def upsert_groups(self, group_cursors: List[Tuple[str, str]]):
+        """
+        批量插入或更新群组的最新消息ID，在同一个事务中完成
+        
+        Args:
+            group_cursors: (group_id, last_message_id) 列表
+        """
+        if not group_cursors:
+            return
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.executemany(
+            'INSERT INTO groups (group_id, last_message_id) VALUES (?, ?) '
+            'ON CONFLICT(group_id) DO UPDATE SET last_message_id = excluded.last_message_id',
+            group_cursors
+        )
+        conn.commit()
+        conn.close()
+
     def update_group_last_message_id(self, group_id: str, last_message_id: str):
         """
         更新群组的最新消息ID
@@ -123,12 +299,20 @@ class DatabaseManager:
         """
         conn = self.get_connection()
         cursor = conn.cursor()
-        cursor.execute('SELECT last_message_id FROM groups WHERE group_id = ?', (group_id,))
+        cursor.execute(GROUP_LAST_MESSAGE_ID_SQL, (group_id,))
         result = cursor.fetchone()
         conn.close()
         return result[0] if result else None
 
-    def insert_image(self, image_id: str, image_path: str, category: str, description: str, create_time: str):
+    def insert_image(
+        self,
+        image_id: str,
+        image_path: str,
+        category: str,
+        description: str,
+        create_time: str,
+        label_version: Optional[str] = None
+    ):
         """
         插入或更新图片记录
         
@@ -137,13 +321,14 @@ class DatabaseManager:
             image_path: 图片文件路径
             category: 图片分类
             description: 图片描述
-            create_time: 创建时间
+            create_time: 创建时间，Unix时间戳或"%Y-%m-%d %H:%M:%S"格式
+            label_version: 生成分类和描述的模型与提示词版本
         """
         conn = self.get_connection()
         cursor = conn.cursor()
         cursor.execute(
-            'INSERT OR REPLACE INTO images (image_id, image_path, category, description, create_time) VALUES (?, ?, ?, ?, ?)',
-            (image_id, image_path, category, description, create_time)
+            INSERT_IMAGE_SQL,
+            (image_id, image_path, category, description, to_epoch(create_time), label_version)
         )
         conn.commit()
         conn.close()
@@ -165,6 +350,138 @@ class DatabaseManager:
         conn.commit()
         conn.close()
 
+    def get_detail_description(self, image_id: str) -> Optional[str]:
+        """
+        获取已生成的细化描述
+        
+        Args:
+            image_id: 图片ID（消息ID）
+        
+        Returns:
+            Optional[str]: 细化描述，尚未生成时返回None
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT detail_description FROM images WHERE image_id = ?', (image_id,))
+        result = cursor.fetchone()
+        conn.close()
+        return result[0] if result else None
+
+    def save_detail_description(self, image_id: str, description: str, detail_version: Optional[str] = None):
+        """
+        保存细化描述，同时替换图片描述，使搜索和列表展示细化后的内容
+        
+        Args:
+            image_id: 图片ID（消息ID）
+            description: 细化描述
+            detail_version: 生成细化描述的模型与提示词版本
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            'UPDATE images SET description = ?, detail_description = ?, detail_version = ? WHERE image_id = ?',
+            (description, description, detail_version, image_id)
+        )
+        conn.commit()
+        conn.close()
+
+    def get_relabel_checkpoint(self, job_name: str) -> int:
+        """
+        获取批量重新标注任务的断点
+        
+        Args:
+            job_name: 任务名称
+        
+        Returns:
+            int: 已处理到的images rowid，没有断点时返回0
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT last_rowid FROM relabel_checkpoints WHERE job_name = ?', (job_name,))
+        result = cursor.fetchone()
+        conn.close()
+        return result[0] if result else 0
+
+    def reset_relabel_checkpoint(self, job_name: str):
+        """
+        删除批量重新标注任务的断点，下次从头扫描（版本已是最新的图片仍会跳过）
+        
+        Args:
+            job_name: 任务名称
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM relabel_checkpoints WHERE job_name = ?', (job_name,))
+        conn.commit()
+        conn.close()
+
+    def get_relabel_chunk(self, after_rowid: int, limit: int, version_column: str, version: str) -> List[Tuple[int, str, str]]:
+        """
+        按rowid顺序获取一批版本与当前版本不一致的图片
+        
+        Args:
+            after_rowid: 从该rowid之后开始
+            limit: 数量
+            version_column: label_version 或 detail_version
+            version: 当前版本
+        
+        Returns:
+            List[Tuple[int, str, str]]: (rowid, image_id, image_path) 列表
+        """
+        if version_column not in VERSION_COLUMNS:
+            raise ValueError(f"Unknown version column: {version_column}")
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            f'SELECT rowid, image_id, image_path FROM images WHERE rowid > ? AND IFNULL({version_column}, \'\') != ? '
+            'ORDER BY rowid LIMIT ?',
+            (after_rowid, version, limit)
+        )
+        results = cursor.fetchall()
+        conn.close()
+        return results
+
+    def save_relabel_chunk(
+        self,
+        job_name: str,
+        last_rowid: int,
+        labels: List[tuple],
+        details: List[tuple]
+    ):
+        """
+        在同一个事务中写入一批重新标注结果并推进断点，中断后不会出现结果已写入但断点未更新的情况
+        
+        Args:
+            job_name: 任务名称
+            last_rowid: 本批最后一张图片的rowid
+            labels: (image_id, category, description, label_version) 列表
+            details: (image_id, detail_description, detail_version) 列表
+        """
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.executemany(
+                'UPDATE images SET category = ?, description = ?, label_version = ? WHERE image_id = ?',
+                [(category, description, version, image_id) for image_id, category, description, version in labels]
+            )
+            cursor.executemany(
+                'UPDATE images SET description = ?, detail_description = ?, detail_version = ? WHERE image_id = ?',
+                [(text, text, version, image_id) for image_id, text, version in details]
+            )
+            cursor.execute(
+                'INSERT INTO relabel_checkpoints (job_name, last_rowid, processed, updated_at) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT(job_name) DO UPDATE SET last_rowid = excluded.last_rowid, '
+                'processed = processed + excluded.processed, updated_at = excluded.updated_at',
+                (job_name, last_rowid, len(labels) + len(details), time.time())
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    @metrics.timed("db_seconds")
     def get_image_by_id(self, image_id: str) -> Optional[Dict[str, Any]]:
         """
         根据图片ID获取图片记录
@@ -177,7 +494,7 @@ class DatabaseManager:
         """
         conn = self.get_connection()
         cursor = conn.cursor()
-        cursor.execute('SELECT image_id, image_path, category, description, create_time FROM images WHERE image_id = ?', (image_id,))
+        cursor.execute(f'SELECT {IMAGE_COLUMNS} FROM images WHERE image_id = ?', (image_id,))
         result = cursor.fetchone()
         conn.close()
         if result:
@@ -190,6 +507,51 @@ class DatabaseManager:
             }
         return None
 
+    def get_images_by_ids(self, image_ids: List[str], fields: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        """
+        根据多个图片ID批量获取图片记录，使用一个连接和 IN (...) 查询
+        
+        Args:
+            image_ids: 图片ID列表
+            fields: 需要返回的字段，默认返回全部字段（见IMAGE_FIELDS），image_id总会返回
+        
+        Returns:
+            List[Dict[str, Any]]: 图片记录列表，顺序与image_ids一致，不存在的ID会被忽略
+        
+        Raises:
+            ValueError: fields中包含未知字段
+        """
+        fields = list(IMAGE_FIELDS) if not fields else ['image_id'] + [f for f in fields if f != 'image_id']
+        unknown = [f for f in fields if f not in IMAGE_FIELDS]
+        if unknown:
+            raise ValueError(f"未知字段: {', '.join(unknown)}")
+        
+        columns = ', '.join(IMAGE_FIELDS[f] for f in fields)
+        unique_ids = list(dict.fromkeys(image_ids))
+        rows = {}
+        
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        for start in range(0, len(unique_ids), MAX_IN_PARAMS):
+            chunk = unique_ids[start:start + MAX_IN_PARAMS]
+            placeholders = ', '.join('?' * len(chunk))
+            cursor.execute(IMAGES_BY_IDS_SQL.format(columns=columns, placeholders=placeholders), chunk)
+            for row in cursor.fetchall():
+                rows[row[0]] = row
+        conn.close()
+        
+        results = []
+        for image_id in unique_ids:
+            row = rows.get(image_id)
+            if row is None:
+                continue
+            record = dict(zip(fields, row))
+            if 'img_webp' in record:
+                record['img_webp'] = self.get_cache_path_by_raw_path(record['img_webp']) if record['img_webp'] else ''
+            results.append(record)
+        return results
+
+    @metrics.timed("db_seconds")
     def image_exists(self, image_id: str) -> bool:
         """
         检查图片是否存在于数据库中
@@ -202,7 +564,7 @@ class DatabaseManager:
         """
         conn = self.get_connection()
         cursor = conn.cursor()
-        cursor.execute('SELECT 1 FROM images WHERE image_id = ?', (image_id,))
+        cursor.execute(IMAGE_EXISTS_SQL, (image_id,))
         result = cursor.fetchone()
         conn.close()
         return result is not None
@@ -230,7 +592,7 @@ class DatabaseManager:
         """
         conn = self.get_connection()
         cursor = conn.cursor()
-        cursor.execute('SELECT image_id, image_path, category, description, create_time FROM images')
+        cursor.execute(f'SELECT {IMAGE_COLUMNS} FROM images')
         results = cursor.fetchall()
         conn.close()
         return [{
@@ -249,17 +611,49 @@ class DatabaseManager:
             image_id: 图片ID
             usage: 用途
             md5: 图片MD5值
-            create_time: 创建时间
+            create_time: 创建时间，Unix时间戳或"%Y-%m-%d %H:%M:%S"格式
         """
         conn = self.get_connection()
         cursor = conn.cursor()
         cursor.execute(
             'INSERT OR REPLACE INTO image_meta (image_id, usage, md5, create_time) VALUES (?, ?, ?, ?)',
-            (image_id, usage, md5, create_time)
+            (image_id, usage, md5, to_epoch(create_time))
         )
         conn.commit()
         conn.close()
 
+    def insert_images_with_meta(self, images: List[tuple], metas: List[tuple], conn: Optional[sqlite3.Connection] = None):
+        """
+        在同一个事务中批量写入图片记录和图片元数据记录
+        
+        Args:
+            images: (image_id, image_path, category, description, create_time[, label_version]) 列表
+            metas: (image_id, usage, md5, create_time) 列表
+            conn: 可选的外部连接，提供时由调用方负责提交事务
+        """
+        own_conn = conn is None
+        if own_conn:
+            conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.executemany(
+                INSERT_IMAGE_SQL,
+                [row[:4] + (to_epoch(row[4]), row[5] if len(row) > 5 else None) for row in images]
+            )
+            cursor.executemany(
+                'INSERT OR REPLACE INTO image_meta (image_id, usage, md5, create_time) VALUES (?, ?, ?, ?)',
+                [row[:3] + (to_epoch(row[3]),) for row in metas]
+            )
+            if own_conn:
+                conn.commit()
+        except Exception:
+            if own_conn:
+                conn.rollback()
+            raise
+        finally:
+            if own_conn:
+                conn.close()
+
     def update_image_usage(self, image_id: str, usage: str):
         """
         更新图片的用途字段
@@ -277,6 +671,7 @@ class DatabaseManager:
         conn.commit()
         conn.close()
 
+    @metrics.timed("db_seconds")
     def md5_exists(self, md5: str) -> bool:
         """
         检查MD5是否存在于数据库中
@@ -289,11 +684,49 @@ class DatabaseManager:
         """
         conn = self.get_connection()
         cursor = conn.cursor()
-        cursor.execute('SELECT 1 FROM image_meta WHERE md5 = ?', (md5,))
+        cursor.execute(MD5_EXISTS_SQL, (md5,))
         result = cursor.fetchone()
         conn.close()
         return result is not None
 
+    def iter_images(
+        self,
+        offset: int = 0,
+        limit: int = 20,
+        keyword: Optional[str] = None,
+        compact: bool = False
+    ) -> Iterator[Any]:
+        """
+        按时间倒序逐行读取图片记录，不在内存中保存完整结果，用于大量记录的流式输出。
+        连接在迭代结束或生成器被关闭时释放。
+
+        Args:
+            offset: 偏移量，默认为0
+            limit: 返回的图片数量，默认为20
+            keyword: 搜索关键词，提供时按描述或分类模糊匹配
+            compact: 为True时每行返回按IMAGE_ROW_KEYS排列的元组，否则返回字典
+
+        Returns:
+            Iterator[Any]: 图片记录迭代器
+        """
+        conn = self.get_connection()
+        conn.row_factory = image_row_tuple if compact else image_row_dict
+        try:
+            if keyword:
+                cursor = conn.execute(
+                    SEARCH_IMAGES_SQL,
+                    (f'%{keyword}%', f'%{keyword}%', limit, offset)
+                )
+            else:
+                cursor = conn.execute(
+                    LIST_IMAGES_SQL,
+                    (limit, offset)
+                )
+            yield from cursor
+        finally:
+            conn.close()
+
+    @metrics.timed("db_seconds")
     def get_random_images(self, offset: int = 0, limit: int = 20) -> List[Dict[str, Any]]:
         """
         获取指定数量的图片记录（分页）
@@ -305,23 +738,9 @@ class DatabaseManager:
         Returns:
             List[Dict[str, Any]]: 图片列表，每个图片包含image_id、image_path、category、description、img_webp和create_time
         """
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            'SELECT image_id, image_path, category, description, create_time FROM images ORDER BY create_time DESC LIMIT ? OFFSET ?',
-            (limit, offset)
-        )
-        results = cursor.fetchall()
-        conn.close()
-        return [{
-            'image_id': row[0],
-            'image_path': row[1],
-            'category': row[2],
-            'description': row[3],
-            'create_time': row[4],
-            'img_webp': self.get_cache_path_by_raw_path(row[1]) if row[1] else ''
-        } for row in results]
+        return list(self.iter_images(offset, limit))
 
+    @metrics.timed("db_seconds")
     def search_images(self, keyword: str, offset: int = 0, limit: int = 20) -> List[Dict[str, Any]]:
         """
         根据关键词搜索图片记录
@@ -334,23 +753,94 @@ class DatabaseManager:
         Returns:
             List[Dict[str, Any]]: 图片列表，每个图片包含image_id、image_path、category、description、img_webp和create_time
         """
+        return list(self.iter_images(offset, limit, keyword=keyword))
+    
+
+    @metrics.timed("db_seconds")
+    def get_images_by_category(
+        self,
+        category: str,
+        offset: int = 0,
+        limit: int = 20,
+        cursor: Optional[str] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        按分类精确筛选图片（按时间倒序），使用 (category, create_time) 索引
+        
+        Args:
+            category: 分类名称
+            offset: 偏移量，提供cursor时忽略
+            limit: 返回的图片数量，默认为20
+            cursor: 上一页返回的游标，提供时从游标位置继续，翻页代价与页数无关
+        
+        Returns:
+            Tuple[List[Dict[str, Any]], Optional[str]]: 图片列表，以及下一页的游标（没有更多数据时为None）
+        """
+        conn = self.get_connection()
+        db_cursor = conn.cursor()
+        position = self._parse_cursor(cursor)
+        if position is None:
+            db_cursor.execute(
+                CATEGORY_PAGE_SQL,
+                (category, limit, offset)
+            )
+            results = db_cursor.fetchall()
+        else:
+            results = []
+            if position[0] is not None:
+                db_cursor.execute(
+                    CATEGORY_AFTER_CURSOR_SQL,
+                    (category, position[0], position[1], limit)
+                )
+                results = db_cursor.fetchall()
+            if len(results) < limit:
+                # 没有创建时间的记录排在最后，按rowid继续翻页
+                db_cursor.execute(
+                    CATEGORY_UNTIMED_SQL,
+                    (category, position[1] if position[0] is None else 2 ** 63 - 1, limit - len(results))
+                )
+                results += db_cursor.fetchall()
+        conn.close()
+        
+        next_cursor = None
+        if len(results) == limit:
+            last = results[-1]
+            next_cursor = f"{last[5] if last[5] is not None else ''}:{last[6]}"
+        return [image_row_dict(None, row) for row in results], next_cursor
+
+    @staticmethod
+    def _parse_cursor(cursor: Optional[str]) -> Optional[Tuple[Optional[int], int]]:
+        """
+        解析分页游标，格式为 "create_time:rowid"
+        
+        Args:
+            cursor: 游标字符串
+        
+        Returns:
+            Optional[Tuple[Optional[int], int]]: (create_time, rowid)，无效时返回None
+        """
+        if not cursor or ':' not in cursor:
+            return None
+        create_time, rowid = cursor.split(':', 1)
+        try:
+            return (int(create_time) if create_time else None, int(rowid))
+        except ValueError:
+            return None
+
+    @metrics.timed("db_seconds")
+    def get_category_counts(self) -> List[Dict[str, Any]]:
+        """
+        获取各分类的图片数量，数据来自由触发器增量维护的category_counts表
+        
+        Returns:
+            List[Dict[str, Any]]: 分类列表，每项包含category和count，按数量倒序
+        """
         conn = self.get_connection()
         cursor = conn.cursor()
-        cursor.execute(
-            'SELECT image_id, image_path, category, description, create_time FROM images WHERE description LIKE ? OR category LIKE ? ORDER BY create_time DESC LIMIT ? OFFSET ?',
-            (f'%{keyword}%', f'%{keyword}%', limit, offset) 
-        )
+        cursor.execute('SELECT category, count FROM category_counts WHERE count > 0 ORDER BY count DESC')
         results = cursor.fetchall()
         conn.close()
-        return [{
-            'image_id': row[0],
-            'image_path': row[1],
-            'category': row[2],
-            'description': row[3],
-            'create_time': row[4],
-            'img_webp': self.get_cache_path_by_raw_path(row[1]) if row[1] else ''
-        } for row in results]
-    
+        return [{'category': row[0], 'count': row[1]} for row in results]
 
     def get_image_path(self, image_id: str) -> str:
         """
@@ -369,6 +859,7 @@ class DatabaseManager:
         conn.close()
         return result[0] if result else ""
 
+    @metrics.timed("db_seconds")
     def get_images_by_id(self,  offset:int ,limit:int) -> List[Dict[str, Any]]:
         """
         根据ID获取图片记录
@@ -380,40 +871,222 @@ class DatabaseManager:
         Returns:
             List[Dict[str, Any]]: 图片列表，每个图片包含image_id、image_path、category、description、img_webp和create_time
         """
+        return list(self.iter_images(offset, limit))
+
+    def get_cache_path_by_raw_path(self, raw_path: str) -> str:
+        """
+        根据原始图片路径获取缓存图片路径
+        
+        Args:
+            raw_path: 原始图片路径
+        
+        Returns:
+            str: 缓存图片路径
+        """
+        return cache_path_for(raw_path)
+
+    def iter_image_paths(self, batch_size: int = 200) -> Iterator[List[Tuple[str, str, Optional[str]]]]:
+        """
+        按rowid顺序分批读取所有图片的路径和MD5，用于存储迁移
+        
+        Args:
+            batch_size: 每批数量
+        
+        Returns:
+            Iterator[List[Tuple[str, str, Optional[str]]]]: 每批 (image_id, image_path, md5) 列表
+        """
+        last_rowid = 0
+        while True:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            cursor.execute(
+                'SELECT images.rowid, images.image_id, images.image_path, image_meta.md5 FROM images '
+                'LEFT JOIN image_meta ON image_meta.image_id = images.image_id '
+                'WHERE images.rowid > ? ORDER BY images.rowid LIMIT ?',
+                (last_rowid, batch_size)
+            )
+            results = cursor.fetchall()
+            conn.close()
+            if not results:
+                return
+            last_rowid = results[-1][0]
+            yield [row[1:] for row in results]
+
+    def update_image_paths(self, updates: List[Tuple[str, str]]):
+        """
+        在一个事务中批量更新图片路径
+        
+        Args:
+            updates: (image_path, image_id) 列表
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.executemany('UPDATE images SET image_path = ? WHERE image_id = ?', updates)
+        conn.commit()
+        conn.close()
+
+    def save_metrics_snapshot(self, process: str, pid: int, snapshot: Dict[str, Any]):
+        """
+        保存进程的指标快照，同名进程的旧快照被覆盖
+        
+        Args:
+            process: 进程名称
+            pid: 进程ID
+            snapshot: Metrics.snapshot() 的结果
+        """
         conn = self.get_connection()
         cursor = conn.cursor()
         cursor.execute(
-            'SELECT image_id, image_path, category, description, create_time FROM images ORDER BY create_time DESC LIMIT ? OFFSET ?',
-            (limit, offset)
+            'INSERT INTO metrics_snapshots (process, pid, payload, updated_at) VALUES (?, ?, ?, ?) '
+            'ON CONFLICT(process) DO UPDATE SET pid = excluded.pid, payload = excluded.payload, updated_at = excluded.updated_at',
+            (process, pid, json_codec.dumps(snapshot), time.time())
         )
-        results = cursor.fetchall()
+        conn.commit()
         conn.close()
-        return [{
-            'image_id': row[0],
-            'image_path': row[1],
-            'category': row[2],
-            'description': row[3],
-            'create_time': row[4],
-            'img_webp': self.get_cache_path_by_raw_path(row[1]) if row[1] else ''
-        } for row in results]
 
-    def get_cache_path_by_raw_path(self, raw_path: str) -> str:
+    def get_metrics_snapshots(self, exclude_process: Optional[str] = None) -> List[Tuple[str, Dict[str, Any], float]]:
         """
-        根据原始图片路径获取缓存图片路径
+        获取各进程最近一次保存的指标快照
         
         Args:
-            raw_path: 原始图片路径
+            exclude_process: 不需要读取的进程名称（调用方自己的进程）
         
         Returns:
-            str: 缓存图片路径
+            List[Tuple[str, Dict[str, Any], float]]: (进程名称, 快照, 更新时间) 列表
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            'SELECT process, payload, updated_at FROM metrics_snapshots WHERE process != ? ORDER BY process',
+            (exclude_process or '',)
+        )
+        results = cursor.fetchall()
+        conn.close()
+        return [(process, json_codec.loads(payload), updated_at) for process, payload, updated_at in results]
+
+    def get_group_schedules(self) -> Dict[str, Dict[str, Any]]:
+        """
+        获取常驻模式下各群的轮询计划
+
+        Returns:
+            Dict[str, Dict[str, Any]]: 群ID到轮询计划的映射，每项包含interval、next_poll_at、
+                last_polled_at、message_rate、image_rate、empty_polls
+        """
+        conn = self.get_connection()
+        conn.row_factory = sqlite3.Row
+        cursor = conn.cursor()
+        cursor.execute(
+            'SELECT group_id, interval, next_poll_at, last_polled_at, message_rate, image_rate, empty_polls FROM group_schedule'
+        )
+        results = cursor.fetchall()
+        conn.close()
+        return {row["group_id"]: {key: row[key] for key in row.keys() if key != "group_id"} for row in results}
+
+    def save_group_schedule(self, group_id: str, schedule: Dict[str, Any]):
         """
-        # 假设缓存图片路径与原始路径相关，例如在 ./cache 目录下
-        filename = os.path.splitext(os.path.basename(raw_path))[0] + '.webp'
-        return os.path.join('./cache', filename)
+        保存群的轮询计划
+
+        Args:
+            group_id: 群组ID
+            schedule: 轮询计划，字段见 get_group_schedules
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            'INSERT INTO group_schedule (group_id, interval, next_poll_at, last_polled_at, message_rate, image_rate, empty_polls) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?) '
+            'ON CONFLICT(group_id) DO UPDATE SET interval = excluded.interval, next_poll_at = excluded.next_poll_at, '
+            'last_polled_at = excluded.last_polled_at, message_rate = excluded.message_rate, '
+            'image_rate = excluded.image_rate, empty_polls = excluded.empty_polls',
+            (
+                group_id,
+                schedule["interval"],
+                schedule["next_poll_at"],
+                schedule["last_polled_at"],
+                schedule["message_rate"],
+                schedule["image_rate"],
+                schedule["empty_polls"]
+            )
+        )
+        conn.commit()
+        conn.close()
+
+    def get_group_yields(self, since: float) -> Dict[str, Tuple[int, int]]:
+        """
+        统计各群近期图片任务中最终入库为MC图片的数量
+
+        Args:
+            since: 只统计该时间（Unix时间戳）之后入队的任务
+
+        Returns:
+            Dict[str, Tuple[int, int]]: 群ID到 (已处理完成的图片数, 其中入库的MC图片数) 的映射
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            'SELECT j.group_id, COUNT(*), COUNT(i.image_id) FROM image_jobs j '
+            'LEFT JOIN images i ON i.image_id = j.job_id '
+            "WHERE j.created_at >= ? AND j.state = 'done' GROUP BY j.group_id",
+            (since,)
+        )
+        results = cursor.fetchall()
+        conn.close()
+        return {group_id: (processed, mc_images) for group_id, processed, mc_images in results}
+
+    def get_image_event_range(self) -> Tuple[int, int]:
+        """
+        获取图片变更记录中最早和最新的event_id
+
+        Returns:
+            Tuple[int, int]: (最早的event_id, 最新的event_id)，没有记录时为 (0, 0)
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT IFNULL(MIN(event_id), 0), IFNULL(MAX(event_id), 0) FROM image_events')
+        result = cursor.fetchone()
+        conn.close()
+        return result[0], result[1]
+
+    def get_image_events(self, after_event_id: int, limit: int = 500) -> List[Tuple[int, str, str]]:
+        """
+        按顺序获取某个event_id之后的图片变更记录
+
+        Args:
+            after_event_id: 只返回event_id大于该值的记录
+            limit: 最多返回的记录数
+
+        Returns:
+            List[Tuple[int, str, str]]: (event_id, image_id, kind) 列表，kind为insert或delete
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute(IMAGE_EVENTS_SQL, (after_event_id, limit))
+        results = cursor.fetchall()
+        conn.close()
+        return results
+
+    def prune_image_events(self, before: float) -> int:
+        """
+        删除较早的图片变更记录
+
+        Args:
+            before: 删除该时间（Unix时间戳）之前的记录
+
+        Returns:
+            int: 删除的记录数
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('DELETE FROM image_events WHERE created_at < ?', (before,))
+        deleted = cursor.rowcount
+        conn.commit()
+        conn.close()
+        return deleted
 
     def delete_image(self, image_id: str):
         """
         删除图片，包括从数据库中将图片的image_meta表中usage字段改为false，以及删除对应的图片记录、图片本体、图片缓存。
+        图片本体和缓存仍被其他图片记录引用时保留。
         
         Args:
             image_id: 图片ID
@@ -421,21 +1094,19 @@ class DatabaseManager:
         # 更新图片元数据的usage字段为false
         self.update_image_usage(image_id, 'false')
                 
-        # 删除图片本体
+        # 先删除图片记录，再删除图片本体和图片缓存。存储按内容MD5分片，多条记录可能引用同一个文件，
+        # 没有其他记录引用时才删除文件；检查与删除在写事务中进行，期间其他进程无法写入引用该文件的记录
         image_path = self.get_image_path(image_id)
-        if image_path and os.path.exists(image_path):
-            os.remove(image_path)
-        
-        # 删除图片缓存
-        if image_path:
-            # 使用 os.path.splitext 更稳健地处理文件名，确保即使原文件没有扩展名也能加上 .webp
-            cache_path = self.get_cache_path_by_raw_path(image_path)
-            if cache_path and os.path.exists(cache_path):
-                os.remove(cache_path)
-        
-        # 最后删除图片记录
         conn = self.get_connection()
-        cursor = conn.cursor()
-        cursor.execute('DELETE FROM images WHERE image_id = ?', (image_id,))
-        conn.commit()
-        conn.close()
\ No newline at end of file
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('DELETE FROM images WHERE image_id = ?', (image_id,))
+            if image_path and conn.execute(IMAGE_PATH_REFERENCED_SQL, (image_path,)).fetchone() is None:
+                self.blob_storage.delete(normalize_key(image_path))
+                self.blob_storage.delete(thumbnail_key(image_path))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
@@ -0,0 +1,165 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, Optional
+from .database import DatabaseManager
+from .image_analyzer import ImageAnalyzer, DETAIL_VERSION
+from .blob_storage import BlobStorage, LocalBlobStorage
+from .logger_config import setup_logger
+
+STATUS_PENDING = "pending"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+
+class DescribeJobManager:
+    def __init__(
+        self,
+        image_analyzer: ImageAnalyzer,
+        db_manager: DatabaseManager,
+        max_workers: int = 2,
+        max_pending: int = 20,
+        result_ttl: int = 600,
+        blob_storage: Optional[BlobStorage] = None
+    ):
+        """
+        初始化细化描述任务管理器：在独立的有界线程池中调用大模型，不占用Web服务器的请求线程
+
+        Args:
+            image_analyzer: 图片分析器实例
+            db_manager: 数据库管理器实例
+            max_workers: 同时调用大模型的线程数
+            max_pending: 未完成任务数量上限，超出时拒绝新任务
+            result_ttl: 已结束任务保留多久（秒）供客户端查询
+            blob_storage: 图片存储后端，默认为当前目录下的本地存储
+        """
+        self.logger = setup_logger("describe_jobs")
+        self.image_analyzer = image_analyzer
+        self.db_manager = db_manager
+        self.max_pending = max_pending
+        self.result_ttl = result_ttl
+        self.blob_storage = blob_storage or LocalBlobStorage()
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="describe")
+        self._lock = threading.Lock()
+        # 任务结束时通知等待结果的请求
+        self._finished = threading.Condition(self._lock)
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        # image_id -> 未结束的job_id，同一张图片的重复请求合并为一个任务
+        self._active: Dict[str, str] = {}
+
+    def submit(self, image_id: str, image_path: str) -> Optional[Dict[str, Any]]:
+        """
+        提交细化描述任务，同一张图片已有未结束的任务时直接返回该任务
+
+        Args:
+            image_id: 图片ID
+            image_path: 图片存储路径
+
+        Returns:
+            Optional[Dict[str, Any]]: 任务状态，未完成任务过多时返回None
+        """
+        with self._lock:
+            self._prune()
+            job_id = self._active.get(image_id)
+            if job_id is not None:
+                return dict(self._jobs[job_id])
+            if len(self._active) >= self.max_pending:
+                return None
+
+            job_id = uuid.uuid4().hex
+            job = {
+                'job_id': job_id,
+                'image_id': image_id,
+                'status': STATUS_PENDING,
+                'data': None,
+                'message': None,
+                'finished_at': None
+            }
+            self._jobs[job_id] = job
+            self._active[image_id] = job_id
+            snapshot = dict(job)
+
+        self._executor.submit(self._run, job_id, image_path)
+        return snapshot
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        查询任务状态
+
+        Args:
+            job_id: 任务ID
+
+        Returns:
+            Optional[Dict[str, Any]]: 任务状态，包含status、data（细化描述）和message，任务不存在或已过期时返回None
+        """
+        with self._lock:
+            self._prune()
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def wait(self, job_id: str, timeout: float) -> Optional[Dict[str, Any]]:
+        """
+        等待任务结束
+
+        Args:
+            job_id: 任务ID
+            timeout: 最长等待时间（秒）
+
+        Returns:
+            Optional[Dict[str, Any]]: 任务状态，超时时status仍为pending或running，任务不存在或已过期时返回None
+        """
+        deadline = time.monotonic() + timeout
+        with self._finished:
+            while True:
+                job = self._jobs.get(job_id)
+                if job is None or job['finished_at'] is not None:
+                    return dict(job) if job else None
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return dict(job)
+                self._finished.wait(remaining)
+
+    def _run(self, job_id: str, image_path: str):
+        with self._lock:
+            job = self._jobs[job_id]
+            job['status'] = STATUS_RUNNING
+            image_id = job['image_id']
+
+        description = None
+        try:
+            with self.blob_storage.open_local(image_path) as local_path:
+                if local_path is None:
+                    raise FileNotFoundError(image_path)
+                description = self.image_analyzer.describe_image(local_path)
+            if description is not None:
+                self.db_manager.save_detail_description(image_id, description, DETAIL_VERSION)
+        except Exception as e:
+            self.logger.error("细化描述失败: %s, 错误: %s", image_id, e)
+            description = None
+
+        with self._lock:
+            if description is None:
+                job['status'] = STATUS_FAILED
+                job['message'] = 'Failed to analyze image'
+            else:
+                job['status'] = STATUS_DONE
+                job['data'] = description
+            job['finished_at'] = time.monotonic()
+            self._active.pop(image_id, None)
+            self._finished.notify_all()
+
+    def _prune(self):
+        # 调用方已持有self._lock
+        deadline = time.monotonic() - self.result_ttl
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job['finished_at'] is not None and job['finished_at'] < deadline]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def shutdown(self):
+        """
+        停止线程池，等待正在执行的任务结束
+        """
+        self._executor.shutdown(wait=True)
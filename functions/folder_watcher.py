@@ -0,0 +1,226 @@
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from typing import Callable, Dict, Iterable, Optional, Tuple
+from .logger_config import setup_logger
+
+# inotify 事件掩码，见 <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+EVENT_HEADER = struct.Struct("iIII")
+
+
+class _Inotify:
+    def __init__(self):
+        """
+        通过 ctypes 调用 libc 的 inotify 接口，当前系统不支持时抛出 OSError
+        """
+        if not sys.platform.startswith("linux"):
+            raise OSError("inotify is only available on Linux")
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.paths: Dict[int, str] = {}
+
+    def add_watch(self, path: str):
+        wd = self._add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), f"inotify_add_watch failed: {path}")
+        self.paths[wd] = path
+
+    def read_events(self) -> Iterable[Tuple[str, int]]:
+        """
+        读取已到达的事件
+
+        Returns:
+            Iterable[Tuple[str, int]]: (完整路径, 事件掩码)
+        """
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            if mask & IN_IGNORED:
+                self.paths.pop(wd, None)
+                continue
+            directory = self.paths.get(wd)
+            if mask & IN_Q_OVERFLOW or directory is None:
+                yield "", mask
+                continue
+            yield os.path.join(directory, os.fsdecode(name)), mask
+
+    def close(self):
+        os.close(self.fd)
+
+
+class FolderWatcher:
+    def __init__(
+        self,
+        folder: str,
+        on_file: Callable[[str], None],
+        extensions: Iterable[str],
+        settle_seconds: float = 2.0,
+        poll_interval: float = 2.0,
+        use_inotify: bool = True
+    ):
+        """
+        初始化文件夹监听器：发现新的图片文件后，等待文件写入完成再交给on_file处理
+
+        Linux 上使用 inotify，空闲时阻塞等待事件；其他系统或 inotify 不可用时定期扫描文件夹。
+
+        Args:
+            folder: 监听的文件夹（包括子文件夹）
+            on_file: 文件写入完成后的回调，参数为文件路径
+            extensions: 需要处理的文件扩展名（小写，带点）
+            settle_seconds: 文件大小和修改时间保持不变多久后视为写入完成
+            poll_interval: 轮询模式下的扫描间隔（秒）
+            use_inotify: 是否尝试使用 inotify
+        """
+        self.logger = setup_logger("folder_watcher")
+        self.folder = folder
+        self.on_file = on_file
+        self.extensions = set(extensions)
+        self.settle_seconds = settle_seconds
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify
+        # 等待写入完成的文件: 路径 -> (大小, 修改时间, 最近一次变化的时间)
+        self._pending: Dict[str, Tuple[int, float, float]] = {}
+        # 已交给回调处理的文件: 路径 -> (大小, 修改时间)，内容变化后会再次处理
+        self._handled: Dict[str, Tuple[int, float]] = {}
+        self._inotify: Optional[_Inotify] = None
+
+    def run(self, stop_event: Optional[threading.Event] = None):
+        """
+        开始监听，直到stop_event被设置。启动时文件夹中已有的文件也会被处理一次
+
+        Args:
+            stop_event: 停止信号
+        """
+        stop_event = stop_event or threading.Event()
+        if self.use_inotify:
+            try:
+                self._inotify = _Inotify()
+            except OSError as e:
+                self.logger.warning("inotify 不可用，改为每 %s 秒扫描一次: %s", self.poll_interval, e)
+
+        try:
+            # inotify模式下先注册监听再扫描，避免遗漏扫描期间写入的文件
+            self._scan(self.folder, add_watches=self._inotify is not None)
+            self.logger.info("开始监听文件夹: %s（%s）", self.folder, 'inotify' if self._inotify else '轮询')
+            while not stop_event.is_set():
+                if self._inotify is not None:
+                    self._wait_inotify(stop_event)
+                else:
+                    stop_event.wait(self._pending_timeout() or self.poll_interval)
+                    self._scan(self.folder, add_watches=False)
+                self._dispatch_settled()
+        finally:
+            if self._inotify is not None:
+                self._inotify.close()
+                self._inotify = None
+
+    def _wait_inotify(self, stop_event: threading.Event):
+        # 没有等待写入完成的文件时每秒检查一次停止信号，此外不做任何工作
+        timeout = self._pending_timeout() or 1.0
+        readable, _, _ = select.select([self._inotify.fd], [], [], timeout)
+        if not readable or stop_event.is_set():
+            return
+        for path, mask in self._inotify.read_events():
+            if mask & IN_Q_OVERFLOW or not path:
+                # 事件队列溢出时重新扫描，保证不遗漏文件
+                self.logger.warning("inotify 事件队列溢出，重新扫描文件夹")
+                self._scan(self.folder, add_watches=True)
+            elif mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    self._scan(path, add_watches=True)
+            else:
+                self._observe(path)
+
+    def _pending_timeout(self) -> Optional[float]:
+        if not self._pending:
+            return None
+        return max(0.05, min(self.settle_seconds / 2, self.poll_interval))
+
+    def _scan(self, directory: str, add_watches: bool):
+        if directory == self.folder:
+            self._prune_handled()
+        pending_dirs = [directory]
+        while pending_dirs:
+            current = pending_dirs.pop()
+            if add_watches:
+                try:
+                    self._inotify.add_watch(current)
+                except OSError as e:
+                    self.logger.error("监听文件夹失败: %s, 错误: %s", current, e)
+            try:
+                with os.scandir(current) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            pending_dirs.append(entry.path)
+                        elif entry.is_file():
+                            self._observe(entry.path)
+            except OSError as e:
+                self.logger.error("扫描文件夹失败: %s, 错误: %s", current, e)
+
+    def _prune_handled(self):
+        # 已处理的文件通常会被移入pictures目录，不再需要记录
+        for path in list(self._handled):
+            if not os.path.exists(path):
+                del self._handled[path]
+
+    def _observe(self, path: str):
+        if os.path.splitext(path)[1].lower() not in self.extensions:
+            return
+        try:
+            stat = os.stat(path)
+        except OSError:
+            # 文件已被移走或删除
+            self._pending.pop(path, None)
+            self._handled.pop(path, None)
+            return
+        signature = (stat.st_size, stat.st_mtime)
+        if self._handled.get(path) == signature:
+            return
+        previous = self._pending.get(path)
+        if previous is None or previous[:2] != signature:
+            self._pending[path] = (signature[0], signature[1], time.monotonic())
+
+    def _dispatch_settled(self):
+        now = time.monotonic()
+        for path, (size, mtime, changed_at) in list(self._pending.items()):
+            # 重新检查大小和修改时间，仍在写入的文件会推迟处理
+            self._observe(path)
+            current = self._pending.get(path)
+            if current is None:
+                continue
+            if current[:2] != (size, mtime) or now - changed_at < self.settle_seconds:
+                continue
+            del self._pending[path]
+            if len(self._handled) >= 10000:
+                self._prune_handled()
+            self._handled[path] = (size, mtime)
+            try:
+                self.on_file(path)
+            except Exception as e:
+                self.logger.error("处理新文件失败: %s, 错误: %s", path, e)
@@ -0,0 +1,177 @@
+import math
+import time
+from typing import Any, Dict, Iterable, List, Optional
+from .database import DatabaseManager
+from .logger_config import setup_logger
+
+# 消息速率与图片速率的平滑时间窗口（秒）：越早的轮询结果权重按指数衰减
+RATE_WINDOW = 3 * 3600
+
+
+class GroupScheduler:
+    def __init__(
+        self,
+        db_manager: DatabaseManager,
+        min_interval: float = 60.0,
+        max_interval: float = 7200.0,
+        backoff: float = 2.0,
+        target_images: float = 1.0,
+        max_messages: int = 300,
+        yield_days: float = 7.0
+    ):
+        """
+        常驻模式下按群调整轮询间隔：根据各群的消息速率、图片速率和近期MC图片产出率，
+        估计每个群平均多久出现一张MC图片，间隔取为出现 target_images 张所需的时间。
+        间隔变短时立即生效（发现图片时至少缩短为原来的 1/backoff），变长时每次最多乘以 backoff，
+        长期没有图片的群指数退避到 max_interval。
+
+        Args:
+            db_manager: 数据库管理器，轮询计划保存在group_schedule表中
+            min_interval: 最短轮询间隔（秒）
+            max_interval: 最长轮询间隔（秒）
+            backoff: 间隔每次增长（或发现图片时缩短）的倍数
+            target_images: 每次轮询期望拉取到的MC图片数
+            max_messages: 每次轮询期望拉取的最多消息数，消息很多的群不会因为没有图片而间隔过长
+            yield_days: 统计MC图片产出率使用最近多少天入队的图片
+        """
+        self.db_manager = db_manager
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self.backoff = max(1.0, backoff)
+        self.target_images = target_images
+        self.max_messages = max_messages
+        self.yield_days = yield_days
+        self.logger = setup_logger("group_scheduler")
+        self._schedules: Dict[str, Dict[str, Any]] = {}
+        self._yields: Dict[str, float] = {}
+
+    def sync(self, group_ids: Iterable[str], now: Optional[float] = None):
+        """
+        按最新的群列表更新轮询计划：新加入的群立即轮询，已退出的群不再轮询，
+        并重新统计各群近期的MC图片产出率
+
+        Args:
+            group_ids: 当前的群ID列表
+            now: 当前时间（Unix时间戳），默认为time.time()
+        """
+        now = time.time() if now is None else now
+        saved = self.db_manager.get_group_schedules()
+        schedules = {}
+        for group_id in group_ids:
+            schedules[group_id] = self._schedules.get(group_id) or saved.get(group_id) or {
+                "interval": self.min_interval,
+                "next_poll_at": now,
+                "last_polled_at": None,
+                "message_rate": 0.0,
+                "image_rate": 0.0,
+                "empty_polls": 0
+            }
+        self._schedules = schedules
+        self.refresh_yields(now)
+
+    def refresh_yields(self, now: Optional[float] = None):
+        """
+        从图片任务和图片表重新统计各群近期入库为MC图片的比例
+        """
+        now = time.time() if now is None else now
+        yields = self.db_manager.get_group_yields(now - self.yield_days * 86400)
+        # 加1平滑：没有处理过图片的群按一半估计，不会因为样本太少被判定为没有产出
+        self._yields = {group_id: (mc_images + 1) / (processed + 2) for group_id, (processed, mc_images) in yields.items()}
+
+    def due(self, now: Optional[float] = None) -> List[str]:
+        """
+        获取已到轮询时间的群，最早到期的排在前面
+
+        Returns:
+            List[str]: 群ID列表
+        """
+        now = time.time() if now is None else now
+        due = [(schedule["next_poll_at"], group_id) for group_id, schedule in self._schedules.items() if schedule["next_poll_at"] <= now]
+        return [group_id for _, group_id in sorted(due)]
+
+    def next_due_in(self, now: Optional[float] = None) -> Optional[float]:
+        """
+        距离下一个群到期还需等待的秒数
+
+        Returns:
+            Optional[float]: 秒数，已有群到期时为0，没有群时返回None
+        """
+        if not self._schedules:
+            return None
+        now = time.time() if now is None else now
+        return max(0.0, min(schedule["next_poll_at"] for schedule in self._schedules.values()) - now)
+
+    def record_poll(self, group_id: str, message_times: List[int], images: int, now: Optional[float] = None) -> float:
+        """
+        记录一次轮询的结果，更新该群的速率估计并安排下一次轮询
+
+        Args:
+            group_id: 群ID
+            message_times: 本次拉取到的消息的发送时间（Unix时间戳）
+            images: 本次新增的图片任务数
+            now: 轮询完成的时间（Unix时间戳），默认为time.time()
+
+        Returns:
+            float: 下一次轮询的间隔（秒）
+        """
+        now = time.time() if now is None else now
+        schedule = self._schedules.get(group_id)
+        if schedule is None:
+            return self.min_interval
+        messages = len(message_times)
+
+        # 两次轮询之间的时间；第一次轮询以拉取到的最早一条消息为起点
+        if schedule["last_polled_at"] is not None:
+            elapsed = now - schedule["last_polled_at"]
+            weight = 1 - math.exp(-elapsed / RATE_WINDOW)
+        else:
+            elapsed = now - min(message_times) if message_times else 0
+            weight = 1.0
+        if elapsed > 0:
+            schedule["message_rate"] += weight * (messages / elapsed - schedule["message_rate"])
+            schedule["image_rate"] += weight * (images / elapsed - schedule["image_rate"])
+
+        interval = self._next_interval(group_id, schedule, images)
+        schedule["interval"] = interval
+        schedule["last_polled_at"] = now
+        schedule["next_poll_at"] = now + interval
+        schedule["empty_polls"] = schedule["empty_polls"] + 1 if messages == 0 else 0
+        self.db_manager.save_group_schedule(group_id, schedule)
+        self.logger.debug(
+            "群 %s: 消息 %s 条，新增图片 %s 张，消息速率 %.2f/时，图片速率 %.2f/时，下次轮询间隔 %.0f 秒",
+            group_id, messages, images, schedule["message_rate"] * 3600, schedule["image_rate"] * 3600, interval
+        )
+        return interval
+
+    def _next_interval(self, group_id: str, schedule: Dict[str, Any], images: int) -> float:
+        # 平均每秒出现的MC图片数
+        expected = schedule["image_rate"] * self._yields.get(group_id, 0.5)
+        target = self.target_images / expected if expected > 0 else self.max_interval
+        if schedule["message_rate"] > 0:
+            target = min(target, self.max_messages / schedule["message_rate"])
+
+        interval = schedule["interval"]
+        if images > 0:
+            interval = min(target, interval / self.backoff)
+        elif target < interval:
+            interval = target
+        else:
+            interval = min(target, interval * self.backoff)
+        return min(self.max_interval, max(self.min_interval, interval))
+
+    def summary(self) -> Dict[str, int]:
+        """
+        按轮询间隔统计群的数量，用于日志输出
+
+        Returns:
+            Dict[str, int]: active 为以最短间隔轮询的群数，dormant 为以最长间隔轮询的群数，other 为其余
+        """
+        counts = {"active": 0, "dormant": 0, "other": 0}
+        for schedule in self._schedules.values():
+            if schedule["interval"] <= self.min_interval:
+                counts["active"] += 1
+            elif schedule["interval"] >= self.max_interval:
+                counts["dormant"] += 1
+            else:
+                counts["other"] += 1
+        return counts
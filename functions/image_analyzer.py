@@ -2,6 +2,36 @@ import requests
 import json
 from typing import Dict, Any, Optional
 from .logger_config import setup_logger
+from .metrics import metrics
+from .labels import MODEL, CLASSIFY_PROMPT_VERSION, DESCRIBE_PROMPT_VERSION, LABEL_VERSION, DETAIL_VERSION, CATEGORIES
+
+
+CLASSIFY_PROMPT = """
+你是专业的图片分析人士，核心任务是：1. 判断图片是否为《我的世界》（Minecraft）相关图片；2. 按要求格式输出结果。
+
+### 关键规则（必须严格遵守）：
+1. 格式要求：仅返回JSON字符串，无任何额外文字、解释、注释或格式修饰（如代码块、引号嵌套错误等），字段不可缺失、不可新增。
+2. 分类约束：category字段仅能从以下47个选项中选择，无匹配项时强制选「其他」，严禁超出范围：
+""" + "".join(f"- {category}\n" for category in CATEGORIES) + """
+3. 判断依据：
+   - 是《我的世界》图片：需包含游戏核心特征（方块像素风格、游戏内特有场景/物品/生物、玩家搭建的建筑等）；
+   - 非《我的世界》图片：无上述核心特征，直接判定is_mc_pic为false，category固定填「其他」。
+
+### 输出字段说明：
+- is_mc_pic：布尔值（true/false），仅判断是否为《我的世界》相关图片；
+- category：严格遵循上述47个选项，非《我的世界》图片统一填「其他」；
+- description：简洁描述图片核心内容（如"《我的世界》中由方块搭建的中式宫殿，带飞檐和庭院""现实中的现代公寓照片，无游戏相关元素"），10-50字为宜。
+
+### 示例（仅作参考，需按实际图片输出）：
+示例1（是MC图-古代中式风格）：
+{"is_mc_pic":true,"category":"古代中式风格","description":"《我的世界》中玩家搭建的中式四合院，有青砖黛瓦和月亮门"}
+
+示例2（是MC图-其他风格）：
+{"is_mc_pic":true,"category":"其他","description":"《我的世界》中由红石元件组成的自动农场，含活塞和水流装置"}
+
+示例3（非MC图）：
+{"is_mc_pic":false,"category":"其他","description":"现实中的哥特式教堂照片，石质结构和尖顶设计"}
+"""
 
 
 class ImageAnalyzer:
@@ -17,6 +47,32 @@ class ImageAnalyzer:
         self.api_key = api_key
         self.api_url = api_url
 
+    def _post(self, kind: str, headers: Dict[str, str], payload: Dict[str, Any], timeout: Optional[float] = None) -> requests.Response:
+        """
+        发送请求并记录耗时、HTTP状态和接口返回的token用量
+        
+        Args:
+            kind: 请求类型，classify 或 describe
+            headers: 请求头
+            payload: 请求体
+            timeout: 请求超时时间（秒）
+        
+        Returns:
+            requests.Response: 响应对象
+        """
+        with metrics.timer("llm_request_seconds", kind=kind, status="ok") as labels:
+            response = requests.post(self.api_url, headers=headers, json=payload, timeout=timeout)
+            labels["status"] = str(response.status_code)
+        if response.ok:
+            try:
+                usage = response.json().get("usage") or {}
+            except ValueError:
+                usage = {}
+            for token_type in ("prompt_tokens", "completion_tokens"):
+                if usage.get(token_type):
+                    metrics.inc("llm_tokens_total", usage[token_type], kind=kind, type=token_type.split("_")[0])
+        return response
+
     def analyze_image(self, image_url: str) -> Optional[Dict[str, Any]]|int:
         """
         分析图片内容，判断是否为Minecraft相关图片
@@ -82,83 +138,11 @@ class ImageAnalyzer:
         }
 
         payload = {
-            "model": "glm-4.6v-flash",
+            "model": MODEL,
             "messages": [
                 {
                     "role": "system",
-                    "content": """
-你是专业的图片分析人士，核心任务是：1. 判断图片是否为《我的世界》（Minecraft）相关图片；2. 按要求格式输出结果。
-
-### 关键规则（必须严格遵守）：
-1. 格式要求：仅返回JSON字符串，无任何额外文字、解释、注释或格式修饰（如代码块、引号嵌套错误等），字段不可缺失、不可新增。
-2. 分类约束：category字段仅能从以下47个选项中选择，无匹配项时强制选「其他」，严禁超出范围：
-- 内饰
-- 自然废墟
-- 废土/后启示录
-- 奇幻中式建筑
-- 小比例中式写实建筑
-- 大比例中式写实建筑
-- 日式建筑
-- 乡野建筑
-- 体素艺术
-- 工厂建筑
-- 工业巨构
-- 树木
-- 罗马式欧式建筑
-- 哥特式欧式建筑
-- 巴洛克式欧式建筑
-- 中世纪式欧式建筑
-- 新奥斯曼式欧式建筑
-- 维多利亚式欧式建筑
-- 蒸汽朋克风格
-- 现代街区
-- 玻璃幕墙摩天楼
-- 日式现代城市
-- 中式现代城市
-- 交通基础设施
-- 道路与桥梁
-- 大型地形场景
-- 赛博朋克大型场景
-- 赛博朋克建筑
-- 赛博朋克街区
-- 粗野主义建筑
-- 东南亚风格建筑
-- 波斯风格建筑
-- 伊斯兰风格建筑
-- 玛雅-阿兹特克/美洲原住民建筑
-- 古埃及建筑
-- 童话/奇幻风格建筑
-- 自然野性建筑
-- 未来主义
-- 太空建筑
-- 车辆载具
-- 科幻载具
-- 大型机器人
-- 自然地形
-- 雕塑
-- 旗帜和图案
-- 仿真建筑
-- 其他
-
-3. 判断依据：
-   - 是《我的世界》图片：需包含游戏核心特征（方块像素风格、游戏内特有场景/物品/生物、玩家搭建的建筑等）；
-   - 非《我的世界》图片：无上述核心特征，直接判定is_mc_pic为false，category固定填「其他」。
-
-### 输出字段说明：
-- is_mc_pic：布尔值（true/false），仅判断是否为《我的世界》相关图片；
-- category：严格遵循上述47个选项，非《我的世界》图片统一填「其他」；
-- description：简洁描述图片核心内容（如"《我的世界》中由方块搭建的中式宫殿，带飞檐和庭院""现实中的现代公寓照片，无游戏相关元素"），10-50字为宜。
-
-### 示例（仅作参考，需按实际图片输出）：
-示例1（是MC图-古代中式风格）：
-{"is_mc_pic":true,"category":"古代中式风格","description":"《我的世界》中玩家搭建的中式四合院，有青砖黛瓦和月亮门"}
-
-示例2（是MC图-其他风格）：
-{"is_mc_pic":true,"category":"其他","description":"《我的世界》中由红石元件组成的自动农场，含活塞和水流装置"}
-
-示例3（非MC图）：
-{"is_mc_pic":false,"category":"其他","description":"现实中的哥特式教堂照片，石质结构和尖顶设计"}
-"""
+                    "content": CLASSIFY_PROMPT
                 },
                 {
                     "role": "user",
@@ -173,10 +157,10 @@ class ImageAnalyzer:
         }
 
         try:
-            response = requests.post(self.api_url, headers=headers, json=payload)
+            response = self._post("classify", headers, payload)
             if response.status_code == 400:
                 # 这种情况一般是 动图，或者不合法的图片，前者大模型不支持，后者大模型会报错。而且GIF动图和普通的图片无法从消息体进行区分。
-                self.logger.error(f"图片不合法，大模型返回：\n状态码: {response.status_code}\n响应内容: {response.text}\n") 
+                self.logger.error("图片不合法，大模型返回：\n状态码: %s\n响应内容: %s\n", response.status_code, response.text) 
                 # 这种情况下就不要引发错误，重试了。
                 return -1
             response.raise_for_status()
@@ -203,24 +187,27 @@ class ImageAnalyzer:
             return None
             
         except requests.exceptions.RequestException as e:
-            self.logger.error(f"分析图片失败: {e}")
+            self.logger.error("分析图片失败: %s", e)
             return None
 
-    def describe_image(self, image_path: str) -> str|None:
+    def describe_image(self, image_path: str, timeout: float = 120) -> str|None:
         """
         分析图片并返回更加细致的描述。
 
         Args:
             image_path: 图片绝对路径
+            timeout: 请求超时时间（秒）
         
         Returns:
             图片的详细描述，或者None
         """
-        import base64
-
-        # 读取图片，转换为base64编码
-        with open(image_path, "rb") as image_file:
-            base64_image = base64.b64encode(image_file.read()).decode("utf-8")
+        # 缩放后编码为JPEG，避免发送完整的原图。Pillow 在此时才导入
+        from .cache import encode_for_analysis
+        base64_image = encode_for_analysis(image_path)
+        if base64_image is None:
+            # 动图或无法解码的图片，大模型同样不支持
+            self.logger.error("图片无法用于细化描述: %s", image_path)
+            return None
         
         headers = {
                     "Authorization": f"Bearer {self.api_key}",
@@ -228,7 +215,7 @@ class ImageAnalyzer:
                 }
 
         payload = {
-            "model": "glm-4.6v-flash",
+            "model": MODEL,
             "messages": [
                 {
                     "role": "system",
@@ -269,7 +256,7 @@ class ImageAnalyzer:
                         {
                             "type": "image_url",
                             "image_url": {
-                                "url": base64_image
+                                "url": f"data:image/jpeg;base64,{base64_image}"
                             }
                         }
                     ]
@@ -280,10 +267,10 @@ class ImageAnalyzer:
             }
         }
         try:
-            response = requests.post(self.api_url, headers=headers, json=payload)
+            response = self._post("describe", headers, payload, timeout)
             if response.status_code == 400:
                 # 这种情况一般是 动图，或者不合法的图片，前者大模型不支持，后者大模型会报错。而且GIF动图和普通的图片无法从消息体进行区分。
-                self.logger.error(f"图片不合法，大模型返回：\n状态码: {response.status_code}\n响应内容: {response.text}\n图片地址: {image_path}\n") 
+                self.logger.error("图片不合法，大模型返回：\n状态码: %s\n响应内容: %s\n图片地址: %s\n", response.status_code, response.text, image_path) 
                 # 这种情况下就不要引发错误，重试了。
                 return None
             response.raise_for_status()
@@ -296,5 +283,5 @@ class ImageAnalyzer:
             return None
             
         except requests.exceptions.RequestException as e:
-            self.logger.error(f"分析图片失败: {e}")
+            self.logger.error("分析图片失败: %s", e)
             return None
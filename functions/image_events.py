@@ -0,0 +1,205 @@
+import queue
+import threading
+import time
+from typing import Iterator, List, Optional, Tuple
+from .database import DatabaseManager
+from .logger_config import setup_logger
+from .metrics import metrics
+from . import json_codec
+
+
+class Subscription:
+    def __init__(self, queue_size: int):
+        """
+        一个客户端连接的订阅：广播线程把编码好的SSE消息放入队列，请求线程取出并发送。
+        队列中的None表示连接需要关闭（客户端处理过慢），客户端重连后按event_id续传
+
+        Args:
+            queue_size: 队列容量
+        """
+        self.queue: "queue.Queue[Optional[bytes]]" = queue.Queue(maxsize=queue_size)
+
+
+class ImageEventBroadcaster:
+    def __init__(
+        self,
+        db_manager: DatabaseManager,
+        poll_interval: float = 1.0,
+        max_subscribers: int = 5,
+        queue_size: int = 1000,
+        batch_size: int = 500,
+        retention: float = 86400.0
+    ):
+        """
+        将image_events表中的图片变更推送给所有订阅的客户端：一个后台线程按event_id增量读取变更记录，
+        每条记录只查询、编码一次后放入各订阅者的队列。没有订阅者时不查询数据库。
+
+        图片由 main.py、ws_server.py 等其他进程写入，变更记录由images表上的触发器与图片记录在同一个事务中写入，
+        因此读取到的记录都已提交。
+
+        Args:
+            db_manager: 数据库管理器
+            poll_interval: 读取变更记录的间隔（秒）
+            max_subscribers: 同时订阅的客户端数量上限，每个连接占用一个Web服务器线程
+            queue_size: 每个订阅者最多缓存的消息数，超出时断开该连接
+            batch_size: 每次读取的变更记录数，也是客户端重连时最多补发的记录数
+            retention: 变更记录保留时间（秒），更早的记录被定期清理
+        """
+        self.logger = setup_logger("image_events")
+        self.db_manager = db_manager
+        self.poll_interval = poll_interval
+        self.max_subscribers = max_subscribers
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.retention = retention
+        self._lock = threading.Lock()
+        self._subscribers: List[Subscription] = []
+        # 已广播的最新event_id
+        self._last_id = 0
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def subscribe(self, last_event_id: Optional[int] = None) -> Optional[Subscription]:
+        """
+        添加订阅者
+
+        Args:
+            last_event_id: 客户端重连时收到的最后一个event_id，补发之后的变更；
+                为None时只推送订阅之后的变更。无法补发（记录已被清理或过多）时发送reset事件
+
+        Returns:
+            Optional[Subscription]: 订阅，订阅者数量达到上限时返回None
+        """
+        with self._lock:
+            if len(self._subscribers) >= self.max_subscribers:
+                return None
+            if not self._subscribers:
+                # 没有订阅者期间广播线程不读取变更记录，从数据库中的最新记录开始
+                self._last_id = max(self._last_id, self.db_manager.get_image_event_range()[1])
+            self._start()
+            subscription = Subscription(self.queue_size)
+            if last_event_id is None:
+                subscription.queue.put_nowait(b'id: %d\n\n' % self._last_id)
+            elif last_event_id != self._last_id:
+                self._backfill(subscription, last_event_id)
+            self._subscribers.append(subscription)
+            metrics.set("events_subscribers", len(self._subscribers))
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        """
+        移除订阅者，连接关闭时调用
+        """
+        with self._lock:
+            if subscription in self._subscribers:
+                self._subscribers.remove(subscription)
+            metrics.set("events_subscribers", len(self._subscribers))
+
+    def stream(self, subscription: Subscription, keepalive: float = 15.0, retry_ms: int = 3000) -> Iterator[bytes]:
+        """
+        生成发送给客户端的SSE字节流，连接关闭时自动取消订阅
+
+        Args:
+            subscription: subscribe 返回的订阅
+            keepalive: 没有变更时发送注释行的间隔（秒），用于及时发现已断开的连接
+            retry_ms: 客户端断线后重连的等待时间（毫秒）
+        """
+        try:
+            yield b'retry: %d\n\n' % retry_ms
+            while True:
+                try:
+                    chunk = subscription.queue.get(timeout=keepalive)
+                except queue.Empty:
+                    yield b': keepalive\n\n'
+                    continue
+                if chunk is None:
+                    return
+                yield chunk
+        finally:
+            self.unsubscribe(subscription)
+
+    def stop(self):
+        """
+        停止广播线程
+        """
+        self._stop.set()
+
+    def _start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="image_events", daemon=True)
+            self._thread.start()
+
+    def _backfill(self, subscription: Subscription, last_event_id: int):
+        oldest, _ = self.db_manager.get_image_event_range()
+        events = []
+        if last_event_id < self._last_id and oldest and last_event_id >= oldest - 1:
+            events = [event for event in self.db_manager.get_image_events(last_event_id, self.batch_size + 1) if event[0] <= self._last_id]
+        if not events or len(events) > self.batch_size:
+            # 中间的记录已被清理、断开太久或数据库已更换，客户端需要重新加载列表
+            subscription.queue.put_nowait(b'id: %d\nevent: reset\ndata: {}\n\n' % self._last_id)
+            return
+        for _, chunk in self._encode(events):
+            subscription.queue.put_nowait(chunk)
+
+    def _encode(self, events: List[Tuple[int, str, str]]) -> List[Tuple[int, bytes]]:
+        inserted = [image_id for _, image_id, kind in events if kind == 'insert']
+        records = {record['image_id']: record for record in self.db_manager.get_images_by_ids(inserted)} if inserted else {}
+        chunks = []
+        for event_id, image_id, kind in events:
+            if kind == 'insert':
+                record = records.get(image_id)
+                if record is None:
+                    # 入库后又被删除，之后的delete事件会通知客户端
+                    continue
+                chunks.append((event_id, b'id: %d\nevent: image\ndata: ' % event_id + json_codec.dumps_bytes(record) + b'\n\n'))
+            else:
+                chunks.append((event_id, b'id: %d\nevent: delete\ndata: ' % event_id + json_codec.dumps_bytes({'image_id': image_id}) + b'\n\n'))
+        return chunks
+
+    def _run(self):
+        next_prune = 0.0
+        while not self._stop.wait(self.poll_interval):
+            try:
+                if time.time() >= next_prune:
+                    deleted = self.db_manager.prune_image_events(time.time() - self.retention)
+                    if deleted:
+                        self.logger.info("清理了 %s 条过期的图片变更记录", deleted)
+                    next_prune = time.time() + 3600
+                with self._lock:
+                    if not self._subscribers:
+                        continue
+                    last_id = self._last_id
+                # 一次读取的记录数达到上限时继续读取，直到追上最新记录
+                while self._poll(last_id) >= self.batch_size:
+                    last_id = self._last_id
+            except Exception as e:
+                self.logger.error("读取图片变更记录失败: %s", e)
+
+    def _poll(self, last_id: int) -> int:
+        events = self.db_manager.get_image_events(last_id, self.batch_size)
+        if not events:
+            return 0
+        chunks = self._encode(events)
+        with self._lock:
+            # 读取期间新订阅者可能已经把起点移到了更新的记录
+            chunks = [chunk for event_id, chunk in chunks if event_id > self._last_id]
+            self._last_id = max(self._last_id, events[-1][0])
+            for subscription in list(self._subscribers):
+                try:
+                    for chunk in chunks:
+                        subscription.queue.put_nowait(chunk)
+                except queue.Full:
+                    self._close(subscription)
+        metrics.inc("events_broadcast_total", len(events))
+        return len(events)
+
+    def _close(self, subscription: Subscription):
+        # 客户端处理过慢：丢弃缓存的消息并断开连接，客户端重连时从最后收到的event_id补发
+        self._subscribers.remove(subscription)
+        while True:
+            try:
+                subscription.queue.get_nowait()
+            except queue.Empty:
+                break
+        subscription.queue.put_nowait(None)
+        metrics.set("events_subscribers", len(self._subscribers))
@@ -0,0 +1,309 @@
+import sqlite3
+import json
+import time
+from typing import Optional, List, Dict, Any, Tuple
+from .metrics import metrics
+
+
+# 任务状态
+STATE_PENDING = "pending"
+STATE_IN_FLIGHT = "in_flight"
+STATE_DONE = "done"
+STATE_FAILED = "failed"
+
+
+class JobQueue:
+    def __init__(
+        self,
+        db_path: str = "picture_sniffer.db",
+        max_attempts: int = 4,
+        lease_seconds: int = 300,
+        retry_delay: float = 5.0
+    ):
+        """
+        初始化JobQueue实例，图片任务持久化保存在SQLite的image_jobs表中
+
+        Args:
+            db_path: SQLite数据库文件路径，默认为"picture_sniffer.db"
+            max_attempts: 单个任务的最大尝试次数，超过后标记为failed
+            lease_seconds: 任务租约时长（秒），超时未完成的任务会被重新领取
+            retry_delay: 失败重试的基础等待时间（秒），按指数退避增长
+        """
+        self.db_path = db_path
+        self.max_attempts = max_attempts
+        self.lease_seconds = lease_seconds
+        self.retry_delay = retry_delay
+        self.init_table()
+
+    def get_connection(self):
+        """
+        获取数据库连接。多个进程会同时领取任务，因此设置较长的锁等待时间
+
+        Returns:
+            sqlite3.Connection: 数据库连接对象
+        """
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    def init_table(self):
+        """
+        创建任务表及索引
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS image_jobs (
+                job_id TEXT PRIMARY KEY,
+                group_id TEXT,
+                payload TEXT,
+                state TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at REAL NOT NULL DEFAULT 0,
+                lease_until REAL,
+                worker_id TEXT,
+                last_error TEXT,
+                result TEXT,
+                created_at REAL,
+                updated_at REAL
+            )
+        ''')
+        cursor.execute(
+            'CREATE INDEX IF NOT EXISTS idx_image_jobs_state ON image_jobs (state, next_attempt_at)'
+        )
+        # 常驻模式按群统计近期任务的MC图片产出
+        cursor.execute(
+            'CREATE INDEX IF NOT EXISTS idx_image_jobs_group_created ON image_jobs (group_id, created_at)'
+        )
+
+        conn.commit()
+        conn.close()
+
+    @metrics.timed("db_seconds")
+    def enqueue(self, image_messages: List[Dict[str, Any]], group_cursor: Optional[Tuple[str, str]] = None) -> int:
+        """
+        将图片消息写入任务表。已存在的任务会被忽略
+
+        如果提供了group_cursor，会在同一个事务中更新群组的last_message_id，
+        保证“任务已入队”和“消息游标已前移”要么同时成功，要么同时失败。
+
+        Args:
+            image_messages: 图片消息列表，每项包含message_id、group_id、url等信息
+            group_cursor: (group_id, last_message_id)，可选
+
+        Returns:
+            int: 新加入的任务数量
+        """
+        now = time.time()
+        rows = [
+            (
+                str(msg["message_id"]),
+                str(msg.get("group_id", "")),
+                json.dumps(msg, ensure_ascii=False),
+                now,
+                now
+            )
+            for msg in image_messages
+        ]
+
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute('BEGIN IMMEDIATE')
+            before = conn.total_changes
+            cursor.executemany(
+                'INSERT OR IGNORE INTO image_jobs (job_id, group_id, payload, created_at, updated_at) VALUES (?, ?, ?, ?, ?)',
+                rows
+            )
+            added = conn.total_changes - before
+            if group_cursor is not None:
+                cursor.execute(
+                    'INSERT INTO groups (group_id, last_message_id) VALUES (?, ?) '
+                    'ON CONFLICT(group_id) DO UPDATE SET last_message_id = excluded.last_message_id',
+                    group_cursor
+                )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        return added
+
+    @metrics.timed("db_seconds")
+    def claim(self, worker_id: str, limit: int = 1) -> List[Dict[str, Any]]:
+        """
+        领取可执行的任务：状态为pending且已到重试时间，或租约已过期的in_flight任务
+
+        Args:
+            worker_id: 领取者标识（进程/线程）
+            limit: 最多领取的任务数量
+
+        Returns:
+            List[Dict[str, Any]]: 任务列表，每项包含job_id、attempts和原始图片消息payload
+        """
+        now = time.time()
+        conn = self.get_connection()
+        try:
+            cursor = conn.cursor()
+            # BEGIN IMMEDIATE 获取写锁，保证多个进程不会领取到同一个任务
+            cursor.execute('BEGIN IMMEDIATE')
+            cursor.execute(
+                '''
+                SELECT job_id, payload, attempts FROM image_jobs
+                WHERE (state = ? AND next_attempt_at <= ?)
+                   OR (state = ? AND lease_until < ?)
+                ORDER BY next_attempt_at
+                LIMIT ?
+                ''',
+                (STATE_PENDING, now, STATE_IN_FLIGHT, now, limit)
+            )
+            rows = cursor.fetchall()
+            cursor.executemany(
+                'UPDATE image_jobs SET state = ?, attempts = attempts + 1, lease_until = ?, worker_id = ?, updated_at = ? WHERE job_id = ?',
+                [(STATE_IN_FLIGHT, now + self.lease_seconds, worker_id, now, row[0]) for row in rows]
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+        return [{
+            'job_id': row[0],
+            'payload': json.loads(row[1]),
+            'attempts': row[2] + 1
+        } for row in rows]
+
+    def complete(self, job_id: str, result: str = ""):
+        """
+        标记任务完成
+
+        Args:
+            job_id: 任务ID
+            result: 处理结果（如saved、ignored、invalid等）
+        """
+        self.complete_many([(job_id, result)])
+
+    def complete_many(self, results: List[Tuple[str, str]], conn: Optional[sqlite3.Connection] = None):
+        """
+        批量标记任务完成
+
+        Args:
+            results: (job_id, result) 列表
+            conn: 可选的外部连接，提供时由调用方负责提交事务，
+                  用于和图片记录在同一个事务中写入
+        """
+        own_conn = conn is None
+        if own_conn:
+            conn = self.get_connection()
+        now = time.time()
+        conn.executemany(
+            'UPDATE image_jobs SET state = ?, result = ?, lease_until = NULL, updated_at = ? WHERE job_id = ?',
+            [(STATE_DONE, result, now, job_id) for job_id, result in results]
+        )
+        if own_conn:
+            conn.commit()
+            conn.close()
+
+    @metrics.timed("db_seconds")
+    def fail(self, job_id: str, attempts: int, error: str) -> bool:
+        """
+        记录任务失败。未达到最大尝试次数时按指数退避重新排队，否则标记为failed
+
+        Args:
+            job_id: 任务ID
+            attempts: 本次领取后的尝试次数
+            error: 错误信息
+
+        Returns:
+            bool: 任务会被重试返回True，已放弃返回False
+        """
+        now = time.time()
+        will_retry = attempts < self.max_attempts
+        if will_retry:
+            state = STATE_PENDING
+            next_attempt_at = now + self.retry_delay * (2 ** (attempts - 1))
+        else:
+            state = STATE_FAILED
+            next_attempt_at = now
+
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            'UPDATE image_jobs SET state = ?, next_attempt_at = ?, lease_until = NULL, last_error = ?, updated_at = ? WHERE job_id = ?',
+            (state, next_attempt_at, error, now, job_id)
+        )
+        conn.commit()
+        conn.close()
+        return will_retry
+
+    def release(self, worker_id: str):
+        """
+        将指定领取者持有的in_flight任务放回pending，用于进程正常退出或被中断时
+
+        Args:
+            worker_id: 领取者标识
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            'UPDATE image_jobs SET state = ?, attempts = MAX(attempts - 1, 0), lease_until = NULL, updated_at = ? WHERE state = ? AND worker_id = ?',
+            (STATE_PENDING, time.time(), STATE_IN_FLIGHT, worker_id)
+        )
+        conn.commit()
+        conn.close()
+
+    def next_due_in(self) -> Optional[float]:
+        """
+        距离下一个待执行任务可被领取还需等待的秒数
+
+        Returns:
+            Optional[float]: 等待秒数（已到期为0），没有待执行任务返回None
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            'SELECT MIN(next_attempt_at) FROM image_jobs WHERE state = ?',
+            (STATE_PENDING,)
+        )
+        result = cursor.fetchone()
+        conn.close()
+        if not result or result[0] is None:
+            return None
+        return max(0.0, result[0] - time.time())
+
+    def pending_count(self) -> int:
+        """
+        获取尚未完成的任务数量（pending和in_flight）
+
+        Returns:
+            int: 任务数量
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute(
+            'SELECT COUNT(*) FROM image_jobs WHERE state IN (?, ?)',
+            (STATE_PENDING, STATE_IN_FLIGHT)
+        )
+        result = cursor.fetchone()
+        conn.close()
+        return result[0]
+
+    def counts(self) -> Dict[str, int]:
+        """
+        按状态统计任务数量
+
+        Returns:
+            Dict[str, int]: 状态到数量的映射
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT state, COUNT(*) FROM image_jobs GROUP BY state')
+        results = cursor.fetchall()
+        conn.close()
+        counts = {STATE_PENDING: 0, STATE_IN_FLIGHT: 0, STATE_DONE: 0, STATE_FAILED: 0}
+        counts.update({row[0]: row[1] for row in results})
+        return counts
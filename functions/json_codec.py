@@ -0,0 +1,56 @@
+import json
+from typing import Any, Union
+
+# 可选依赖：安装 orjson 后使用更快的编码/解码实现，否则回退到标准库 json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps_bytes(obj: Any) -> bytes:
+    """
+    将对象编码为UTF-8 JSON字节串（紧凑格式，不转义中文）
+
+    Args:
+        obj: 待编码对象
+
+    Returns:
+        bytes: JSON字节串
+    """
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def dumps(obj: Any) -> str:
+    """
+    将对象编码为JSON字符串（紧凑格式，不转义中文）
+
+    Args:
+        obj: 待编码对象
+
+    Returns:
+        str: JSON字符串
+    """
+    if orjson is not None:
+        return orjson.dumps(obj).decode('utf-8')
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'))
+
+
+def loads(data: Union[str, bytes]) -> Any:
+    """
+    解码JSON字符串或字节串
+
+    Args:
+        data: JSON字符串或字节串
+
+    Returns:
+        Any: 解码后的对象
+
+    Raises:
+        ValueError: 不是合法的JSON（json.JSONDecodeError 与 orjson.JSONDecodeError 均为其子类）
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
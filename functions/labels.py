@@ -0,0 +1,58 @@
+# 使用的模型与提示词版本。修改 image_analyzer.py 中的提示词或下方的分类后递增对应版本，
+# 批量重新标注（python main.py --relabel）只处理版本不一致的图片
+MODEL = "glm-4.6v-flash"
+CLASSIFY_PROMPT_VERSION = 1
+DESCRIBE_PROMPT_VERSION = 1
+LABEL_VERSION = f"{MODEL}/classify-v{CLASSIFY_PROMPT_VERSION}"
+DETAIL_VERSION = f"{MODEL}/describe-v{DESCRIBE_PROMPT_VERSION}"
+
+# 图片分类，共47个选项，同时用于分类提示词和前端的分类筛选
+CATEGORIES = [
+    "内饰",
+    "自然废墟",
+    "废土/后启示录",
+    "奇幻中式建筑",
+    "小比例中式写实建筑",
+    "大比例中式写实建筑",
+    "日式建筑",
+    "乡野建筑",
+    "体素艺术",
+    "工厂建筑",
+    "工业巨构",
+    "树木",
+    "罗马式欧式建筑",
+    "哥特式欧式建筑",
+    "巴洛克式欧式建筑",
+    "中世纪式欧式建筑",
+    "新奥斯曼式欧式建筑",
+    "维多利亚式欧式建筑",
+    "蒸汽朋克风格",
+    "现代街区",
+    "玻璃幕墙摩天楼",
+    "日式现代城市",
+    "中式现代城市",
+    "交通基础设施",
+    "道路与桥梁",
+    "大型地形场景",
+    "赛博朋克大型场景",
+    "赛博朋克建筑",
+    "赛博朋克街区",
+    "粗野主义建筑",
+    "东南亚风格建筑",
+    "波斯风格建筑",
+    "伊斯兰风格建筑",
+    "玛雅-阿兹特克/美洲原住民建筑",
+    "古埃及建筑",
+    "童话/奇幻风格建筑",
+    "自然野性建筑",
+    "未来主义",
+    "太空建筑",
+    "车辆载具",
+    "科幻载具",
+    "大型机器人",
+    "自然地形",
+    "雕塑",
+    "旗帜和图案",
+    "仿真建筑",
+    "其他",
+]
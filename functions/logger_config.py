@@ -1,46 +1,272 @@
+import atexit
 import logging
 import os
-from logging.handlers import RotatingFileHandler
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Dict, Optional, Set, Tuple, Union
 
+DEFAULT_LOG_FILE = "logs/picture_sniffer.log"
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+LOG_DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
 
-def setup_logger(name: str = "picture_sniffer", log_file: str = "picture_sniffer.log", level: int = logging.INFO) -> logging.Logger:
+_lock = threading.RLock()
+# 本进程内所有日志记录器共享的队列，由唯一的写入线程（QueueListener）输出到控制台和文件
+_local_queue: "queue.SimpleQueue" = queue.SimpleQueue()
+_listener: Optional[QueueListener] = None
+_queue_handler: Optional["_RecordQueueHandler"] = None
+_logger_names: Set[str] = set()
+_level = logging.INFO
+_forwarding = False
+# 是否已由入口程序显式配置（setup_logger 的默认配置不算）
+_configured = False
+_atexit_registered = False
+
+
+class RateLimitFilter(logging.Filter):
+    def __init__(self, burst: int = 10, interval: float = 60.0, min_level: int = logging.WARNING):
+        """
+        限制重复日志的输出频率：同一位置的同一条消息模板在每个时间窗口内最多输出 burst 条，
+        超出部分被丢弃，下一个窗口输出第一条时附带被省略的条数
+
+        使用 %-style 参数的日志（logger.error("下载失败: %s", url)）按模板去重，
+        参数不同的同类错误会被合并限流
+
+        Args:
+            burst: 每个时间窗口内每种消息允许输出的条数，0表示不限流
+            interval: 时间窗口长度（秒）
+            min_level: 只对该级别及以上的日志限流
+        """
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        self.min_level = min_level
+        self._windows: Dict[Tuple[str, int, str], list] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.burst <= 0 or record.levelno < self.min_level:
+            return True
+        key = (record.name, record.lineno, str(record.msg))
+        now = time.monotonic()
+        with self._lock:
+            # 窗口：[开始时间, 本窗口已输出条数, 被省略条数]
+            window = self._windows.get(key)
+            if window is None or now - window[0] >= self.interval:
+                suppressed = window[2] if window is not None else 0
+                self._windows[key] = [now, 1, 0]
+                if len(self._windows) > 10000:
+                    self._windows = {k: v for k, v in self._windows.items() if now - v[0] < self.interval}
+            elif window[1] < self.burst:
+                window[1] += 1
+                return True
+            else:
+                window[2] += 1
+                return False
+        if suppressed:
+            record.msg = f"{record.msg} (过去 {self.interval:g} 秒内省略了 {suppressed} 条相同日志)"
+        return True
+
+
+class _RecordQueueHandler(QueueHandler):
+    """
+    将日志记录放入队列。进程内队列直接传递记录对象，消息的格式化在写入线程中进行；
+    跨进程队列需要序列化，仍按 QueueHandler 的默认方式在当前线程格式化
+    """
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if self.queue is _local_queue:
+            return record
+        return super().prepare(record)
+
+
+def _process_log_file(log_file: str, process_name: Optional[str]) -> str:
+    if not process_name:
+        return log_file
+    root, ext = os.path.splitext(log_file)
+    return f"{root}.{process_name}{ext or '.log'}"
+
+
+def _parse_level(level: Union[int, str]) -> int:
+    if isinstance(level, str):
+        return logging.getLevelName(level.upper()) if not level.isdigit() else int(level)
+    return level
+
+
+def _get_queue_handler() -> "_RecordQueueHandler":
+    global _queue_handler
+    if _queue_handler is None:
+        _queue_handler = _RecordQueueHandler(_local_queue)
+        _queue_handler.addFilter(RateLimitFilter())
+    return _queue_handler
+
+
+def _stop_listener():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener = None
+
+
+def configure_logging(
+    log_file: Optional[str] = DEFAULT_LOG_FILE,
+    level: Union[int, str] = logging.INFO,
+    process_name: Optional[str] = None,
+    log_queue=None,
+    rate_limit_burst: int = 10,
+    rate_limit_interval: float = 60.0
+):
+    """
+    配置本进程的日志输出。所有通过 setup_logger 获取的记录器共享同一个队列，
+    由一个后台写入线程负责控制台和文件输出，业务线程只做入队操作。
+
+    可以重复调用：已创建的记录器不需要重新获取，新的配置立即生效。
+
+    Args:
+        log_file: 日志文件路径，None表示只输出到控制台
+        level: 日志级别
+        process_name: 独立运行的进程（如 server、ws_server）使用各自的日志文件，
+            避免多个进程同时滚动同一个文件，文件名为 <log_file去掉扩展名>.<process_name>.log
+        log_queue: 跨进程队列（multiprocessing.Queue）。给出时本进程不写文件，
+            日志发送给创建该队列的父进程统一输出，见 forward_logs
+        rate_limit_burst: 重复的警告和错误日志每个时间窗口内最多输出的条数，0表示不限流
+        rate_limit_interval: 限流的时间窗口（秒）
+    """
+    global _configured
+    with _lock:
+        _configure(log_file, level, process_name, log_queue, rate_limit_burst, rate_limit_interval)
+        _configured = True
+
+
+def _configure(
+    log_file: Optional[str],
+    level: Union[int, str],
+    process_name: Optional[str],
+    log_queue,
+    rate_limit_burst: int,
+    rate_limit_interval: float
+):
+    global _listener, _level, _forwarding, _atexit_registered
+    with _lock:
+        _level = _parse_level(level)
+        for name in _logger_names:
+            logging.getLogger(name).setLevel(_level)
+
+        handler = _get_queue_handler()
+        for log_filter in handler.filters:
+            if isinstance(log_filter, RateLimitFilter):
+                log_filter.burst = rate_limit_burst
+                log_filter.interval = rate_limit_interval
+
+        if log_queue is not None:
+            # 工作进程：日志交给父进程的写入线程，本进程不打开日志文件
+            _stop_listener()
+            handler.queue = log_queue
+            _forwarding = True
+            return
+        if _forwarding:
+            # 已经在向父进程转发日志，之后的配置只调整级别
+            return
+
+        formatter = logging.Formatter(LOG_FORMAT, datefmt=LOG_DATE_FORMAT)
+        handlers = []
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(formatter)
+        handlers.append(console_handler)
+        if log_file:
+            log_file = _process_log_file(log_file, process_name)
+            os.makedirs(os.path.dirname(log_file) or ".", exist_ok=True)
+            file_handler = RotatingFileHandler(
+                log_file,
+                maxBytes=10*1024*1024,
+                backupCount=5,
+                encoding='utf-8'
+            )
+            file_handler.setFormatter(formatter)
+            handlers.append(file_handler)
+
+        # 先停止旧的写入线程，它会把队列中剩余的日志写完
+        _stop_listener()
+        handler.queue = _local_queue
+        _listener = QueueListener(_local_queue, *handlers, respect_handler_level=True)
+        _listener.start()
+        if not _atexit_registered:
+            atexit.register(shutdown_logging)
+            _atexit_registered = True
+
+
+def configure_logging_from_config(config: dict, process_name: Optional[str] = None, log_queue=None, keep_existing: bool = False):
+    """
+    按配置文件中的 log_file、log_level、log_rate_limit_burst、log_rate_limit_interval 配置日志
+
+    Args:
+        config: 配置字典
+        process_name: 独立运行的进程名称，见 configure_logging
+        log_queue: 跨进程队列，见 configure_logging
+        keep_existing: 入口程序已经调用过 configure_logging 时不做修改
+    """
+    if keep_existing and _configured:
+        return
+    configure_logging(
+        log_file=config.get("log_file", DEFAULT_LOG_FILE),
+        level=config.get("log_level", "INFO"),
+        process_name=process_name,
+        log_queue=log_queue,
+        rate_limit_burst=config.get("log_rate_limit_burst", 10),
+        rate_limit_interval=config.get("log_rate_limit_interval", 60)
+    )
+
+
+def forward_logs(log_queue) -> QueueListener:
+    """
+    在父进程中启动一个转发线程，把工作进程通过 log_queue 发送的日志交给本进程的写入线程，
+    所有进程的日志只由一个线程写入同一个文件
+
+    Args:
+        log_queue: 传给工作进程 configure_logging(log_queue=...) 的 multiprocessing.Queue
+
+    Returns:
+        QueueListener: 转发线程，工作进程退出后调用 stop() 停止
+    """
+    listener = QueueListener(log_queue, _get_queue_handler())
+    listener.start()
+    return listener
+
+
+def shutdown_logging():
+    """
+    停止写入线程并写完队列中剩余的日志，进程退出时自动调用
+    """
+    with _lock:
+        _stop_listener()
+
+
+def setup_logger(name: str = "picture_sniffer", log_file: Optional[str] = None, level: Optional[Union[int, str]] = None) -> logging.Logger:
     """
     设置并返回一个配置好的日志记录器
-    
+
+    记录器只把日志放入本进程共享的队列，由 configure_logging 启动的写入线程输出；
+    尚未配置时使用默认配置（logs/picture_sniffer.log，INFO）。
+
     Args:
         name: 日志记录器名称，默认为"picture_sniffer"
-        log_file: 日志文件路径，默认为"picture_sniffer.log"
-        level: 日志级别，默认为logging.INFO
-    
+        log_file: 日志文件路径，给出时以该文件重新配置本进程的日志输出
+        level: 日志级别，默认使用 configure_logging 配置的级别
+
     Returns:
         logging.Logger: 配置好的日志记录器实例
     """
-    logger = logging.getLogger(name)
-    logger.setLevel(level)
-    
-    if logger.handlers:
-        return logger
-    
-    formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S'
-    )
-    
-    console_handler = logging.StreamHandler()
-    console_handler.setLevel(level)
-    console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
-    
-    if log_file:
-        os.makedirs(os.path.dirname(log_file) if os.path.dirname(log_file) else ".", exist_ok=True)
-        file_handler = RotatingFileHandler(
-            log_file,
-            maxBytes=10*1024*1024,
-            backupCount=5,
-            encoding='utf-8'
-        )
-        file_handler.setLevel(level)
-        file_handler.setFormatter(formatter)
-        logger.addHandler(file_handler)
-    
+    with _lock:
+        if log_file is not None:
+            configure_logging(log_file, _level if level is None else level)
+        elif _listener is None and not _forwarding:
+            _configure(DEFAULT_LOG_FILE, _level, None, None, 10, 60.0)
+        logger = logging.getLogger(name)
+        logger.setLevel(_level if level is None else _parse_level(level))
+        if name not in _logger_names:
+            _logger_names.add(name)
+            logger.addHandler(_get_queue_handler())
+            logger.propagate = False
     return logger
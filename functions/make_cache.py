@@ -7,7 +7,7 @@ from tqdm import tqdm
 # 如果脚本在项目根目录下运行，通常不需要这行，但为了稳健加上
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from functions.cache import compress_to_webp
+from functions.cache import compress_to_webp, compress_to_webp_bytes
 
 def generate_cache(source_dir: str, cache_dir: str):
     """
@@ -104,6 +104,59 @@ def generate_cache(source_dir: str, cache_dir: str):
     print(f"处理失败: {error_count}")
     print("-" * 30)
 
+def generate_packed_cache(source_dir: str, pack, prefix: str = "cache"):
+    """
+    遍历 source_dir 中的图片，为缩略图打包存储中缺失的图片生成缩略图。
+    已有的缩略图通过一次索引查询得到，不需要逐个检查文件是否存在。
+    存储键与 generate_cache 的目录结构一致：prefix/<相对路径>.webp
+    """
+    IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.tiff', '.webp'}
+
+    source_path = Path(source_dir).resolve()
+    if not source_path.exists():
+        print(f"源目录不存在: {source_dir}")
+        return
+
+    print(f"开始扫描文件列表: {source_path} ...")
+    existing = set(pack.iter_keys(prefix + "/"))
+    missing = []
+    for root, dirs, files in os.walk(source_path):
+        for file in files:
+            file_path = Path(root) / file
+            if file_path.suffix.lower() not in IMAGE_EXTENSIONS:
+                continue
+            key = f"{prefix}/{file_path.relative_to(source_path).with_suffix('.webp').as_posix()}"
+            if key not in existing:
+                missing.append((file_path, key))
+
+    if not missing:
+        print(f"缩略图已完整，共 {len(existing)} 张。")
+        return
+
+    print(f"缺少 {len(missing)} 张缩略图，开始处理...")
+    processed_count = 0
+    error_count = 0
+    with tqdm(total=len(missing), unit="img", desc="处理进度") as pbar:
+        for file_path, key in missing:
+            try:
+                data = compress_to_webp_bytes(str(file_path))
+                if data is not None:
+                    pack.put(key, data)
+                    processed_count += 1
+                else:
+                    error_count += 1
+            except Exception:
+                error_count += 1
+            finally:
+                pbar.update(1)
+
+    print("-" * 30)
+    print(f"处理完成。")
+    print(f"新增生成: {processed_count}")
+    print(f"跳过已有: {len(existing)}")
+    print(f"处理失败: {error_count}")
+    print("-" * 30)
+
 if __name__ == "__main__":
     # 定义路径
     base_dir = os.path.dirname(os.path.abspath(__file__))
@@ -0,0 +1,313 @@
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Tuple
+from .logger_config import setup_logger
+
+# 默认的耗时分桶（秒），覆盖本地数据库操作到大模型请求
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# 图片大小分桶（字节）
+BYTES_BUCKETS = (16 * 1024, 64 * 1024, 256 * 1024, 1024 * 1024, 4 * 1024 * 1024, 16 * 1024 * 1024)
+# 次数分桶，用于缩略图压缩轮数、批量写入行数等
+COUNT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 200)
+
+PREFIX = "picture_sniffer_"
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, Any]) -> LabelKey:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+class Metrics:
+    def __init__(self):
+        """
+        初始化进程内的指标注册表：计数器、瞬时值和直方图，所有方法线程安全
+        """
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple[str, LabelKey], float] = {}
+        self._gauges: Dict[Tuple[str, LabelKey], float] = {}
+        # (名称, 标签) -> [各分桶计数, 总和, 次数]
+        self._histograms: Dict[Tuple[str, LabelKey], list] = {}
+        self._buckets: Dict[str, Tuple[float, ...]] = {}
+
+    def inc(self, name: str, value: float = 1, **labels):
+        """
+        计数器增加value
+
+        Args:
+            name: 指标名称（不含前缀）
+            value: 增加量
+            labels: 标签
+        """
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels):
+        """
+        设置瞬时值，例如队列深度
+
+        Args:
+            name: 指标名称（不含前缀）
+            value: 当前值
+            labels: 标签
+        """
+        with self._lock:
+            self._gauges[(name, _label_key(labels))] = value
+
+    def observe(self, name: str, value: float, buckets: Tuple[float, ...] = DEFAULT_BUCKETS, **labels):
+        """
+        记录一次直方图观测值
+
+        Args:
+            name: 指标名称（不含前缀）
+            value: 观测值
+            buckets: 分桶上界，同一名称第一次记录时确定
+            labels: 标签
+        """
+        key = (name, _label_key(labels))
+        with self._lock:
+            bounds = self._buckets.setdefault(name, tuple(buckets))
+            entry = self._histograms.get(key)
+            if entry is None:
+                entry = self._histograms[key] = [[0] * len(bounds), 0.0, 0]
+            index = bisect.bisect_left(bounds, value)
+            if index < len(bounds):
+                entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    @contextmanager
+    def timer(self, name: str, **labels) -> Iterator[Dict[str, Any]]:
+        """
+        记录代码块的耗时（秒）。可在代码块中修改得到的标签字典，例如更新请求状态；
+        标签中包含status时，代码块抛出异常则记录为status="error"
+
+        Args:
+            name: 直方图名称（不含前缀）
+            labels: 标签
+        """
+        start = time.perf_counter()
+        try:
+            yield labels
+        except BaseException:
+            if "status" in labels:
+                labels["status"] = "error"
+            raise
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def timed(self, name: str, **labels):
+        """
+        装饰器：记录函数调用耗时，标签op为函数名
+
+        Args:
+            name: 直方图名称（不含前缀）
+            labels: 额外的标签
+        """
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.timer(name, op=func.__name__, **labels):
+                    return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        导出当前所有指标，结果可以JSON序列化，用于跨进程汇总
+
+        Returns:
+            Dict[str, Any]: 包含counters、gauges、histograms
+        """
+        with self._lock:
+            return {
+                'counters': [[name, dict(labels), value] for (name, labels), value in self._counters.items()],
+                'gauges': [[name, dict(labels), value] for (name, labels), value in self._gauges.items()],
+                'histograms': [
+                    [name, dict(labels), list(self._buckets[name]), list(entry[0]), entry[1], entry[2]]
+                    for (name, labels), entry in self._histograms.items()
+                ]
+            }
+
+
+# 进程内的全局注册表，各模块直接在其上记录指标
+metrics = Metrics()
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    parts = []
+    for key, value in sorted(labels.items()):
+        escaped = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{key}="{escaped}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def render_prometheus(snapshots: Iterable[Tuple[str, Dict[str, Any]]]) -> str:
+    """
+    将多个进程的指标快照渲染为 Prometheus 文本格式，每条指标附加process标签
+
+    Args:
+        snapshots: (进程名称, Metrics.snapshot() 的结果) 列表
+
+    Returns:
+        str: Prometheus 文本格式
+    """
+    # 名称 -> (类型, 输出行)，同名指标的TYPE只输出一次
+    families: Dict[str, Tuple[str, List[str]]] = {}
+
+    def family(name: str, kind: str) -> List[str]:
+        return families.setdefault(PREFIX + name, (kind, []))[1]
+
+    for process, snapshot in snapshots:
+        for name, labels, value in snapshot.get('counters', []):
+            labels = dict(labels, process=process)
+            family(name, "counter").append(f"{PREFIX}{name}{_format_labels(labels)} {_format_value(value)}")
+        for name, labels, value in snapshot.get('gauges', []):
+            labels = dict(labels, process=process)
+            family(name, "gauge").append(f"{PREFIX}{name}{_format_labels(labels)} {_format_value(value)}")
+        for name, labels, bounds, counts, total, count in snapshot.get('histograms', []):
+            labels = dict(labels, process=process)
+            lines = family(name, "histogram")
+            cumulative = 0
+            for bound, bucket_count in zip(bounds, counts):
+                cumulative += bucket_count
+                bucket_labels = dict(labels, le=_format_value(bound))
+                lines.append(f"{PREFIX}{name}_bucket{_format_labels(bucket_labels)} {cumulative}")
+            lines.append(f"{PREFIX}{name}_bucket{_format_labels(dict(labels, le='+Inf'))} {count}")
+            lines.append(f"{PREFIX}{name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{PREFIX}{name}_count{_format_labels(labels)} {count}")
+
+    output = []
+    for name in sorted(families):
+        kind, lines = families[name]
+        output.append(f"# TYPE {name} {kind}")
+        output.extend(lines)
+    return "\n".join(output) + "\n"
+
+
+def _quantile(bounds: List[float], counts: List[int], count: int, q: float) -> float:
+    # 由分桶估算分位数（取所在分桶的上界），落在最后一个分桶之外时返回最大上界
+    target = q * count
+    cumulative = 0
+    for bound, bucket_count in zip(bounds, counts):
+        cumulative += bucket_count
+        if cumulative >= target:
+            return bound
+    return bounds[-1] if bounds else 0.0
+
+
+def format_summary(snapshot: Dict[str, Any], previous: Optional[Dict[str, Any]] = None) -> str:
+    """
+    将指标快照格式化为便于阅读的日志摘要，提供previous时只统计两次快照之间的增量
+
+    Args:
+        snapshot: 当前快照
+        previous: 上一次的快照
+
+    Returns:
+        str: 多行摘要，没有任何指标时返回空字符串
+    """
+    previous_counters = {}
+    previous_histograms = {}
+    if previous:
+        previous_counters = {(name, _label_key(labels)): value for name, labels, value in previous['counters']}
+        previous_histograms = {
+            (name, _label_key(labels)): (counts, total, count)
+            for name, labels, _, counts, total, count in previous['histograms']
+        }
+
+    lines = []
+    for name, labels, bounds, counts, total, count in sorted(snapshot['histograms'], key=lambda item: (item[0], _label_key(item[1]))):
+        key = (name, _label_key(labels))
+        if key in previous_histograms:
+            old_counts, old_total, old_count = previous_histograms[key]
+            counts = [new - old for new, old in zip(counts, old_counts)]
+            total -= old_total
+            count -= old_count
+        if count <= 0:
+            continue
+        label_text = _format_labels(labels)
+        lines.append(
+            f"{name}{label_text}: {count} 次, 平均 {total / count:.3f}, "
+            f"p50 ≤ {_quantile(bounds, counts, count, 0.5):g}, p95 ≤ {_quantile(bounds, counts, count, 0.95):g}"
+        )
+    for name, labels, value in sorted(snapshot['counters'], key=lambda item: (item[0], _label_key(item[1]))):
+        delta = value - previous_counters.get((name, _label_key(labels)), 0)
+        if delta:
+            lines.append(f"{name}{_format_labels(labels)}: +{_format_value(delta)}")
+    for name, labels, value in sorted(snapshot['gauges'], key=lambda item: (item[0], _label_key(item[1]))):
+        lines.append(f"{name}{_format_labels(labels)} = {_format_value(value)}")
+    return "\n".join(lines)
+
+
+class MetricsReporter:
+    def __init__(self, db_manager, process_name: str, interval: float = 60, registry: Optional[Metrics] = None):
+        """
+        初始化指标汇报线程：定期将本进程的指标快照写入数据库（供 server.py 的 /metrics 汇总），
+        并在日志中输出这段时间内的指标摘要
+
+        Args:
+            db_manager: 数据库管理器实例
+            process_name: 进程名称，作为 /metrics 中的process标签，同名进程重启后覆盖旧快照
+            interval: 汇报间隔（秒）
+            registry: 指标注册表，默认为全局注册表
+        """
+        self.logger = setup_logger("metrics")
+        self.db_manager = db_manager
+        self.process_name = process_name
+        self.interval = max(1.0, interval)
+        self.registry = registry or metrics
+        self._previous: Optional[Dict[str, Any]] = None
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """
+        启动后台汇报线程
+        """
+        self._thread = threading.Thread(target=self._run, name="metrics-reporter", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """
+        停止汇报线程，并立即汇报一次
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.report()
+
+    def report(self):
+        """
+        写入一次快照并输出摘要
+        """
+        snapshot = self.registry.snapshot()
+        try:
+            self.db_manager.save_metrics_snapshot(self.process_name, os.getpid(), snapshot)
+        except Exception as e:
+            self.logger.warning("保存指标快照失败: %s", e)
+        summary = format_summary(snapshot, self._previous)
+        self._previous = snapshot
+        if summary:
+            self.logger.info("最近 %g 秒的指标摘要（%s）:\n%s", self.interval, self.process_name, summary)
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            self.report()
@@ -0,0 +1,311 @@
+import sqlite3
+import sys
+import time
+from datetime import datetime
+from typing import Optional, List, Tuple, Callable
+
+
+def to_epoch(value) -> Optional[int]:
+    """
+    将各种格式的时间统一转换为Unix时间戳（秒）
+
+    NapCat消息中的time为Unix秒字符串，早期的save_image_info写入的是"%Y-%m-%d %H:%M:%S"格式的本地时间。
+
+    Args:
+        value: 整数、数字字符串或"%Y-%m-%d %H:%M:%S"格式的字符串
+
+    Returns:
+        Optional[int]: Unix时间戳，无法解析时返回None
+    """
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    value = str(value).strip()
+    if not value:
+        return None
+    if value.isdigit():
+        return int(value)
+    try:
+        return int(time.mktime(datetime.strptime(value, "%Y-%m-%d %H:%M:%S").timetuple()))
+    except ValueError:
+        return None
+
+
+def _migration_epoch_create_time(conn: sqlite3.Connection):
+    """
+    将images和image_meta的create_time改为INTEGER类型的Unix时间戳，保证按时间排序一致
+    """
+    conn.create_function("to_epoch", 1, to_epoch)
+    cursor = conn.cursor()
+
+    cursor.execute('''
+        CREATE TABLE images_new (
+            image_id TEXT PRIMARY KEY,
+            image_path TEXT,
+            category TEXT,
+            description TEXT,
+            create_time INTEGER
+        )
+    ''')
+    cursor.execute('''
+        INSERT INTO images_new (image_id, image_path, category, description, create_time)
+        SELECT image_id, image_path, category, description, to_epoch(create_time) FROM images
+    ''')
+    cursor.execute('DROP TABLE images')
+    cursor.execute('ALTER TABLE images_new RENAME TO images')
+
+    cursor.execute('''
+        CREATE TABLE image_meta_new (
+            image_id TEXT PRIMARY KEY,
+            usage TEXT,
+            md5 TEXT,
+            create_time INTEGER
+        )
+    ''')
+    cursor.execute('''
+        INSERT INTO image_meta_new (image_id, usage, md5, create_time)
+        SELECT image_id, usage, md5, to_epoch(create_time) FROM image_meta
+    ''')
+    cursor.execute('DROP TABLE image_meta')
+    cursor.execute('ALTER TABLE image_meta_new RENAME TO image_meta')
+
+
+def _migration_indexes(conn: sqlite3.Connection):
+    """
+    为MD5去重、按时间排序和按分类筛选添加索引
+    """
+    cursor = conn.cursor()
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_image_meta_md5 ON image_meta (md5)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_images_create_time ON images (create_time)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_images_category ON images (category)')
+
+
+def _migration_category_counts(conn: sqlite3.Connection):
+    """
+    添加 (category, create_time) 复合索引，以及由触发器增量维护的分类计数表
+    """
+    cursor = conn.cursor()
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_images_category_time ON images (category, create_time)')
+    # 复合索引已覆盖按分类的等值查询
+    cursor.execute('DROP INDEX IF EXISTS idx_images_category')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS category_counts (
+            category TEXT PRIMARY KEY,
+            count INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute('DELETE FROM category_counts')
+    cursor.execute('''
+        INSERT INTO category_counts (category, count)
+        SELECT IFNULL(category, ''), COUNT(*) FROM images GROUP BY IFNULL(category, '')
+    ''')
+
+    # 注意：INSERT OR REPLACE 替换旧行时不会触发DELETE触发器，写入images必须使用UPSERT
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_images_insert_category AFTER INSERT ON images
+        BEGIN
+            INSERT INTO category_counts (category, count) VALUES (IFNULL(NEW.category, ''), 1)
+            ON CONFLICT(category) DO UPDATE SET count = count + 1;
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_images_delete_category AFTER DELETE ON images
+        BEGIN
+            UPDATE category_counts SET count = count - 1 WHERE category = IFNULL(OLD.category, '');
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_images_update_category AFTER UPDATE OF category ON images
+        WHEN IFNULL(OLD.category, '') != IFNULL(NEW.category, '')
+        BEGIN
+            UPDATE category_counts SET count = count - 1 WHERE category = IFNULL(OLD.category, '');
+            INSERT INTO category_counts (category, count) VALUES (IFNULL(NEW.category, ''), 1)
+            ON CONFLICT(category) DO UPDATE SET count = count + 1;
+        END
+    ''')
+
+
+def _migration_detail_description(conn: sqlite3.Connection):
+    """
+    添加细化描述列，已生成过细化描述的图片再次请求时直接返回
+    """
+    conn.execute('ALTER TABLE images ADD COLUMN detail_description TEXT')
+
+
+def _migration_label_versions(conn: sqlite3.Connection):
+    """
+    记录分类/描述由哪个模型与提示词版本生成，并添加批量重新标注的断点表
+    """
+    cursor = conn.cursor()
+    cursor.execute('ALTER TABLE images ADD COLUMN label_version TEXT')
+    cursor.execute('ALTER TABLE images ADD COLUMN detail_version TEXT')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS relabel_checkpoints (
+            job_name TEXT PRIMARY KEY,
+            last_rowid INTEGER NOT NULL DEFAULT 0,
+            processed INTEGER NOT NULL DEFAULT 0,
+            updated_at REAL
+        )
+    ''')
+
+
+def _migration_metrics_snapshots(conn: sqlite3.Connection):
+    """
+    添加各进程的指标快照表，server.py 的 /metrics 汇总采集进程的指标
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS metrics_snapshots (
+            process TEXT PRIMARY KEY,
+            pid INTEGER,
+            payload TEXT NOT NULL,
+            updated_at REAL NOT NULL
+        )
+    ''')
+
+
+def _migration_group_schedule(conn: sqlite3.Connection):
+    """
+    添加常驻模式的群组轮询计划表，重启后沿用各群的轮询间隔和消息速率
+    """
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS group_schedule (
+            group_id TEXT PRIMARY KEY,
+            interval REAL NOT NULL,
+            next_poll_at REAL NOT NULL,
+            last_polled_at REAL,
+            message_rate REAL NOT NULL DEFAULT 0,
+            image_rate REAL NOT NULL DEFAULT 0,
+            empty_polls INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+
+
+def _migration_image_events(conn: sqlite3.Connection):
+    """
+    添加图片变更记录表，由images表上的触发器在图片入库和删除时写入。
+    server.py 按event_id增量读取，将其他进程写入的新图片推送给前端
+    """
+    cursor = conn.cursor()
+    # AUTOINCREMENT：清理旧记录后event_id也不会重复使用，客户端可以按event_id断点续传
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS image_events (
+            event_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            image_id TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            created_at REAL NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_images_insert_event AFTER INSERT ON images
+        BEGIN
+            INSERT INTO image_events (image_id, kind, created_at)
+            VALUES (NEW.image_id, 'insert', (julianday('now') - 2440587.5) * 86400.0);
+        END
+    ''')
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS trg_images_delete_event AFTER DELETE ON images
+        BEGIN
+            INSERT INTO image_events (image_id, kind, created_at)
+            VALUES (OLD.image_id, 'delete', (julianday('now') - 2440587.5) * 86400.0);
+        END
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_image_events_created ON image_events (created_at)')
+
+
+def _migration_image_path_index(conn: sqlite3.Connection):
+    """
+    为 image_path 添加索引：按内容分片存储后多条图片记录可能引用同一个文件，删除图片时据此判断文件是否仍被引用
+    """
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_images_image_path ON images (image_path)')
+
+
+# (版本号, 说明, 迁移函数)，版本号必须递增，已发布的迁移不可修改
+MIGRATIONS: List[Tuple[int, str, Callable[[sqlite3.Connection], None]]] = [
+    (1, "create_time 统一为 Unix 时间戳", _migration_epoch_create_time),
+    (2, "添加 md5、create_time、category 索引", _migration_indexes),
+    (3, "分类复合索引与分类计数表", _migration_category_counts),
+    (4, "添加细化描述列", _migration_detail_description),
+    (5, "标注版本列与重新标注断点表", _migration_label_versions),
+    (6, "指标快照表", _migration_metrics_snapshots),
+    (7, "常驻模式的群组轮询计划表", _migration_group_schedule),
+    (8, "图片变更记录表", _migration_image_events),
+    (9, "image_path 索引", _migration_image_path_index),
+]
+
+
+def get_version(conn: sqlite3.Connection) -> int:
+    """
+    获取数据库当前的架构版本
+
+    Args:
+        conn: 数据库连接
+
+    Returns:
+        int: PRAGMA user_version 的值
+    """
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """
+    依次执行尚未应用的迁移，每个迁移在独立事务中执行并更新 PRAGMA user_version。
+    多个进程同时启动时，只有获得写锁的进程会执行迁移。
+
+    Args:
+        conn: 数据库连接
+
+    Returns:
+        int: 迁移后的架构版本
+    """
+    for version, description, migration in MIGRATIONS:
+        if get_version(conn) >= version:
+            continue
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # 获得写锁后再次确认，其他进程可能已经完成了该迁移
+            if get_version(conn) < version:
+                migration(conn)
+                conn.execute(f'PRAGMA user_version = {version}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return get_version(conn)
+
+
+def check_query_plans(conn: sqlite3.Connection) -> List[str]:
+    """
+    使用 EXPLAIN QUERY PLAN 检查 database.HOT_QUERIES 中的热点查询，找出退化为全表扫描或临时排序的查询
+
+    Args:
+        conn: 已完成迁移的数据库连接
+
+    Returns:
+        List[str]: 问题描述列表，为空表示全部查询都使用了索引
+    """
+    # database 模块导入了本模块，在函数内导入避免循环导入
+    from .database import HOT_QUERIES
+    problems = []
+    for name, sql, params in HOT_QUERIES:
+        for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params).fetchall():
+            detail = row[-1]
+            full_scan = detail.startswith("SCAN") and "USING" not in detail
+            if full_scan or "TEMP B-TREE" in detail:
+                problems.append(f"{name}: {detail}")
+    return problems
+
+
+if __name__ == "__main__":
+    # 用法: python -m functions.migrations [数据库路径]
+    # 执行迁移并检查热点查询的执行计划，存在全表扫描或临时排序时以非零状态退出
+    from .database import DatabaseManager
+    connection = sqlite3.connect(sys.argv[1] if len(sys.argv) > 1 else ":memory:")
+    DatabaseManager.create_tables(connection)
+    migrate(connection)
+    issues = check_query_plans(connection)
+    print(f"架构版本: {get_version(connection)}")
+    for issue in issues:
+        print(f"查询计划退化: {issue}")
+    sys.exit(1 if issues else 0)
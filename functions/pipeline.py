@@ -0,0 +1,204 @@
+import queue
+import threading
+import time
+from typing import Callable, Dict, Any, List, Optional
+from .logger_config import setup_logger
+from .metrics import metrics
+
+
+class PipelineStage:
+    def __init__(self, name: str, handler: Callable[[Dict[str, Any]], bool], workers: int = 1, queue_size: int = 10):
+        """
+        初始化流水线阶段：一个有界输入队列加一组独立的工作线程
+
+        Args:
+            name: 阶段名称，用于统计输出
+            handler: 处理函数，接收任务字典，返回True表示交给下一阶段，False表示任务在本阶段结束
+            workers: 工作线程数量
+            queue_size: 输入队列容量，队列满时上游阻塞，形成背压
+        """
+        self.logger = setup_logger("pipeline")
+        self.name = name
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.queue = queue.Queue(maxsize=max(1, queue_size))
+        self.next_stage: Optional["PipelineStage"] = None
+        self.on_done: Optional[Callable[[Dict[str, Any], Optional[Exception]], None]] = None
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        self.processed = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+        self.max_queue_depth = 0
+        self.started_at = 0.0
+
+    def start(self):
+        """
+        启动工作线程
+        """
+        self.started_at = time.time()
+        for index in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"{self.name}-{index}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def put(self, task: Dict[str, Any]):
+        """
+        放入任务，队列满时阻塞
+
+        Args:
+            task: 任务字典
+        """
+        self.queue.put(task)
+        depth = self.queue.qsize()
+        metrics.set("pipeline_queue_depth", depth, stage=self.name)
+        if depth > self.max_queue_depth:
+            with self._lock:
+                self.max_queue_depth = max(self.max_queue_depth, depth)
+
+    def stop(self):
+        """
+        通知所有工作线程退出并等待结束
+        """
+        for _ in self._threads:
+            self.queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def _worker(self):
+        while True:
+            task = self.queue.get()
+            if task is None:
+                break
+            # 出队后同样更新队列深度，积压处理完后指标回落
+            metrics.set("pipeline_queue_depth", self.queue.qsize(), stage=self.name)
+            start = time.perf_counter()
+            error = None
+            forward = False
+            try:
+                forward = self.handler(task)
+            except Exception as e:
+                error = e
+            elapsed = time.perf_counter() - start
+            metrics.observe("pipeline_stage_seconds", elapsed, stage=self.name, status="ok" if error is None else "error")
+
+            with self._lock:
+                self.busy_seconds += elapsed
+                if error is None:
+                    self.processed += 1
+                else:
+                    self.failed += 1
+
+            if error is None and forward and self.next_stage is not None:
+                self.next_stage.put(task)
+            elif self.on_done:
+                try:
+                    self.on_done(task, error)
+                except Exception as e:
+                    # 回调写数据库失败（例如 database is locked）时保留工作线程，否则该阶段队列中的任务无人处理
+                    self.logger.error("[%s] 任务结束回调失败: %s", self.name, e)
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        获取阶段统计信息
+
+        Returns:
+            Dict[str, Any]: 包含处理数、失败数、吞吐量、忙碌率和队列深度
+        """
+        with self._lock:
+            elapsed = max(time.time() - self.started_at, 1e-6) if self.started_at else 0.0
+            return {
+                'name': self.name,
+                'workers': self.workers,
+                'processed': self.processed,
+                'failed': self.failed,
+                'throughput': (self.processed + self.failed) / elapsed if elapsed else 0.0,
+                'utilization': self.busy_seconds / (elapsed * self.workers) if elapsed else 0.0,
+                'queue_depth': self.queue.qsize(),
+                'max_queue_depth': self.max_queue_depth
+            }
+
+
+class ImagePipeline:
+    def __init__(self, stages: List[PipelineStage], on_done: Callable[[Dict[str, Any], Optional[Exception]], None]):
+        """
+        初始化由多个阶段串联而成的图片处理流水线
+
+        Args:
+            stages: 按顺序排列的阶段
+            on_done: 任务结束（成功、提前结束或失败）时的回调，参数为任务字典和异常（成功为None）
+        """
+        self.stages = stages
+        self._on_done = on_done
+        self._in_flight = 0
+        self._cond = threading.Condition()
+        for stage, next_stage in zip(stages, stages[1:] + [None]):
+            stage.next_stage = next_stage
+            stage.on_done = self._task_done
+
+    def start(self):
+        """
+        启动所有阶段
+        """
+        for stage in self.stages:
+            stage.start()
+
+    def submit(self, task: Dict[str, Any]):
+        """
+        提交任务到第一个阶段，第一个阶段队列满时阻塞
+
+        Args:
+            task: 任务字典
+        """
+        with self._cond:
+            self._in_flight += 1
+        self.stages[0].put(task)
+
+    @property
+    def in_flight(self) -> int:
+        """
+        尚未结束的任务数量
+        """
+        with self._cond:
+            return self._in_flight
+
+    def close(self):
+        """
+        按顺序停止所有阶段，保证上游阶段已提交的任务能被下游处理完
+        """
+        for stage in self.stages:
+            stage.stop()
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """
+        获取所有阶段的统计信息
+
+        Returns:
+            List[Dict[str, Any]]: 每个阶段的统计信息
+        """
+        return [stage.stats() for stage in self.stages]
+
+    def format_stats(self) -> str:
+        """
+        将各阶段统计格式化为便于日志输出的文本，用于判断瓶颈阶段
+
+        Returns:
+            str: 多行统计文本
+        """
+        lines = []
+        for item in self.stats():
+            lines.append(
+                f"[{item['name']}] 线程: {item['workers']}, 完成: {item['processed']}, 失败: {item['failed']}, "
+                f"吞吐: {item['throughput']:.2f}/s, 忙碌率: {item['utilization'] * 100:.0f}%, "
+                f"队列深度: {item['queue_depth']} (峰值 {item['max_queue_depth']})"
+            )
+        return "\n".join(lines)
+
+    def _task_done(self, task: Dict[str, Any], error: Optional[Exception]):
+        try:
+            self._on_done(task, error)
+        finally:
+            with self._cond:
+                self._in_flight -= 1
+                self._cond.notify_all()
@@ -0,0 +1,89 @@
+import os
+import time
+import threading
+from .logger_config import setup_logger
+
+
+class PrefetchArea:
+    def __init__(self, directory: str = "tmp/prefetch", max_bytes: int = 200 * 1024 * 1024, stale_seconds: int = 3600):
+        """
+        初始化预下载临时区，用于在大模型分析完成前暂存图片
+
+        Args:
+            directory: 临时文件目录，多个工作进程可以共用
+            max_bytes: 本进程临时区占用上限（字节），超出时新的预下载会阻塞等待
+            stale_seconds: 启动时清理早于该时长的遗留文件
+        """
+        self.logger = setup_logger("prefetch")
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.stale_seconds = stale_seconds
+        self._used_bytes = 0
+        self._sizes = {}
+        self._cond = threading.Condition()
+        os.makedirs(self.directory, exist_ok=True)
+        self._cleanup()
+
+    def _cleanup(self):
+        """
+        删除临时目录中上次运行遗留的文件，这些文件对应的任务仍在任务队列中，会被重新下载。
+        仅清理足够旧的文件，避免误删其他工作进程正在使用的文件
+        """
+        deadline = time.time() - self.stale_seconds
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.stat().st_mtime < deadline:
+                try:
+                    os.remove(entry.path)
+                except OSError as e:
+                    self.logger.warning("清理预下载文件失败: %s, 错误: %s", entry.path, e)
+
+    def store(self, name: str, content: bytes) -> str:
+        """
+        写入预下载的图片。临时区已满时阻塞，直到有文件被丢弃
+
+        Args:
+            name: 文件名
+            content: 图片二进制内容
+
+        Returns:
+            str: 临时文件路径
+        """
+        size = len(content)
+        with self._cond:
+            # 临时区为空时总是允许写入，避免单个超大文件永久阻塞
+            self._cond.wait_for(lambda: self._used_bytes == 0 or self._used_bytes + size <= self.max_bytes)
+            self._used_bytes += size
+
+        path = os.path.join(self.directory, name)
+        try:
+            with open(path, "wb") as f:
+                f.write(content)
+        except Exception:
+            self._release(size)
+            raise
+        with self._cond:
+            self._sizes[path] = size
+        return path
+
+    def discard(self, path: str):
+        """
+        删除预下载的文件（图片不是MC图片、已存在或处理失败）
+
+        Args:
+            path: 临时文件路径
+        """
+        try:
+            if os.path.exists(path):
+                os.remove(path)
+        finally:
+            self._forget(path)
+
+    def _forget(self, path: str):
+        with self._cond:
+            size = self._sizes.pop(path, 0)
+        self._release(size)
+
+    def _release(self, size: int):
+        with self._cond:
+            self._used_bytes -= size
+            self._cond.notify_all()
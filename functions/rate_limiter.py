@@ -0,0 +1,33 @@
+import threading
+import time
+
+
+class TokenBucket:
+    def __init__(self, rate_per_minute: float, burst: int = 1):
+        """
+        初始化令牌桶限流器，多个线程共享同一个限流器时总速率不超过rate_per_minute
+
+        Args:
+            rate_per_minute: 每分钟允许的请求数
+            burst: 桶容量，允许的最大突发请求数
+        """
+        self.rate = max(rate_per_minute, 1e-6) / 60
+        self.capacity = max(1, burst)
+        self._tokens = float(self.capacity)
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        获取一个令牌，没有可用令牌时阻塞等待
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
@@ -0,0 +1,129 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple, Dict, Any
+from .database import DatabaseManager
+from .image_analyzer import ImageAnalyzer, LABEL_VERSION, DETAIL_VERSION
+from .cache import encode_for_analysis
+from .rate_limiter import TokenBucket
+from .blob_storage import BlobStorage, LocalBlobStorage
+from .logger_config import setup_logger
+
+MODE_CLASSIFY = "classify"
+MODE_DESCRIBE = "describe"
+
+
+class Relabeler:
+    def __init__(
+        self,
+        db_manager: DatabaseManager,
+        image_analyzer: ImageAnalyzer,
+        mode: str = MODE_CLASSIFY,
+        blob_storage: Optional[BlobStorage] = None,
+        chunk_size: int = 50,
+        workers: int = 4,
+        rpm: float = 60,
+        max_dimension: int = 1024
+    ):
+        """
+        初始化批量重新标注任务：按rowid分批遍历图片库，用当前版本的提示词重新分类或生成细化描述
+
+        每批结果与断点在同一个事务中写入，中断后重新运行会从断点继续；
+        版本已是当前版本的图片会被跳过。
+
+        Args:
+            db_manager: 数据库管理器实例
+            image_analyzer: 图片分析器实例
+            mode: classify（重新分类并生成简短描述）或 describe（生成细化描述）
+            blob_storage: 图片存储后端，默认为当前目录下的本地存储
+            chunk_size: 每批处理的图片数量
+            workers: 同时调用大模型的线程数
+            rpm: 大模型接口每分钟请求数上限
+            max_dimension: 发送给大模型的图片长边像素
+        """
+        if mode not in (MODE_CLASSIFY, MODE_DESCRIBE):
+            raise ValueError(f"Unknown relabel mode: {mode}")
+        self.logger = setup_logger("relabel")
+        self.db_manager = db_manager
+        self.image_analyzer = image_analyzer
+        self.mode = mode
+        self.blob_storage = blob_storage or LocalBlobStorage()
+        self.chunk_size = max(1, chunk_size)
+        self.workers = max(1, workers)
+        self.max_dimension = max_dimension
+        self.rate_limiter = TokenBucket(rpm, burst=self.workers)
+        self.version = LABEL_VERSION if mode == MODE_CLASSIFY else DETAIL_VERSION
+        self.version_column = "label_version" if mode == MODE_CLASSIFY else "detail_version"
+        # 断点按模式和版本区分，提示词版本变化后自动从头开始
+        self.job_name = f"{mode}:{self.version}"
+
+    def reset(self):
+        """
+        清除当前模式和版本的断点
+        """
+        self.db_manager.reset_relabel_checkpoint(self.job_name)
+
+    def run(self) -> Dict[str, int]:
+        """
+        执行批量重新标注，直到没有需要处理的图片
+
+        Returns:
+            Dict[str, int]: 处理统计，包含updated、non_mc、failed
+        """
+        stats = {'updated': 0, 'non_mc': 0, 'failed': 0}
+        last_rowid = self.db_manager.get_relabel_checkpoint(self.job_name)
+        if last_rowid:
+            self.logger.info("从断点继续: %s, rowid > %s", self.job_name, last_rowid)
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="relabel") as executor:
+            while True:
+                chunk = self.db_manager.get_relabel_chunk(last_rowid, self.chunk_size, self.version_column, self.version)
+                if not chunk:
+                    break
+
+                labels, details = [], []
+                for (rowid, image_id, _), result in zip(chunk, executor.map(self._process, chunk)):
+                    if result is None:
+                        stats['failed'] += 1
+                    elif self.mode == MODE_DESCRIBE:
+                        details.append((image_id, result, self.version))
+                    elif not result.get('is_mc_pic', False):
+                        # 新提示词判定为非MC图片时不删除图片，仅记录日志，保留原分类
+                        self.logger.warning("重新分类判定为非MC图片，保留原分类: %s", image_id)
+                        stats['non_mc'] += 1
+                    else:
+                        labels.append((image_id, result.get('category', ''), result.get('description', ''), self.version))
+
+                last_rowid = chunk[-1][0]
+                self.db_manager.save_relabel_chunk(self.job_name, last_rowid, labels, details)
+                stats['updated'] += len(labels) + len(details)
+                self.logger.info(
+                    "重新标注进度: rowid %s, 已更新 %s, 非MC %s, 失败 %s",
+                    last_rowid, stats['updated'], stats['non_mc'], stats['failed']
+                )
+
+        self.logger.info("重新标注完成: %s, %s", self.job_name, stats)
+        return stats
+
+    def _process(self, row: Tuple[int, str, str]) -> Optional[Any]:
+        """
+        处理单张图片，失败返回None（图片版本保持不变，清除断点后重新运行会再次处理）
+        """
+        _, image_id, image_path = row
+        try:
+            with self.blob_storage.open_local(image_path) as local_path:
+                if local_path is None:
+                    self.logger.error("图片文件不存在: %s, %s", image_id, image_path)
+                    return None
+
+                if self.mode == MODE_DESCRIBE:
+                    self.rate_limiter.acquire()
+                    return self.image_analyzer.describe_image(local_path)
+
+                base64_image = encode_for_analysis(local_path, self.max_dimension)
+            if base64_image is None:
+                return None
+            self.rate_limiter.acquire()
+            result = self.image_analyzer.analyze_image_base64(base64_image)
+            return result if isinstance(result, dict) else None
+        except Exception as e:
+            self.logger.error("重新标注失败: %s, 错误: %s", image_id, e)
+            return None
@@ -0,0 +1,361 @@
+import mmap
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+from .logger_config import setup_logger
+from .metrics import metrics
+
+SEGMENT_NAME = "seg-{:06d}.pack"
+INDEX_NAME = "index.db"
+
+
+class ThumbnailPack:
+    def __init__(self, directory: str, segment_size: int = 64 * 1024 * 1024, map_check_interval: float = 30.0):
+        """
+        打包保存缩略图：缩略图依次追加写入少量段文件，每张缩略图的位置（段号、偏移、长度）记录在SQLite索引中。
+        读取时按索引直接切片内存映射（mmap）的段文件，不需要为每个请求打开文件。
+
+        多个进程可以同时写入：追加写入和更新索引在同一个 BEGIN IMMEDIATE 事务中进行，由SQLite的写锁保证偏移量不冲突。
+        覆盖或删除缩略图只修改索引，段文件中留下的无用数据由 compact 回收。
+
+        Args:
+            directory: 段文件和索引所在目录
+            segment_size: 单个段文件的大小上限（字节），写满后开始新的段文件
+            map_check_interval: 检查已映射的段文件是否已被整理删除的间隔（秒）。整理可能在其他进程中进行，
+                关闭这些映射后磁盘空间才会被释放
+        """
+        self.directory = directory
+        self.segment_size = segment_size
+        self.index_path = os.path.join(directory, INDEX_NAME)
+        self.logger = setup_logger("thumbnail_pack")
+        # 读取使用每个线程固定的索引连接和共享的内存映射
+        self._local = threading.local()
+        self._maps: Dict[int, mmap.mmap] = {}
+        self._maps_lock = threading.Lock()
+        self.map_check_interval = map_check_interval
+        self._next_map_check = 0.0
+        os.makedirs(directory, exist_ok=True)
+        self.init_index()
+
+    def get_connection(self) -> sqlite3.Connection:
+        """
+        获取索引数据库连接，写入方之间按SQLite写锁排队
+
+        Returns:
+            sqlite3.Connection: 数据库连接对象
+        """
+        conn = sqlite3.connect(self.index_path, timeout=30, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return conn
+
+    def init_index(self):
+        """
+        创建索引表：thumbnails 记录每张缩略图的位置，segments 记录已创建的段文件
+        """
+        conn = self.get_connection()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS thumbnails (
+                key TEXT PRIMARY KEY,
+                segment INTEGER NOT NULL,
+                offset INTEGER NOT NULL,
+                length INTEGER NOT NULL
+            )
+        ''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_thumbnails_segment ON thumbnails (segment)')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS segments (
+                segment INTEGER PRIMARY KEY,
+                created_at REAL
+            )
+        ''')
+        conn.close()
+
+    def segment_path(self, segment: int) -> str:
+        return os.path.join(self.directory, SEGMENT_NAME.format(segment))
+
+    @contextmanager
+    def _write_transaction(self) -> Iterator[sqlite3.Connection]:
+        conn = self.get_connection()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            yield conn
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+
+    def _append(self, conn: sqlite3.Connection, data: bytes) -> Tuple[int, int]:
+        """
+        在写事务中把数据追加到当前段文件，当前段写满时开始新的段
+
+        Returns:
+            Tuple[int, int]: (段号, 偏移)
+        """
+        row = conn.execute('SELECT MAX(segment) FROM segments').fetchone()
+        segment = row[0]
+        size = os.path.getsize(self.segment_path(segment)) if segment is not None and os.path.exists(self.segment_path(segment)) else 0
+        if segment is None or (size > 0 and size + len(data) > self.segment_size):
+            segment = (segment or 0) + 1
+            size = 0
+            conn.execute('INSERT INTO segments (segment, created_at) VALUES (?, ?)', (segment, time.time()))
+        with open(self.segment_path(segment), "ab") as f:
+            # 上次写入中断时段文件末尾可能有未被索引引用的数据，从实际的文件末尾开始写
+            offset = f.seek(0, os.SEEK_END)
+            f.write(data)
+        return segment, offset
+
+    def put(self, key: str, data: bytes):
+        """
+        写入缩略图，已存在时覆盖（旧数据由 compact 回收）
+
+        Args:
+            key: 存储键，例如 cache/ab/cd/<md5>.webp
+            data: 缩略图内容
+        """
+        with self._write_transaction() as conn:
+            segment, offset = self._append(conn, data)
+            conn.execute(
+                'INSERT INTO thumbnails (key, segment, offset, length) VALUES (?, ?, ?, ?) '
+                'ON CONFLICT(key) DO UPDATE SET segment = excluded.segment, offset = excluded.offset, length = excluded.length',
+                (key, segment, offset, len(data))
+            )
+
+    def delete(self, key: str):
+        """
+        删除缩略图的索引记录
+        """
+        conn = self.get_connection()
+        conn.execute('DELETE FROM thumbnails WHERE key = ?', (key,))
+        conn.close()
+
+    def _read_connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.index_path, timeout=30)
+            self._local.conn = conn
+        return conn
+
+    def locate(self, key: str) -> Optional[Tuple[int, int, int]]:
+        """
+        查询缩略图的位置
+
+        Returns:
+            Optional[Tuple[int, int, int]]: (段号, 偏移, 长度)，不存在时返回None
+        """
+        return self._read_connection().execute(
+            'SELECT segment, offset, length FROM thumbnails WHERE key = ?', (key,)
+        ).fetchone()
+
+    def exists(self, key: str) -> bool:
+        return self.locate(key) is not None
+
+    def _map(self, segment: int, end: int) -> mmap.mmap:
+        """
+        获取段文件的内存映射。当前段仍在追加写入，映射长度不足时重新映射
+        """
+        mapped = self._maps.get(segment)
+        if mapped is not None and len(mapped) >= end:
+            return mapped
+        with self._maps_lock:
+            mapped = self._maps.get(segment)
+            if mapped is None or len(mapped) < end:
+                with open(self.segment_path(segment), "rb") as f:
+                    # 映射后即可关闭文件，映射在段文件被删除后仍然有效
+                    self._maps[segment] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                if mapped is not None:
+                    self._close_map(mapped)
+            return self._maps[segment]
+
+    @staticmethod
+    def _close_map(mapped: mmap.mmap):
+        try:
+            mapped.close()
+        except BufferError:
+            # 仍有响应引用该映射的切片，交给垃圾回收
+            pass
+
+    def get_view(self, key: str) -> Optional[Tuple[memoryview, Tuple[int, int]]]:
+        """
+        读取缩略图，返回内存映射的切片，不复制数据
+
+        Args:
+            key: 存储键
+
+        Returns:
+            Optional[Tuple[memoryview, Tuple[int, int]]]: (缩略图内容, (段号, 偏移))，不存在时返回None。
+                段号和偏移在缩略图被覆盖或整理后改变，可用作ETag
+        """
+        if time.monotonic() >= self._next_map_check:
+            self._release_stale_maps()
+        for _ in range(2):
+            location = self.locate(key)
+            if location is None:
+                return None
+            segment, offset, length = location
+            try:
+                view = memoryview(self._map(segment, offset + length))[offset:offset + length]
+            except (FileNotFoundError, ValueError):
+                # 查询索引后段文件被 compact 删除，或映射刚被其他线程关闭，重新查询新的位置
+                continue
+            metrics.inc("thumbnail_pack_reads_total")
+            return view, (segment, offset)
+        return None
+
+    def _release_stale_maps(self):
+        """
+        关闭已不在 segments 表中的段文件的映射。这些段已被（可能是其他进程中的）compact 删除，
+        映射关闭后文件占用的磁盘空间才会被释放
+        """
+        self._next_map_check = time.monotonic() + self.map_check_interval
+        if not self._maps:
+            return
+        live = {row[0] for row in self._read_connection().execute('SELECT segment FROM segments')}
+        with self._maps_lock:
+            stale = [self._maps.pop(segment) for segment in list(self._maps) if segment not in live]
+        for mapped in stale:
+            self._close_map(mapped)
+
+    def get(self, key: str) -> Optional[bytes]:
+        """
+        读取缩略图内容
+
+        Returns:
+            Optional[bytes]: 缩略图内容，不存在时返回None
+        """
+        result = self.get_view(key)
+        return bytes(result[0]) if result is not None else None
+
+    def iter_keys(self, prefix: str = "") -> Iterator[str]:
+        """
+        按顺序列出存储键
+        """
+        conn = self.get_connection()
+        try:
+            cursor = conn.execute(
+                'SELECT key FROM thumbnails WHERE key >= ? AND key < ? ORDER BY key',
+                (prefix, prefix + '\U0010ffff')
+            )
+            for (key,) in cursor:
+                yield key
+        finally:
+            conn.close()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        统计存储占用
+
+        Returns:
+            Dict[str, int]: thumbnails 为缩略图数量，segments 为段文件数量，
+                total_bytes 为段文件总大小，live_bytes 为仍被索引引用的数据大小
+        """
+        conn = self.get_connection()
+        count, live_bytes = conn.execute('SELECT COUNT(*), IFNULL(SUM(length), 0) FROM thumbnails').fetchone()
+        segments = [row[0] for row in conn.execute('SELECT segment FROM segments')]
+        conn.close()
+        total_bytes = sum(os.path.getsize(self.segment_path(segment)) for segment in segments if os.path.exists(self.segment_path(segment)))
+        return {"thumbnails": count, "segments": len(segments), "total_bytes": total_bytes, "live_bytes": live_bytes}
+
+    def compact(self, min_garbage_ratio: float = 0.3) -> Dict[str, int]:
+        """
+        整理段文件，回收被删除或覆盖的缩略图占用的空间：无用数据比例达到 min_garbage_ratio 的已写满的段，
+        将其中仍被引用的缩略图复制到当前段并更新索引，然后删除该段文件。
+        每个段在一个写事务中完成，整理期间可以正常读取，写入会等待当前段整理完成。
+
+        Args:
+            min_garbage_ratio: 需要整理的段中无用数据的最低比例
+
+        Returns:
+            Dict[str, int]: segments 为删除的段文件数，moved 为复制的缩略图数，reclaimed_bytes 为回收的空间
+        """
+        result = {"segments": 0, "moved": 0, "reclaimed_bytes": 0}
+        conn = self.get_connection()
+        # 当前段仍在写入，不参与整理
+        sealed = [row[0] for row in conn.execute('SELECT segment FROM segments WHERE segment < (SELECT MAX(segment) FROM segments) ORDER BY segment')]
+        conn.close()
+        for segment in sealed:
+            path = self.segment_path(segment)
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            with self._write_transaction() as conn:
+                rows: List[Tuple[str, int, int]] = conn.execute(
+                    'SELECT key, offset, length FROM thumbnails WHERE segment = ? ORDER BY offset', (segment,)
+                ).fetchall()
+                live = sum(length for _, _, length in rows)
+                if size and live > size * (1 - min_garbage_ratio):
+                    continue
+                if rows:
+                    with open(path, "rb") as f:
+                        for key, offset, length in rows:
+                            f.seek(offset)
+                            new_segment, new_offset = self._append(conn, f.read(length))
+                            conn.execute(
+                                'UPDATE thumbnails SET segment = ?, offset = ? WHERE key = ?',
+                                (new_segment, new_offset, key)
+                            )
+                conn.execute('DELETE FROM segments WHERE segment = ?', (segment,))
+            # 索引提交后再删除段文件，正在读取的进程仍可使用已有的内存映射
+            if os.path.exists(path):
+                os.remove(path)
+            with self._maps_lock:
+                mapped = self._maps.pop(segment, None)
+            if mapped is not None:
+                self._close_map(mapped)
+            result["segments"] += 1
+            result["moved"] += len(rows)
+            result["reclaimed_bytes"] += size - live
+            self.logger.info("整理段文件 %s: 复制 %s 张缩略图，回收 %.1f MB", segment, len(rows), (size - live) / 1024 / 1024)
+        return result
+
+    def import_directory(self, directory: str, prefix: str) -> int:
+        """
+        将目录中已有的缩略图文件写入打包存储，已存在的键跳过
+
+        Args:
+            directory: 缩略图目录，例如 cache
+            prefix: 存储键前缀，例如 cache
+
+        Returns:
+            int: 写入的缩略图数量
+        """
+        existing = set(self.iter_keys(prefix + "/"))
+        imported = 0
+        pending_dirs = [directory]
+        while pending_dirs:
+            current = pending_dirs.pop()
+            try:
+                with os.scandir(current) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            pending_dirs.append(entry.path)
+                            continue
+                        key = prefix + "/" + os.path.relpath(entry.path, directory).replace(os.sep, "/")
+                        if not entry.is_file() or key in existing:
+                            continue
+                        with open(entry.path, "rb") as f:
+                            self.put(key, f.read())
+                        imported += 1
+            except FileNotFoundError:
+                continue
+        return imported
+
+
+if __name__ == "__main__":
+    # 用法: python -m functions.thumbnail_pack [config.json] {stats,compact,import}
+    # import 将 storage_root 下 cache 目录中已有的缩略图文件写入打包存储
+    import sys
+    from .config_loader import load_config
+    from .blob_storage import CACHE_PREFIX, create_thumbnail_pack
+    args = sys.argv[1:]
+    command = args.pop() if args and args[-1] in ("stats", "compact", "import") else "stats"
+    pack_config = load_config(args[0] if args else "config.json")
+    pack = create_thumbnail_pack(pack_config)
+    if command == "import":
+        cache_dir = os.path.join(pack_config.get("storage_root", "."), CACHE_PREFIX)
+        print(f"已导入 {pack.import_directory(cache_dir, CACHE_PREFIX)} 张缩略图")
+    elif command == "compact":
+        print(f"整理完成: {pack.compact(pack_config.get('thumbnail_pack_compact_ratio', 0.3))}")
+    print(f"打包存储: {pack.stats()}")
@@ -0,0 +1,160 @@
+import threading
+import time
+from typing import Optional, List, Tuple
+from .database import DatabaseManager
+from .metrics import metrics, COUNT_BUCKETS
+from .logger_config import setup_logger
+
+
+class WriteBatcher:
+    def __init__(
+        self,
+        db_manager: DatabaseManager,
+        job_queue=None,
+        max_rows: int = 50,
+        max_delay_ms: int = 200,
+        max_flush_attempts: int = 3
+    ):
+        """
+        初始化写入合并器：收集各工作线程的写入，每累计max_rows条或等待max_delay_ms后
+        在一个事务中统一提交，减少每张图片多次提交带来的fsync开销
+
+        同一张图片的images和image_meta记录，以及对应任务的完成状态，总是在同一个事务中写入。
+
+        Args:
+            db_manager: 数据库管理器实例
+            job_queue: 可选的任务队列，任务完成状态与图片记录一起提交
+            max_rows: 累计多少条写入后立即提交
+            max_delay_ms: 第一条写入等待提交的最长时间（毫秒）
+            max_flush_attempts: 提交失败时的最大尝试次数
+        """
+        self.logger = setup_logger("write_batcher")
+        self.db_manager = db_manager
+        self.job_queue = job_queue
+        self.max_rows = max_rows
+        self.max_delay = max_delay_ms / 1000
+        self.max_flush_attempts = max_flush_attempts
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._images: List[tuple] = []
+        self._metas: List[tuple] = []
+        self._job_results: List[Tuple[str, str]] = []
+        self._pending_md5 = set()
+        self._first_added_at: Optional[float] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def add_image(self, image_row: tuple, meta_row: Optional[tuple] = None) -> bool:
+        """
+        加入一张图片的写入
+
+        Args:
+            image_row: (image_id, image_path, category, description, create_time[, label_version])
+            meta_row: 可选的 (image_id, usage, md5, create_time)
+
+        Returns:
+            bool: 相同MD5的图片已在等待提交时返回False，不会重复写入
+        """
+        with self._cond:
+            if meta_row is not None:
+                md5 = meta_row[2]
+                if md5 in self._pending_md5:
+                    return False
+                self._pending_md5.add(md5)
+                self._metas.append(meta_row)
+            self._images.append(image_row)
+            self._added()
+        return True
+
+    def add_job_result(self, job_id: str, result: str):
+        """
+        加入任务完成状态，与之前加入的图片记录在同一个或之后的事务中提交
+
+        Args:
+            job_id: 任务ID
+            result: 处理结果
+        """
+        with self._cond:
+            self._job_results.append((job_id, result))
+            self._added()
+
+    def md5_pending(self, md5: str) -> bool:
+        """
+        检查MD5是否在等待提交
+
+        Args:
+            md5: 图片MD5值
+
+        Returns:
+            bool: 等待提交返回True
+        """
+        with self._cond:
+            return md5 in self._pending_md5
+
+    def _added(self):
+        # 调用方已持有self._cond
+        if self._first_added_at is None:
+            self._first_added_at = time.monotonic()
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="write-batcher", daemon=True)
+            self._thread.start()
+        self._cond.notify_all()
+
+    def _size(self) -> int:
+        return len(self._images) + len(self._job_results)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    # 其他线程调用flush后可能已经没有等待中的写入
+                    if self._first_added_at is None:
+                        self._cond.wait()
+                        continue
+                    remaining = self._first_added_at + self.max_delay - time.monotonic()
+                    if self._size() >= self.max_rows or remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+            self.flush()
+
+    def flush(self):
+        """
+        立即在一个事务中提交所有等待中的写入
+        """
+        with self._flush_lock:
+            with self._cond:
+                images, self._images = self._images, []
+                metas, self._metas = self._metas, []
+                job_results, self._job_results = self._job_results, []
+                self._first_added_at = None
+            if not images and not job_results:
+                return
+
+            for attempt in range(1, self.max_flush_attempts + 1):
+                try:
+                    self._write(images, metas, job_results)
+                    break
+                except Exception as e:
+                    if attempt < self.max_flush_attempts:
+                        self.logger.warning("批量写入失败，稍后重试(%s/%s): %s", attempt, self.max_flush_attempts, e)
+                        time.sleep(0.5 * attempt)
+                    else:
+                        # 对应的任务仍处于in_flight，租约过期后会被重新处理
+                        self.logger.error("批量写入失败，放弃 %s 张图片和 %s 个任务状态: %s", len(images), len(job_results), e)
+
+            with self._cond:
+                self._pending_md5.difference_update(meta[2] for meta in metas)
+
+    def _write(self, images: List[tuple], metas: List[tuple], job_results: List[Tuple[str, str]]):
+        metrics.observe("db_batch_rows", len(images) + len(job_results), COUNT_BUCKETS)
+        conn = self.db_manager.get_connection()
+        try:
+            with metrics.timer("db_seconds", op="write_batch"):
+                self.db_manager.insert_images_with_meta(images, metas, conn)
+                if job_results and self.job_queue is not None:
+                    self.job_queue.complete_many(job_results, conn)
+                conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
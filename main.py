@@ -3,10 +3,16 @@ import queue
 import threading
 import argparse
 import os
-import base64
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from tqdm import tqdm
-from functions import DatabaseManager, DataFetcher, ImageAnalyzer, DataStorage, load_config, setup_logger
+from collections import Counter
+from typing import Iterator, List, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from functions import DatabaseManager, JobQueue, WriteBatcher, ImagePipeline, PipelineStage, PrefetchArea, create_blob_storage, load_config, setup_logger, configure_logging_from_config, forward_logs
+from functions.metrics import metrics, MetricsReporter
+# tqdm、multiprocessing 以及 --relabel、--watch 专用的模块在对应方法中按需导入，
+# ws_server.py 等只使用部分功能的入口不必加载；requests 与 Pillow 在创建客户端和编码图片时才导入
+
+# 本地导入支持的图片扩展名
+LOCAL_IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp'}
 
 
 class PictureSniffer:
@@ -17,11 +23,10 @@ class PictureSniffer:
         Args:
             config: 配置字典，包含数据库路径、API密钥、日志配置等信息
         """
-        self.logger = setup_logger(
-            name="picture_sniffer",
-            log_file=config.get("log_file", "logs/picture_sniffer.log"),
-            level=config.get("log_level", "INFO")
-        )
+        # 入口程序（ws_server.py、工作进程）已配置日志时保持其配置
+        configure_logging_from_config(config, keep_existing=True)
+        self.logger = setup_logger("picture_sniffer")
+        from functions import DataFetcher, ImageAnalyzer, DataStorage
         
         self.db_manager = DatabaseManager(config.get("db_path", "picture_sniffer.db"))
         self.data_fetcher = DataFetcher(
@@ -32,279 +37,643 @@ class PictureSniffer:
             config["openai_token"],
             config.get("openai_base_url", "https://open.bigmodel.cn/api/paas/v4/chat/completions")
         )
+        self.config = config
+        # 图片存储后端：本地目录或S3兼容的对象存储
+        self.blob_storage = create_blob_storage(config)
         self.data_storage = DataStorage(
             self.db_manager,
             self.data_fetcher,
-            config.get("pictures_dir", "pictures")
+            config.get("pictures_dir", "pictures"),
+            blob_storage=self.blob_storage
         )
-        self.image_queue = queue.Queue()
         self.max_retries = 3 # 失败重试次数
         self.thread_pool_size = 3 # 线程池大小
+        # 持久化的图片任务队列，进程崩溃或中断后可从上次位置继续
+        self.job_queue = JobQueue(
+            config.get("db_path", "picture_sniffer.db"),
+            max_attempts=self.max_retries + 1,
+            lease_seconds=config.get("job_lease_seconds", 300)
+        )
+        # 合并各工作线程的数据库写入，图片记录与任务完成状态在同一个事务中提交
+        self.write_batcher = WriteBatcher(
+            self.db_manager,
+            self.job_queue,
+            max_rows=config.get("db_batch_rows", 50),
+            max_delay_ms=config.get("db_batch_ms", 200)
+        )
+        self.data_storage.write_batcher = self.write_batcher
+        self.worker_id = f"{os.getpid()}"
+        # 预下载模式：分析前先并行下载图片到临时区，向大模型发送缩小后的本地图片
+        self.speculative_download = config.get("speculative_download", False)
+        self.prefetch_area = PrefetchArea(
+            config.get("prefetch_dir", "tmp/prefetch"),
+            config.get("prefetch_max_mb", 200) * 1024 * 1024
+        ) if self.speculative_download else None
+        # 本地导入时正在处理的图片MD5
+        self._local_md5_in_flight = set()
+        self._local_md5_lock = threading.Lock()
+
+    def start_metrics_reporter(self, process_name: str) -> MetricsReporter:
+        """
+        启动指标汇报线程：定期在日志中输出指标摘要，并写入数据库供 server.py 的 /metrics 汇总
+        
+        Args:
+            process_name: 进程名称，例如 main、worker-0、ws_server
+        
+        Returns:
+            MetricsReporter: 汇报器，结束时调用stop()输出最后一次摘要
+        """
+        reporter = MetricsReporter(self.db_manager, process_name, self.config.get("metrics_interval", 60))
+        reporter.start()
+        return reporter
 
-    def process_group(self, group_id: str):
+    def process_group(self, group_id: str) -> int:
         """
         处理指定群组，获取消息并提取图片信息
         
         Args:
             group_id: 群组ID
-        """
-        self.logger.debug(f"\n处理群: {group_id}")
         
-        if self.db_manager.group_exists(group_id):
-            self.logger.debug(f"群 {group_id} 已存在，获取新消息...")
-            last_message_id = self.db_manager.get_group_last_message_id(group_id)
-            
-            if last_message_id:
-                messages = self.data_fetcher.get_new_messages(group_id, last_message_id, 15)
-                self.logger.debug(f"获取到 {len(messages)} 条新消息")
-            else:
-                messages = self.data_fetcher.get_initial_messages(group_id, 100)
-                self.logger.debug(f"获取到 {len(messages)} 条历史消息")
+        Returns:
+            int: 新加入任务队列的图片数量
+        """
+        return self._poll_group(group_id)[1]
+
+    def _poll_group(self, group_id: str) -> Tuple[List[dict], int]:
+        """
+        拉取群组的新消息，将其中的图片加入任务队列
+
+        Returns:
+            Tuple[List[dict], int]: 拉取到的新消息（不含上次已处理的最后一条）和新加入任务队列的图片数量
+        """
+        self.logger.debug("\n处理群: %s", group_id)
+        
+        # 一次查询同时判断群组是否存在及其最新消息ID
+        last_message_id = self.db_manager.get_group_last_message_id(group_id)
+        if last_message_id:
+            self.logger.debug("群 %s 已存在，获取新消息...", group_id)
+            messages = self.data_fetcher.get_new_messages(group_id, last_message_id, 15)
+            self.logger.debug("获取到 %s 条新消息", len(messages))
         else:
-            self.logger.debug(f"群 {group_id} 第一次初始化，获取历史消息...")
+            self.logger.debug("群 %s 第一次初始化，获取历史消息...", group_id)
             messages = self.data_fetcher.get_initial_messages(group_id, 100)
-            self.logger.debug(f"获取到 {len(messages)} 条历史消息")
+            self.logger.debug("获取到 %s 条历史消息", len(messages))
         
         if not messages:
-            self.logger.debug(f"群 {group_id} 没有消息")
-            return
+            self.logger.debug("群 %s 没有消息", group_id)
+            return [], 0
         
         image_messages = self.data_fetcher.extract_image_messages(messages)
-        self.logger.debug(f"发现 {len(image_messages)} 张图片")
+        self.logger.debug("发现 %s 张图片", len(image_messages))
+        
+        # 图片任务入队与群组消息游标前移在同一个事务中完成，中断后不会丢失图片
+        latest_message_id = str(messages[-1].get("message_id", ""))
+        added = self.job_queue.enqueue(image_messages, (group_id, latest_message_id))
+        self.logger.debug("新增 %s 个图片任务，更新群 %s 的最新消息ID: %s", added, group_id, latest_message_id)
+        new_messages = [msg for msg in messages if str(msg.get("message_id", "")) != last_message_id]
+        return new_messages, added
+
+    def _prefetch_stage(self, task: dict) -> bool:
+        """
+        预下载阶段（网络密集）：在分析前下载图片到临时区。下载失败时仍交给分析阶段，
+        由分析阶段改用URL分析、存储阶段重新下载
         
-        for image_msg in image_messages:
-            self.image_queue.put(image_msg)
+        Args:
+            task: 任务字典，预下载成功后写入prefetch_path
         
-        if messages:
-            latest_message_id = str(messages[-1].get("message_id", ""))
-            if self.db_manager.group_exists(group_id):
-                self.data_storage.update_group_last_message_id(group_id, latest_message_id)
-            else:
-                self.data_storage.insert_group(group_id, latest_message_id)
-            self.logger.debug(f"更新群 {group_id} 的最新消息ID: {latest_message_id}")
+        Returns:
+            bool: 图片不存在于数据库时返回True
+        """
+        image_msg = task["image_msg"]
+        if self.db_manager.image_exists(image_msg["message_id"]):
+            self.logger.debug("图片已存在，跳过")
+            task["result"] = "exists"
+            return False
+        
+        content = self.data_storage.download_content(image_msg["url"], image_msg["message_id"])
+        if content is not None:
+            task["prefetch_path"] = self.prefetch_area.store(f"{image_msg['group_id']}_{image_msg['message_id']}.img", content)
+        return True
 
-    def process_single_image(self, image_msg: dict):
+    def _analyze_stage(self, task: dict) -> bool:
         """
-        处理单张图片，包括分析和保存
+        流水线分析阶段（网络密集）：调用大模型判断是否为MC图片
         
         Args:
-            image_msg: 图片消息字典，包含message_id、group_id、url等信息
+            task: 任务字典，包含image_msg，处理结果写入result
+        
+        Returns:
+            bool: 是MC图片需要继续下载返回True
+        
+        Raises:
+            Exception: 图片分析失败，由任务队列决定是否重试
         """
-        retry_count = image_msg.get("retry_count", 1)
-        self.logger.debug(f"处理图片: {image_msg['message_id']}, 重试次数: {retry_count}")
+        image_msg = task["image_msg"]
+        self.logger.debug("处理图片: %s", image_msg['message_id'])
         
         if self.db_manager.image_exists(image_msg["message_id"]):
-            self.logger.debug(f"图片已存在，跳过")
-            return
+            self.logger.debug("图片已存在，跳过")
+            task["result"] = "exists"
+            return False
         
-        analysis_result = self.image_analyzer.analyze_image(image_msg["url"])
+        if task.get("prefetch_path"):
+            from functions.cache import encode_for_analysis
+            base64_image = encode_for_analysis(task["prefetch_path"], self.config.get("analysis_max_dimension", 1024))
+            analysis_result = self.image_analyzer.analyze_image_base64(base64_image) if base64_image else -1
+        else:
+            analysis_result = self.image_analyzer.analyze_image(image_msg["url"])
         
         if isinstance(analysis_result, dict):
             is_mc_pic = analysis_result.get("is_mc_pic", False)
-            self.logger.debug(f"是否为MC图片: {is_mc_pic}")
+            self.logger.debug("是否为MC图片: %s", is_mc_pic)
             
             if is_mc_pic:
-                success = self.data_storage.process_and_save_image(image_msg, analysis_result)
-                if success:
-                    self.logger.debug(f"图片已保存")
-                else:
-                    self.logger.warning(f"图片保存失败")
-            else:
-                self.logger.debug(f"不是MC图片，忽略")
+                task["analysis"] = analysis_result
+                return True
+            self.logger.debug("不是MC图片，忽略")
+            task["result"] = "ignored"
+            return False
         elif analysis_result == -1:
-            self.logger.debug(f"图片不合法，忽略")
+            self.logger.debug("图片不合法，忽略")
+            task["result"] = "invalid"
+            return False
+        else:
+            self.logger.warning("图片分析失败")
+            raise Exception("图片分析失败")
+
+    def _download_stage(self, task: dict) -> bool:
+        """
+        流水线下载阶段（网络密集）：下载原图
+        
+        Args:
+            task: 任务字典，下载成功后写入image_path
+        
+        Returns:
+            bool: 下载成功返回True
+        """
+        image_msg = task["image_msg"]
+        image_path = self.data_storage.fetch_image(image_msg["url"], image_msg["group_id"], image_msg["message_id"])
+        if not image_path:
+            self.logger.warning("图片保存失败")
+            task["result"] = "save_failed"
+            return False
+        task["image_path"] = image_path
+        return True
+
+    def _store_stage(self, task: dict) -> bool:
+        """
+        流水线存储阶段（CPU密集）：生成缩略图、计算MD5并写入数据库
+        
+        Args:
+            task: 任务字典，包含image_msg、analysis和image_path
+        
+        Returns:
+            bool: 总是返回False，任务在本阶段结束
+        """
+        if "image_path" not in task:
+            # 预下载模式下分析阶段直接进入本阶段：提交预下载的文件，预下载失败时重新下载
+            if task.get("prefetch_path"):
+                prefetch_path = task.pop("prefetch_path")
+                try:
+                    task["image_path"] = self.data_storage.store_original_file(prefetch_path, ext=".jpg")
+                finally:
+                    # 文件已移入存储，释放预下载区的占用
+                    self.prefetch_area.discard(prefetch_path)
+            elif not self._download_stage(task):
+                return False
+        self.data_storage.make_thumbnail(task["image_path"])
+        if self.data_storage.store_downloaded_image(task["image_msg"], task["analysis"], task["image_path"]):
+            self.logger.debug("图片已保存")
+            task["result"] = "saved"
         else:
-            self.logger.warning(f"图片分析失败")
-            if retry_count <= self.max_retries:
-                image_msg["retry_count"] = retry_count + 1
-                self.image_queue.put(image_msg)
-                self.logger.warning(f"重新放入队列, 群ID: {image_msg['group_id']}, 消息ID: {image_msg['message_id']}, 重试次数: {retry_count + 1}/{self.max_retries}")
+            task["result"] = "duplicate"
+        return False
+
+    def build_pipeline(self, on_done) -> ImagePipeline:
+        """
+        构建 分析 -> 下载 -> 缩略图/入库 三段流水线，各阶段线程数独立配置
+        
+        Args:
+            on_done: 任务结束回调，参数为任务字典和异常
+        
+        Returns:
+            ImagePipeline: 尚未启动的流水线
+        """
+        queue_size = self.config.get("pipeline_queue_size", 10)
+        download_workers = self.config.get("download_workers", 3)
+        thumbnail_workers = self.config.get("thumbnail_workers", 2)
+        if self.speculative_download:
+            # 预下载模式：下载 -> 分析（本地缩小图） -> 提交/丢弃 + 缩略图/入库
+            return ImagePipeline([
+                PipelineStage("prefetch", self._prefetch_stage, download_workers, queue_size),
+                PipelineStage("analyze", self._analyze_stage, self.thread_pool_size, queue_size),
+                PipelineStage("thumbnail", self._store_stage, thumbnail_workers, queue_size),
+            ], on_done)
+        return ImagePipeline([
+            PipelineStage("analyze", self._analyze_stage, self.thread_pool_size, queue_size),
+            PipelineStage("download", self._download_stage, download_workers, queue_size),
+            PipelineStage("thumbnail", self._store_stage, thumbnail_workers, queue_size),
+        ], on_done)
+
+    def _discard_prefetch(self, task: dict):
+        """
+        任务结束时丢弃未被提交的预下载文件（非MC图片、图片不合法或处理失败）
+        
+        Args:
+            task: 任务字典
+        """
+        prefetch_path = task.pop("prefetch_path", None)
+        if prefetch_path:
+            self.prefetch_area.discard(prefetch_path)
+
+    def _finish_job(self, job: dict, task: dict, error) -> str:
+        """
+        将任务处理结果写回任务队列
+        
+        Args:
+            job: JobQueue.claim 返回的任务
+            task: 流水线任务字典
+            error: 处理过程中的异常，成功为None
+        
+        Returns:
+            str: 处理结果，失败为"error"
+        """
+        image_msg = job["payload"]
+        self._discard_prefetch(task)
+        if "submitted_at" in task:
+            # 单张图片从进入流水线到处理结束的耗时
+            metrics.observe("image_seconds", time.perf_counter() - task["submitted_at"], source="queue")
+        if error is not None:
+            will_retry = self.job_queue.fail(job["job_id"], job["attempts"], str(error))
+            self.logger.error("处理图片时发生异常: %s", error)
+            if will_retry:
+                self.logger.warning("稍后重试, 群ID: %s, 消息ID: %s, 重试次数: %s/%s", image_msg['group_id'], image_msg['message_id'], job['attempts'], self.max_retries)
             else:
-                self.logger.error(f"已达到最大重试次数，放弃, 群ID: {image_msg['group_id']} ,消息ID: {image_msg['message_id']}")
-            raise Exception(f"图片分析失败，重试次数: {retry_count}/{self.max_retries}")
+                self.logger.error("已达到最大重试次数，放弃, 群ID: %s ,消息ID: %s", image_msg['group_id'], image_msg['message_id'])
+            metrics.inc("images_total", source="queue", result="error")
+            return "error"
+        metrics.inc("images_total", source="queue", result=task["result"])
+        self.write_batcher.add_job_result(job["job_id"], task["result"])
+        return task["result"]
 
-    def process_image_queue(self):
+    def process_image_queue(self, on_result=None, show_progress: bool = True):
         """
-        使用线程池处理图片队列中的所有图片
+        使用流水线处理任务队列中的所有图片
         
-        使用3个线程并发处理图片队列，支持动态调整进度条总数
+        从持久化任务队列中领取任务，交给 分析 -> 下载 -> 缩略图/入库 流水线处理，
+        各阶段之间使用有界队列形成背压，支持动态调整进度条总数。
+        失败的任务按退避时间重新排队，本次运行会等待到期的重试任务处理完毕。
+        
+        Args:
+            on_result: 可选回调，每个任务结束后以处理结果（失败时为"error"）调用
+            show_progress: 是否显示进度条，多进程模式下由协调进程统一显示
         """
-        self.logger.info(f"启动 {self.thread_pool_size} 个线程处理图片队列")
+        self.logger.info("启动图片处理流水线，分析线程: %s", self.thread_pool_size)
         
-        initial_queue_size = self.image_queue.qsize()
-        total_processed = 0
+        try:
+            self._drain_job_queue(on_result, show_progress)
+        except KeyboardInterrupt:
+            # 被中断时归还尚未完成的任务，下次运行无需等待租约过期
+            self.job_queue.release(self.worker_id)
+            self.logger.warning("处理被中断，未完成的图片任务已放回队列")
+            raise
+
+    def _drain_job_queue(self, on_result=None, show_progress: bool = True):
+        """
+        领取并处理任务，直到没有可执行或待重试的任务
+        """
+        from tqdm import tqdm
+        results = queue.Queue()
+        pipeline = self.build_pipeline(
+            lambda task, error: results.put(self._finish_job(task["job"], task, error))
+        )
+        # 流水线中最多同时存在的任务数：各阶段线程数与队列容量之和
+        capacity = sum(stage.workers + stage.queue.maxsize for stage in pipeline.stages)
+        pipeline.start()
         
-        with ThreadPoolExecutor(max_workers=self.thread_pool_size) as executor:
-            futures = []
-            
-            with tqdm(total=initial_queue_size, desc="处理图片", unit="张") as pbar:
+        try:
+            with tqdm(total=self.job_queue.pending_count(), desc="处理图片", unit="张", disable=not show_progress) as pbar:
                 while True:
+                    free_slots = capacity - pipeline.in_flight
+                    claimed = self.job_queue.claim(self.worker_id, free_slots) if free_slots > 0 else []
+                    for job in claimed:
+                        pipeline.submit({"job": job, "image_msg": job["payload"], "submitted_at": time.perf_counter()})
+                    
+                    if not claimed and pipeline.in_flight == 0 and results.empty():
+                        delay = self.job_queue.next_due_in()
+                        if delay is None:
+                            break
+                        time.sleep(min(delay, 1))
+                        continue
+                    
                     try:
-                        image_msg = self.image_queue.get(timeout=1)
-                        future = executor.submit(self.process_single_image, image_msg)
-                        futures.append(future)
-                        
-                        current_queue_size = self.image_queue.qsize()
-                        if pbar.total < total_processed + current_queue_size + 1:
-                            pbar.total = total_processed + current_queue_size + 1
-                            pbar.refresh()
-                        
-                        self.image_queue.task_done()
+                        result = results.get(timeout=1)
                     except queue.Empty:
-                        break
-                
-                for future in as_completed(futures):
-                    try:
-                        future.result()
-                        total_processed += 1
-                        pbar.update(1)
-                    except Exception as e:
-                        self.logger.error(f"处理图片时发生异常: {e}")
-                        # 此时进度条应当保持不变
-                        pbar.update(0)
+                        continue
+                    while True:
+                        # 失败的任务进度条保持不变
+                        pbar.update(0 if result == "error" else 1)
+                        if on_result:
+                            on_result(result)
+                        try:
+                            result = results.get_nowait()
+                        except queue.Empty:
+                            break
+                    
+                    remaining = self.job_queue.pending_count()
+                    metrics.set("job_queue_pending", remaining)
+                    if pbar.total < pbar.n + remaining:
+                        pbar.total = pbar.n + remaining
+                        pbar.refresh()
+            pipeline.close()
+        finally:
+            self.write_batcher.flush()
+            # 被中断时不等待阻塞在网络请求上的线程，守护线程随进程退出
+            self.logger.info("流水线各阶段统计:\n%s", pipeline.format_stats())
 
-    def scan_local_folder(self, folder_path: str) -> list:
+    def scan_local_folder(self, folder_path: str) -> Iterator[str]:
         """
-        扫描本地文件夹，获取所有图片的绝对路径
+        使用 os.scandir 逐个扫描本地文件夹中的图片，边扫描边返回，不在内存中保存完整的路径列表
         
         Args:
             folder_path: 文件夹路径
         
         Returns:
-            list: 图片文件路径列表
+            Iterator[str]: 图片文件路径迭代器
         """
-        image_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp'}
-        image_paths = []
-        
-        for root, dirs, files in os.walk(folder_path):
-            for file in files:
-                if os.path.splitext(file)[1].lower() in image_extensions:
-                    image_paths.append(os.path.join(root, file))
-        
-        self.logger.info(f"在文件夹 {folder_path} 中找到 {len(image_paths)} 张图片")
-        return image_paths
+        pending_dirs = [folder_path]
+        while pending_dirs:
+            directory = pending_dirs.pop()
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False):
+                            pending_dirs.append(entry.path)
+                        elif entry.is_file() and os.path.splitext(entry.name)[1].lower() in LOCAL_IMAGE_EXTENSIONS:
+                            yield entry.path
+            except OSError as e:
+                self.logger.error("扫描文件夹失败: %s, 错误: %s", directory, e)
 
-    def move_image_to_pictures(self, source_path: str, image_id: str) -> str:
+    def move_image_to_pictures(self, source_path: str, md5: str) -> str:
         """
-        将图片移动到pictures目录
+        将图片移动到图片存储，路径由内容MD5决定（pictures/ab/cd/<md5>.<扩展名>）
         
         Args:
             source_path: 图片源路径
-            image_id: 图片ID
+            md5: 图片MD5值
         
         Returns:
-            str: 相对路径，移动失败返回空字符串
+            str: 图片存储路径，移动失败返回空字符串
         """
         try:
-            filename = f"{image_id}{os.path.splitext(source_path)[1]}"
-            dest_path = os.path.join(self.data_storage.pictures_dir, filename)
-            
-            if os.path.exists(dest_path):
-                self.logger.warning(f"目标文件已存在，跳过: {dest_path}")
-                return ""
-            
-            os.makedirs(self.data_storage.pictures_dir, exist_ok=True)
-            os.rename(source_path, dest_path)
-            
-            relative_path = os.path.join("pictures", filename)
-            self.logger.debug(f"图片已移动: {source_path} -> {dest_path}")
-            return relative_path
+            # 目标已存在说明是上次导入中断时已移动的同一张图片，store_original_file会删除源文件并复用
+            image_key = self.data_storage.store_original_file(source_path, md5=md5)
+            self.logger.debug("图片已移动: %s -> %s", source_path, image_key)
+            return image_key
         except Exception as e:
-            self.logger.error(f"移动图片失败: {source_path}, 错误: {e}")
+            self.logger.error("移动图片失败: %s, 错误: %s", source_path, e)
             return ""
 
-    def process_local_image(self, image_path: str, image_id: str) -> bool:
+    def process_local_image(self, image_path: str) -> str:
         """
-        处理单个本地图片，包括分析和保存
+        处理单个本地图片，包括去重、分析和保存。图片ID由内容MD5生成（A+MD5），重复导入同一文件夹结果不变
         
         Args:
             image_path: 图片绝对路径
-            image_id: 自定义图片ID（如A0001）
         
         Returns:
-            bool: 处理成功返回True，失败返回False
+            str: 处理结果，exists/duplicate/saved/ignored/invalid/error
         """
-        self.logger.debug(f"处理本地图片: {image_path}, ID: {image_id}")
-        
-        if self.db_manager.image_exists(image_id):
-            self.logger.debug(f"图片ID已存在，跳过: {image_id}")
-            return True
-        
+        with metrics.timer("image_seconds", source="local"):
+            return self._process_local_image(image_path)
+
+    def _process_local_image(self, image_path: str) -> str:
         try:
-            with open(image_path, "rb") as image_file:
-                base64_image = base64.b64encode(image_file.read()).decode("utf-8")
+            md5 = self.data_storage.file_md5(image_path)
         except Exception as e:
-            self.logger.error(f"读取图片失败: {image_path}, 错误: {e}")
-            return False
+            self.logger.error("读取图片失败: %s, 错误: %s", image_path, e)
+            return "error"
+        image_id = f"A{md5}"
+        self.logger.debug("处理本地图片: %s, ID: %s", image_path, image_id)
+        
+        # 预检查：相同内容的图片已经入库（包括已删除的图片），不再调用大模型
+        if self.db_manager.md5_exists(md5) or self.write_batcher.md5_pending(md5):
+            self.logger.debug("MD5已存在，跳过: %s", image_path)
+            return "duplicate"
+        if self.db_manager.image_exists(image_id):
+            self.logger.debug("图片ID已存在，跳过: %s", image_id)
+            return "exists"
+        
+        # 文件夹中内容相同的多个文件只处理一个
+        with self._local_md5_lock:
+            if md5 in self._local_md5_in_flight:
+                return "duplicate"
+            self._local_md5_in_flight.add(md5)
+        try:
+            return self._analyze_local_image(image_path, image_id, md5)
+        finally:
+            with self._local_md5_lock:
+                self._local_md5_in_flight.discard(md5)
+
+    def _analyze_local_image(self, image_path: str, image_id: str, md5: str) -> str:
+        """
+        分析本地图片，是MC图片时移动到pictures目录并保存
+        
+        Args:
+            image_path: 图片绝对路径
+            image_id: 图片ID
+            md5: 图片MD5值
+        
+        Returns:
+            str: 处理结果，saved/duplicate/ignored/invalid/error
+        """
+        # 缩放后编码，避免将完整的原图读入内存并发送
+        from functions.cache import encode_for_analysis
+        base64_image = encode_for_analysis(image_path, self.config.get("analysis_max_dimension", 1024))
+        if base64_image is None:
+            self.logger.debug("图片不合法（动图或无法解码），忽略")
+            return "invalid"
         
         analysis_result = self.image_analyzer.analyze_image_base64(base64_image)
         
         if isinstance(analysis_result, dict):
             is_mc_pic = analysis_result.get("is_mc_pic", False)
-            self.logger.debug(f"是否为MC图片: {is_mc_pic}")
+            self.logger.debug("是否为MC图片: %s", is_mc_pic)
             
             if is_mc_pic:
-                relative_path = self.move_image_to_pictures(image_path, image_id)
+                relative_path = self.move_image_to_pictures(image_path, md5)
                 if not relative_path:
-                    self.logger.warning(f"图片移动失败")
-                    return False
+                    self.logger.warning("图片移动失败")
+                    return "error"
                 
                 category = analysis_result.get("category", "")
                 description = analysis_result.get("description", "")
                 
-                self.data_storage.save_image_info(image_id, relative_path, category, description)
-                self.logger.debug(f"图片已保存: {image_id}")
-                return True
+                if not self.data_storage.save_image_info(image_id, relative_path, category, description, md5=md5):
+                    return "duplicate"
+                self.logger.debug("图片已保存: %s", image_id)
+                return "saved"
             else:
-                self.logger.debug(f"不是MC图片，忽略")
-                return False
+                self.logger.debug("不是MC图片，忽略")
+                return "ignored"
         elif analysis_result == -1:
-            self.logger.debug(f"图片不合法，忽略")
-            return False
+            self.logger.debug("图片不合法，忽略")
+            return "invalid"
         else:
-            self.logger.warning(f"图片分析失败")
-            return False
+            self.logger.warning("图片分析失败")
+            return "error"
 
     def process_local_images(self, folder_path: str):
         """
-        使用线程池处理本地文件夹中的所有图片
+        使用线程池处理本地文件夹中的所有图片，扫描到的图片立即提交处理，
+        同时处理中的图片数量有上限，内存占用与文件夹大小无关
         
         Args:
             folder_path: 本地文件夹路径
         """
-        self.logger.info(f"开始处理本地文件夹: {folder_path}")
-        
-        image_paths = self.scan_local_folder(folder_path)
-        if not image_paths:
+        from tqdm import tqdm
+        self.logger.info("开始处理本地文件夹: %s", folder_path)
+        
+        slots = threading.BoundedSemaphore(self.thread_pool_size * 4)
+        totals = Counter()
+        lock = threading.Lock()
+        
+        with tqdm(total=0, desc="处理本地图片", unit="张") as pbar:
+            def on_done(future):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    self.logger.error("处理图片时发生异常: %s", e)
+                    result = "error"
+                metrics.inc("images_total", source="local", result=result)
+                with lock:
+                    totals[result] += 1
+                    pbar.update(1)
+                slots.release()
+            
+            with ThreadPoolExecutor(max_workers=self.thread_pool_size) as executor:
+                for image_path in self.scan_local_folder(folder_path):
+                    slots.acquire()
+                    with lock:
+                        pbar.total += 1
+                        pbar.refresh()
+                    executor.submit(self.process_local_image, image_path).add_done_callback(on_done)
+        
+        self.write_batcher.flush()
+        if not totals:
             self.logger.info("文件夹中没有图片")
             return
+        summary = ", ".join(f"{result}: {count}" for result, count in sorted(totals.items()))
+        self.logger.info("本地图片处理完成，结果统计: %s", summary)
+
+    def watch_folder(self, folder_path: str):
+        """
+        持续监听本地文件夹，新图片写入完成后立即分析入库，直到按下Ctrl+C
         
-        total_images = len(image_paths)
-        self.logger.info(f"找到 {total_images} 张图片，开始处理...")
+        Args:
+            folder_path: 本地文件夹路径
+        """
+        from functions.folder_watcher import FolderWatcher
+        slots = threading.BoundedSemaphore(self.thread_pool_size * 4)
+        totals = Counter()
+        lock = threading.Lock()
+        
+        def on_done(future):
+            try:
+                result = future.result()
+            except Exception as e:
+                self.logger.error("处理图片时发生异常: %s", e)
+                result = "error"
+            metrics.inc("images_total", source="watch", result=result)
+            with lock:
+                totals[result] += 1
+            self.logger.info("新图片处理结果: %s", result)
+            slots.release()
         
         with ThreadPoolExecutor(max_workers=self.thread_pool_size) as executor:
-            futures = []
+            def on_file(image_path: str):
+                slots.acquire()
+                executor.submit(self.process_local_image, image_path).add_done_callback(on_done)
             
-            with tqdm(total=total_images, desc="处理本地图片", unit="张") as pbar:
-                for idx, image_path in enumerate(image_paths, start=1):
-                    image_id = f"A{idx:04d}"
-                    future = executor.submit(self.process_local_image, image_path, image_id)
-                    futures.append(future)
-                
-                for future in as_completed(futures):
-                    try:
-                        result = future.result()
-                        pbar.update(1)
-                    except Exception as e:
-                        self.logger.error(f"处理图片时发生异常: {e}")
-                        pbar.update(1)
+            watcher = FolderWatcher(
+                folder_path,
+                on_file,
+                LOCAL_IMAGE_EXTENSIONS,
+                settle_seconds=self.config.get("watch_settle_seconds", 2.0),
+                poll_interval=self.config.get("watch_poll_interval", 2.0)
+            )
+            try:
+                watcher.run()
+            except KeyboardInterrupt:
+                self.logger.info("停止监听，等待正在处理的图片完成...")
+        
+        self.write_batcher.flush()
+        summary = ", ".join(f"{result}: {count}" for result, count in sorted(totals.items()))
+        self.logger.info("监听结束，结果统计: %s", summary or '无新图片')
 
-    def run(self):
+    def run_workers(self, workers: int):
+        """
+        多进程处理任务队列：启动多个工作进程共同领取持久化任务队列中的图片，
+        由当前进程统一汇总各进程的处理结果并显示进度
+        
+        Args:
+            workers: 工作进程数量
+        """
+        import multiprocessing
+        from tqdm import tqdm
+        self.logger.info("启动 %s 个工作进程处理图片队列", workers)
+        
+        # 使用spawn启动，避免子进程继承父进程中的线程和数据库连接状态
+        ctx = multiprocessing.get_context("spawn")
+        progress_queue = ctx.Queue()
+        # 工作进程的日志发送到当前进程，由同一个写入线程输出，避免多个进程同时写入和滚动日志文件
+        log_queue = ctx.Queue()
+        log_forwarder = forward_logs(log_queue)
+        processes = [
+            ctx.Process(target=_worker_main, args=(self.config, index, progress_queue, log_queue), daemon=True)
+            for index in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        
+        totals = Counter()
+        with tqdm(total=self.job_queue.pending_count(), desc="处理图片", unit="张") as pbar:
+            while True:
+                try:
+                    worker_index, result = progress_queue.get(timeout=1)
+                except queue.Empty:
+                    if not any(process.is_alive() for process in processes):
+                        break
+                    remaining = self.job_queue.pending_count()
+                    if pbar.total < pbar.n + remaining:
+                        pbar.total = pbar.n + remaining
+                        pbar.refresh()
+                    continue
+                totals[result] += 1
+                if result != "error":
+                    pbar.update(1)
+        
+        for process in processes:
+            process.join()
+        log_forwarder.stop()
+        for process in processes:
+            if process.exitcode:
+                self.logger.error("工作进程 %s 异常退出，退出码: %s", process.pid, process.exitcode)
+        
+        summary = ", ".join(f"{result}: {count}" for result, count in sorted(totals.items()))
+        self.logger.info("多进程处理完成，结果统计: %s，任务队列状态: %s", summary or '无任务', self.job_queue.counts())
+
+    def run(self, workers: int = 1):
         """
         运行图片嗅探器主程序
         
-        获取所有群组列表，逐个处理群组中的图片消息
+        获取所有群组列表，逐个处理群组中的图片消息。
+        上次运行中断时遗留在任务队列中的图片也会在本次运行中处理。
+        
+        Args:
+            workers: 处理图片的进程数量，大于1时由当前进程负责拉取群消息，多个工作进程处理图片
         """
+        from tqdm import tqdm
         self.logger.info("开始运行 Picture Sniffer...")
         
         result = self.data_fetcher.get_group_list()
@@ -314,33 +683,192 @@ class PictureSniffer:
             return
         
         groups = result.get("data", [])
-        self.logger.info(f"找到 {len(groups)} 个群")
+        self.logger.info("找到 %s 个群", len(groups))
         
         for group in tqdm(groups, desc="处理群组", unit="个"):
             group_id = str(group.get("group_id", ""))
             group_name = group.get("group_name", "")
-            self.logger.debug(f"\n====================\n群 {group_id} ({group_name})")
+            self.logger.debug("\n====================\n群 %s (%s)", group_id, group_name)
             
             try:
                 self.process_group(group_id)
                 
             except Exception as e:
-                self.logger.error(f"处理群 {group_id} 时出错: {e}")
+                self.logger.error("处理群 %s 时出错: %s", group_id, e)
                 continue
-        self.process_image_queue()
+        
+        if workers > 1:
+            self.run_workers(workers)
+        else:
+            self.process_image_queue()
 
         self.logger.info("运行完成!")
 
+    def run_daemon(self):
+        """
+        常驻运行，代替定时任务反复全量扫描所有群：由 GroupScheduler 为每个群安排轮询时间，
+        活跃且MC图片多的群频繁轮询，长期没有新消息或MC图片的群逐渐降低轮询频率。
+        每轮新增的图片立即处理，直到按下Ctrl+C
+        """
+        from functions.group_scheduler import GroupScheduler
+        scheduler = GroupScheduler(
+            self.db_manager,
+            min_interval=self.config.get("daemon_min_interval", 60),
+            max_interval=self.config.get("daemon_max_interval", 7200),
+            backoff=self.config.get("daemon_backoff", 2.0),
+            target_images=self.config.get("daemon_target_images", 1.0),
+            max_messages=self.config.get("daemon_max_messages", 300),
+            yield_days=self.config.get("daemon_yield_days", 7)
+        )
+        refresh_interval = self.config.get("daemon_group_refresh", 3600)
+        next_refresh = 0.0
+        self.logger.info("以常驻模式运行 Picture Sniffer...")
+        
+        try:
+            # 先处理上次运行遗留在任务队列中的图片，失败时在之后的循环中重试
+            queue_pending = not self._drain_image_queue()
+            while True:
+                if time.time() >= next_refresh:
+                    # 定期更新群列表和各群的MC图片产出率。NapCat 重启等错误不退出常驻模式，稍后重试
+                    try:
+                        result = self.data_fetcher.get_group_list()
+                        if result.get("status") == "ok":
+                            scheduler.sync(str(group.get("group_id", "")) for group in result.get("data", []))
+                            next_refresh = time.time() + refresh_interval
+                            self.logger.info("群列表已更新，轮询间隔分布: %s", scheduler.summary())
+                        else:
+                            self.logger.error("获取群列表失败")
+                            next_refresh = time.time() + scheduler.min_interval
+                    except Exception as e:
+                        self.logger.error("获取群列表失败: %s", e)
+                        next_refresh = time.time() + scheduler.min_interval
+                
+                added = 0
+                for group_id in scheduler.due():
+                    try:
+                        messages, group_added = self._poll_group(group_id)
+                    except Exception as e:
+                        # 出错的群按没有新消息处理，逐渐降低轮询频率
+                        self.logger.error("处理群 %s 时出错: %s", group_id, e)
+                        messages, group_added = [], 0
+                    message_times = [int(msg["time"]) for msg in messages if str(msg.get("time", "")).isdigit()]
+                    scheduler.record_poll(group_id, message_times, group_added)
+                    metrics.inc("group_polls_total", result="images" if group_added else "messages" if messages else "empty")
+                    added += group_added
+                
+                if added or queue_pending:
+                    queue_pending = not self._drain_image_queue()
+                
+                next_due = scheduler.next_due_in()
+                wait = min(refresh_interval if next_due is None else next_due, next_refresh - time.time())
+                if wait > 0:
+                    time.sleep(wait)
+        except KeyboardInterrupt:
+            self.logger.info("常驻模式已停止")
+
+    def _drain_image_queue(self) -> bool:
+        """
+        常驻模式下处理任务队列中的图片，出错（例如数据库被锁定）时记录日志而不退出，
+        未完成的任务仍保存在任务队列中
+
+        Returns:
+            bool: 处理完成返回True，出错返回False
+        """
+        try:
+            self.process_image_queue(show_progress=False)
+            return True
+        except Exception as e:
+            self.logger.error("处理图片任务队列失败，稍后重试: %s", e)
+            return False
+
+    def relabel(self, mode: str, reset: bool = False):
+        """
+        使用当前版本的提示词批量重新分类或生成细化描述，可中断后从断点继续
+        
+        Args:
+            mode: classify 或 describe
+            reset: 是否清除断点从头扫描
+        """
+        from functions.relabel import Relabeler
+        relabeler = Relabeler(
+            self.db_manager,
+            self.image_analyzer,
+            mode=mode,
+            blob_storage=self.blob_storage,
+            chunk_size=self.config.get("relabel_chunk_size", 50),
+            workers=self.config.get("relabel_workers", 4),
+            rpm=self.config.get("openai_rpm", 60),
+            max_dimension=self.config.get("analysis_max_dimension", 1024)
+        )
+        if reset:
+            relabeler.reset()
+        try:
+            stats = relabeler.run()
+        except KeyboardInterrupt:
+            self.logger.info("重新标注已中断，下次运行将从断点继续")
+            return
+        self.logger.info("重新标注结束: 更新 %s, 非MC %s, 失败 %s", stats['updated'], stats['non_mc'], stats['failed'])
+
+
+def _worker_main(config: dict, worker_index: int, progress_queue, log_queue):
+    """
+    工作进程入口：从共享的持久化任务队列领取并处理图片，处理结果发送给协调进程
+    
+    Args:
+        config: 配置字典
+        worker_index: 工作进程序号
+        progress_queue: 用于向协调进程汇报处理结果的队列
+        log_queue: 日志队列，日志由协调进程统一写入
+    """
+    configure_logging_from_config(config, log_queue=log_queue)
+    sniffer = PictureSniffer(config)
+    sniffer.worker_id = f"{os.getpid()}-{worker_index}"
+    reporter = sniffer.start_metrics_reporter(f"worker-{worker_index}")
+    try:
+        sniffer.process_image_queue(
+            on_result=lambda result: progress_queue.put((worker_index, result)),
+            show_progress=False
+        )
+    except KeyboardInterrupt:
+        pass
+    finally:
+        reporter.stop()
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Picture Sniffer - Minecraft图片嗅探器")
     parser.add_argument("--folder", type=str, help="本地文件夹路径，用于处理本地图片")
+    parser.add_argument("--watch", type=str, help="持续监听的本地文件夹路径，新图片写入后自动处理")
+    parser.add_argument("--workers", type=int, default=1, help="处理图片的进程数量，适用于回填大量历史消息")
+    parser.add_argument("--daemon", action="store_true", help="常驻运行，按各群的活跃程度分别安排轮询间隔")
+    parser.add_argument("--relabel", choices=["classify", "describe"], help="使用当前提示词批量重新分类或生成细化描述")
+    parser.add_argument("--relabel-reset", action="store_true", help="清除重新标注的断点，从头扫描")
     args = parser.parse_args()
     
     config = load_config("config.json")
     sniffer = PictureSniffer(config)
     
-    if args.folder:
-        sniffer.process_local_images(args.folder)
+    if args.relabel:
+        mode = "relabel"
+    elif args.watch:
+        mode = "watch"
+    elif args.folder:
+        mode = "folder"
+    elif args.daemon:
+        mode = "daemon"
     else:
-        sniffer.run()
+        mode = "main"
+    reporter = sniffer.start_metrics_reporter(mode)
+    try:
+        if args.relabel:
+            sniffer.relabel(args.relabel, reset=args.relabel_reset)
+        elif args.watch:
+            sniffer.watch_folder(args.watch)
+        elif args.folder:
+            sniffer.process_local_images(args.folder)
+        elif args.daemon:
+            sniffer.run_daemon()
+        else:
+            sniffer.run(workers=max(1, args.workers))
+    finally:
+        reporter.stop()
@@ -1,31 +1,169 @@
-from flask import Flask, jsonify, send_from_directory, request, g
+from flask import Flask, jsonify, send_from_directory, request, g, Response, redirect, abort
+from flask.json.provider import DefaultJSONProvider
 import os
+import threading
+import time
+from itertools import chain, islice
 from functools import wraps
-from functions.database import DatabaseManager
-from functions.make_cache import generate_cache
-from functions.image_analyzer import ImageAnalyzer
+from typing import Optional
+from functions.database import DatabaseManager, IMAGE_ROW_KEYS
+from functions import json_codec
+from functions.compression import available_encodings, choose_encoding, compress_bytes, precompress_directory, ENCODING_SUFFIXES, COMPRESSIBLE_EXTENSIONS
+from functions.labels import CATEGORIES
 from functions.config_loader import load_config
+from functions.logger_config import configure_logging_from_config
 from functions.zip import compress_two_folders
+from functions.metrics import metrics, render_prometheus
+from functions.blob_storage import create_blob_storage, LocalBlobStorage, PackedThumbnailStorage, PICTURES_PREFIX, CACHE_PREFIX
+from functions.image_events import ImageEventBroadcaster
 from flask_cors import CORS
 from waitress import serve
+from werkzeug.security import safe_join
+import mimetypes
+
+class CodecJSONProvider(DefaultJSONProvider):
+    """
+    使用 json_codec 编码 jsonify 的响应（安装 orjson 时更快），调试模式下的缩进输出仍使用标准库
+    """
+    def dumps(self, obj, **kwargs):
+        if kwargs.get('indent'):
+            return super().dumps(obj, **kwargs)
+        return json_codec.dumps(obj)
+
+    def loads(self, s, **kwargs):
+        return json_codec.loads(s)
+
 
 app = Flask(__name__)
+app.json = CodecJSONProvider(app)
 CORS(app)
 
 db_manager = DatabaseManager()
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-PICTURES_DIR = os.path.join(BASE_DIR, 'pictures')
-CACHE_DIR = os.path.join(BASE_DIR, 'cache')
 ZIP_FILE_PATH = os.path.join(BASE_DIR, 'zip')
 STATIC_DIR = os.path.join(BASE_DIR, 'website', 'dist')
 
 config = load_config()
-image_analyzer = ImageAnalyzer(api_key=config['openai_token'], api_url=config['openai_base_url'])
+# 与采集进程同时运行，使用单独的日志文件
+configure_logging_from_config(config, process_name="server")
+blob_storage = create_blob_storage(config, BASE_DIR)
+db_manager.blob_storage = blob_storage
+# 本地存储时由服务器直接发送文件，对象存储时重定向到预签名URL
+# 缩略图使用打包存储时，从内存映射的段文件中发送，原图仍按原存储后端处理
+THUMBNAIL_PACK = blob_storage.pack if isinstance(blob_storage, PackedThumbnailStorage) else None
+ORIGINAL_STORAGE = blob_storage.base if THUMBNAIL_PACK is not None else blob_storage
+LOCAL_STORAGE = isinstance(ORIGINAL_STORAGE, LocalBlobStorage)
+PICTURES_DIR = ORIGINAL_STORAGE.local_path(PICTURES_PREFIX) if LOCAL_STORAGE else None
+CACHE_DIR = ORIGINAL_STORAGE.local_path(CACHE_PREFIX) if LOCAL_STORAGE and THUMBNAIL_PACK is None else None
+
+# 细化描述的大模型客户端和线程池在第一次请求时创建，启动时不导入 requests 和 Pillow
+_describe_jobs = None
+_describe_jobs_lock = threading.Lock()
 WEBUI_TOKEN = config.get('webui_token', 'your_webui_token')
 
+# 新图片推送：所有客户端共享一个读取 image_events 表的后台线程，第一个客户端订阅时启动
+image_events = ImageEventBroadcaster(
+    db_manager,
+    poll_interval=config.get('events_poll_interval', 1.0),
+    max_subscribers=config.get('events_max_subscribers', 5),
+    retention=config.get('events_retention_seconds', 86400)
+)
+
 # 下载API的全局状态变量，防止多次访问的抖动问题
 DOWNLOADING = False
 
+# 列表接口超过该数量时以流式输出，内存占用与返回数量无关
+STREAM_THRESHOLD = 1000
+# 流式输出时每次写出的记录数
+STREAM_CHUNK_ROWS = 200
+
+
+def get_describe_jobs():
+    """
+    获取细化描述任务管理器，第一次调用时创建
+    """
+    global _describe_jobs
+    with _describe_jobs_lock:
+        if _describe_jobs is None:
+            from functions.image_analyzer import ImageAnalyzer
+            from functions.describe_jobs import DescribeJobManager
+            _describe_jobs = DescribeJobManager(
+                ImageAnalyzer(api_key=config['openai_token'], api_url=config['openai_base_url']),
+                db_manager,
+                max_workers=config.get('describe_workers', 2),
+                max_pending=config.get('describe_max_pending', 20),
+                blob_storage=blob_storage
+            )
+    return _describe_jobs
+
+
+def _stream_image_rows(rows, ndjson: bool, compact: bool):
+    """
+    将图片记录分块编码为JSON或NDJSON字节流
+
+    Args:
+        rows: 图片记录迭代器
+        ndjson: 为True时每行输出一条记录，否则输出 {"success": true, "data": [...]}
+        compact: 紧凑模式，记录为数组，字段名只在columns中出现一次
+    """
+    if ndjson:
+        if compact:
+            yield json_codec.dumps_bytes(IMAGE_ROW_KEYS) + b'\n'
+        while chunk := list(islice(rows, STREAM_CHUNK_ROWS)):
+            yield b''.join(json_codec.dumps_bytes(row) + b'\n' for row in chunk)
+        return
+
+    head = {'success': True}
+    if compact:
+        head['columns'] = IMAGE_ROW_KEYS
+    # 去掉结尾的 "}"，在其后拼接data数组
+    yield json_codec.dumps_bytes(head)[:-1] + b',"data":['
+    separator = b''
+    while chunk := list(islice(rows, STREAM_CHUNK_ROWS)):
+        yield separator + b','.join(json_codec.dumps_bytes(row) for row in chunk)
+        separator = b','
+    yield b']}\n'
+
+
+def image_list_response(offset: int, limit: int, keyword: Optional[str] = None, not_found: bool = False):
+    """
+    构造图片列表响应。
+
+    Query Args:
+        format: json（默认）或 ndjson，ndjson 总是流式输出
+        compact: 为1时使用列式紧凑格式，返回columns字段名和数组形式的记录
+
+    Args:
+        offset: 偏移量
+        limit: 数量
+        keyword: 搜索关键词
+        not_found: 没有记录时是否返回404
+    """
+    ndjson = request.args.get('format') == 'ndjson'
+    compact = request.args.get('compact') == '1'
+    rows = db_manager.iter_images(offset, limit, keyword=keyword, compact=compact)
+
+    if not_found:
+        first = next(rows, None)
+        if first is None:
+            return jsonify({
+                'success': False,
+                'message': 'No images found'
+            }), 404
+        rows = chain([first], rows)
+
+    if ndjson or limit > STREAM_THRESHOLD:
+        return Response(
+            _stream_image_rows(rows, ndjson, compact),
+            mimetype='application/x-ndjson' if ndjson else 'application/json'
+        )
+
+    payload = {'success': True}
+    if compact:
+        payload['columns'] = IMAGE_ROW_KEYS
+    payload['data'] = list(rows)
+    return jsonify(payload)
+
 def require_auth(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
@@ -77,24 +215,89 @@ def login():
             'message': '密钥错误'
         }), 401
 
+# 小于该大小（字节）的JSON响应不压缩
+JSON_COMPRESS_MIN_BYTES = 1024
+
+
+def send_static_file(path: str):
+    """
+    发送前端静态资源：客户端支持时直接发送预压缩的 .br / .gz 文件，并设置缓存头
+
+    Args:
+        path: 相对于 website/dist 的路径
+    """
+    encoding = None
+    if os.path.splitext(path)[1].lower() in COMPRESSIBLE_EXTENSIONS:
+        full_path = safe_join(STATIC_DIR, path)
+        if full_path is not None and os.path.isfile(full_path):
+            existing = [name for name in available_encodings() if os.path.isfile(full_path + ENCODING_SUFFIXES[name])]
+            encoding = choose_encoding(request.headers.get('Accept-Encoding', ''), existing)
+
+    if encoding is None:
+        response = send_from_directory(STATIC_DIR, path)
+    else:
+        response = send_from_directory(
+            STATIC_DIR,
+            path + ENCODING_SUFFIXES[encoding],
+            mimetype=mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        )
+        response.headers['Content-Encoding'] = encoding
+
+    if os.path.splitext(path)[1].lower() in COMPRESSIBLE_EXTENSIONS:
+        response.vary.add('Accept-Encoding')
+    if path.startswith('_next/static/'):
+        # 文件名带内容哈希，内容变化时文件名也会变化
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    elif path.endswith(('.html', '.txt')):
+        # 页面和RSC数据引用带哈希的资源，每次都需要向服务器确认
+        response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+
+@app.after_request
+def compress_json_response(response):
+    """
+    按 Accept-Encoding 压缩较大的JSON响应，流式响应和文件响应不处理
+    """
+    if (
+        response.mimetype != 'application/json'
+        or response.direct_passthrough
+        or response.is_streamed
+        or 'Content-Encoding' in response.headers
+    ):
+        return response
+
+    data = response.get_data()
+    if len(data) < JSON_COMPRESS_MIN_BYTES:
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = choose_encoding(request.headers.get('Accept-Encoding', ''), available_encodings())
+    if encoding is None:
+        return response
+    response.set_data(compress_bytes(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
 @app.route('/')
 def index():
-    return send_from_directory(STATIC_DIR, 'index.html')
+    return send_static_file('index.html')
 
 
 @app.route('/login')
 def login_page():
-    return send_from_directory(STATIC_DIR, 'login.html')
+    return send_static_file('login.html')
 
 
 @app.route('/search')
 def search_page():
-    return send_from_directory(STATIC_DIR, 'search.html')
+    return send_static_file('search.html')
 
 
 @app.route('/<path:path>')
 def serve_static(path):
-    return send_from_directory(STATIC_DIR, path)
+    return send_static_file(path)
 
 # TODO：使用缓存。
 @app.route('/api/random-image', methods=['GET'])
@@ -102,28 +305,21 @@ def serve_static(path):
 def get_random_image():
     offset = request.args.get('offset', 0, type=int)
     limit = request.args.get('limit', 20, type=int)
-    images = db_manager.get_random_images(offset=offset, limit=limit)
-    if images:
-        return jsonify({
-            'success': True,
-            'data': images
-        })
-    return jsonify({
-        'success': False,
-        'message': 'No images found'
-    }), 404
+    return image_list_response(offset, limit, not_found=True)
 
 @app.route('/api/describe-image', methods=['POST'])
 @require_auth
 def describe_image():
     """
-    描述图片（需要登录）
+    描述图片（需要登录）。已有细化描述时直接返回，否则提交后台任务：
+    请求头带有 Prefer: respond-async 时立即返回任务ID，客户端通过 /api/describe-image/<job_id> 查询结果；
+    否则等待任务结束后返回描述，兼容旧版前端
     
     Args:
         image_id: 图片ID（消息ID）
     
     Returns:
-        JSON响应，包含图片描述
+        JSON响应，包含图片描述（200），或任务ID（202）；等待超时返回504
     """
     data = request.get_json()
     
@@ -143,23 +339,86 @@ def describe_image():
             'message': 'Image not found'
         }), 404
     
-    relative_path = image_record['image_path']
-    absolute_path = os.path.join(BASE_DIR, relative_path)
+    detail_description = db_manager.get_detail_description(image_id)
+    if detail_description:
+        return jsonify({
+            'success': True,
+            'data': detail_description
+        })
     
-    description = image_analyzer.describe_image(absolute_path)
+    job = get_describe_jobs().submit(image_id, image_record['image_path'])
     
-    if description is None:
+    if job is None:
         return jsonify({
             'success': False,
-            'message': 'Failed to analyze image'
-        }), 500
+            'message': 'Too many describe requests, please retry later'
+        }), 503
+    
+    if 'respond-async' in request.headers.get('Prefer', ''):
+        response = jsonify({
+            'success': True,
+            'job_id': job['job_id'],
+            'status': job['status']
+        })
+        response.headers['Preference-Applied'] = 'respond-async'
+        return response, 202
     
-    db_manager.update_image_description(image_id, description)
+    from functions.describe_jobs import STATUS_DONE
+    job = get_describe_jobs().wait(job['job_id'], config.get('describe_wait_timeout', 120)) or job
+    
+    if job['status'] == STATUS_DONE:
+        return jsonify({
+            'success': True,
+            'data': job['data']
+        })
+    
+    if job['finished_at'] is not None:
+        return jsonify({
+            'success': False,
+            'message': job['message']
+        }), 500
     
     return jsonify({
+        'success': False,
+        'message': 'Describe request timed out',
+        'job_id': job['job_id']
+    }), 504
+
+@app.route('/api/describe-image/<job_id>', methods=['GET'])
+@require_auth
+def get_describe_job(job_id):
+    """
+    查询细化描述任务状态
+    
+    Args:
+        job_id: 任务ID
+    
+    Returns:
+        JSON响应，status为pending/running/done/failed，done时data为图片描述
+    """
+    from functions.describe_jobs import STATUS_DONE, STATUS_FAILED
+    job = get_describe_jobs().get(job_id)
+    
+    if job is None:
+        return jsonify({
+            'success': False,
+            'message': 'Job not found'
+        }), 404
+    
+    if job['status'] == STATUS_FAILED:
+        return jsonify({
+            'success': False,
+            'status': job['status'],
+            'message': job['message']
+        }), 500
+    
+    response = {
         'success': True,
-        'data': description
-    })
+        'status': job['status']
+    }
+    if job['status'] == STATUS_DONE:
+        response['data'] = job['data']
+    return jsonify(response)
 
 # TODO：使用缓存。
 @app.route('/api/search', methods=['GET'])
@@ -175,11 +434,7 @@ def search_images():
             'message': 'Missing keyword in query parameter'
         }), 400
     
-    images = db_manager.search_images(keyword, offset, limit)
-    return jsonify({
-        'success': True,
-        'data': images
-    })
+    return image_list_response(offset, limit, keyword=keyword)
 
 @app.route('/api/image/<image_id>', methods=['GET'])
 @require_auth
@@ -206,6 +461,59 @@ def get_image_by_id(image_id):
         'data': image_record
     })
 
+# 批量查询单次请求的图片ID数量上限
+MAX_BATCH_IDS = 500
+
+@app.route('/api/images/batch', methods=['POST'])
+@require_auth
+def get_images_batch():
+    """
+    批量获取图片记录，替代逐个调用 /api/image/<image_id>
+    
+    Body Args:
+        ids: 图片ID列表，最多 MAX_BATCH_IDS 个
+        fields: 可选，需要返回的字段列表（image_id、image_path、category、description、create_time、img_webp）
+    
+    Returns:
+        JSON响应，data为图片记录列表（顺序与ids一致），missing为不存在的ID
+    """
+    data = request.get_json(silent=True)
+    
+    if not data or not isinstance(data.get('ids'), list):
+        return jsonify({
+            'success': False,
+            'message': 'Missing ids in request body'
+        }), 400
+    
+    image_ids = [str(image_id) for image_id in data['ids']]
+    if len(image_ids) > MAX_BATCH_IDS:
+        return jsonify({
+            'success': False,
+            'message': f'Too many ids, at most {MAX_BATCH_IDS} per request'
+        }), 400
+    
+    fields = data.get('fields')
+    if fields is not None and not isinstance(fields, list):
+        return jsonify({
+            'success': False,
+            'message': 'fields must be a list'
+        }), 400
+    
+    try:
+        images = db_manager.get_images_by_ids(image_ids, fields)
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
+    
+    found = {image['image_id'] for image in images}
+    return jsonify({
+        'success': True,
+        'data': images,
+        'missing': [image_id for image_id in dict.fromkeys(image_ids) if image_id not in found]
+    })
+
 @app.route('/api/delete_image/<image_id>', methods=['DELETE'])
 @require_auth
 def delete_image(image_id):
@@ -236,6 +544,41 @@ def delete_image(image_id):
         'message': 'Image deleted successfully'
     })
 
+@app.route('/api/events', methods=['GET'])
+@require_auth
+def get_image_events():
+    """
+    以 Server-Sent Events 推送图片变更，代替反复请求 /api/images_by_time 检查新图片
+    
+    事件类型：image（新入库的图片记录，格式与 /api/image 相同）、delete（data为{"image_id": ...}）、
+    reset（无法补发断线期间的变更，客户端需要重新加载列表）。
+    
+    Query Args:
+        last_event_id: 断线重连时收到的最后一个事件ID，也可以使用 Last-Event-ID 请求头
+    """
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    if last_event_id is not None:
+        try:
+            last_event_id = int(last_event_id)
+        except ValueError:
+            return jsonify({
+                'success': False,
+                'message': 'Invalid last_event_id'
+            }), 400
+    
+    subscription = image_events.subscribe(last_event_id)
+    if subscription is None:
+        return jsonify({
+            'success': False,
+            'message': 'Too many subscribers'
+        }), 503
+    
+    return Response(
+        image_events.stream(subscription),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 # TODO：使用缓存。
 @app.route('/api/images_by_time', methods=['GET'])
 @require_auth
@@ -246,27 +589,110 @@ def get_images_list():
     Query Args:
         offset: 偏移量
         limit: 数量
+        format: json 或 ndjson
+        compact: 为1时使用列式紧凑格式
     """
     offset = request.args.get('offset', 0, type=int)
     limit = request.args.get('limit', 20, type=int)
     
-    # get_images_by_id 已被修改为按 create_time 倒序返回
-    images = db_manager.get_images_by_id(offset=offset, limit=limit)
+    return image_list_response(offset, limit)
+
+@app.route('/api/categories', methods=['GET'])
+@require_auth
+def get_categories():
+    """
+    获取分类筛选项及每个分类的图片数量
+    
+    计数来自由触发器增量维护的 category_counts 表，不会对 images 全表做 GROUP BY。
+    返回全部预设分类（数量可能为0），以及数据库中存在的其他历史分类。
+    """
+    counts = {item['category']: item['count'] for item in db_manager.get_category_counts()}
+    data = [{'category': category, 'count': counts.pop(category, 0)} for category in CATEGORIES]
+    data.extend({'category': category, 'count': count} for category, count in counts.items() if category)
+    
+    return jsonify({
+        'success': True,
+        'data': data
+    })
+
+@app.route('/api/images_by_category', methods=['GET'])
+@require_auth
+def get_images_by_category():
+    """
+    按分类精确筛选图片（按时间倒序）
+    
+    Query Args:
+        category: 分类名称
+        offset: 偏移量（未提供cursor时使用）
+        limit: 数量
+        cursor: 上一页返回的next_cursor，翻页代价与页数无关
+    """
+    category = request.args.get('category')
+    offset = request.args.get('offset', 0, type=int)
+    limit = request.args.get('limit', 20, type=int)
+    cursor = request.args.get('cursor')
+    
+    if not category:
+        return jsonify({
+            'success': False,
+            'message': 'Missing category in query parameter'
+        }), 400
+    
+    images, next_cursor = db_manager.get_images_by_category(category, offset=offset, limit=limit, cursor=cursor)
     
     return jsonify({
         'success': True,
-        'data': images
+        'data': images,
+        'next_cursor': next_cursor
     })
 
-@app.route('/pictures/<filename>', methods=['GET'])
+@app.route('/pictures/<path:filename>', methods=['GET'])
 def serve_picture(filename):
+    if not LOCAL_STORAGE:
+        return redirect(blob_storage.url(f"{PICTURES_PREFIX}/{filename}"))
     return send_from_directory(PICTURES_DIR, filename)
 
-@app.route('/cache/<filename>', methods=['GET'])
+@app.route('/cache/<path:filename>', methods=['GET'])
 def serve_cache_picture(filename):
+    if THUMBNAIL_PACK is not None:
+        return _send_packed_thumbnail(f"{CACHE_PREFIX}/{filename}")
+    if not LOCAL_STORAGE:
+        return redirect(blob_storage.url(f"{CACHE_PREFIX}/{filename}"))
     return send_from_directory(CACHE_DIR, filename)
 
 
+def _send_packed_thumbnail(key: str):
+    """
+    从打包存储发送缩略图：按索引切片内存映射的段文件，不打开文件也不调用read。
+    段号和偏移在缩略图被覆盖或整理后改变，用作ETag
+    """
+    result = THUMBNAIL_PACK.get_view(key)
+    if result is None:
+        abort(404)
+    view, (segment, offset) = result
+    response = Response([view], mimetype='image/webp', direct_passthrough=True)
+    response.content_length = len(view)
+    response.set_etag(f"{segment}-{offset}")
+    # 与 send_from_directory 相同：浏览器缓存后按ETag重新验证
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
+
+
+@app.route('/metrics', methods=['GET'])
+@require_auth
+def get_metrics():
+    """
+    Prometheus 文本格式的指标（需要登录）：本进程的指标，以及 main.py / ws_server.py 等进程定期保存的快照，以process标签区分
+    """
+    now = time.time()
+    snapshots = [('server', metrics.snapshot())]
+    for process, snapshot, updated_at in db_manager.get_metrics_snapshots(exclude_process='server'):
+        # 快照的更新时间，用于判断采集进程是否仍在运行
+        snapshot['gauges'].append(['metrics_snapshot_age_seconds', {}, now - updated_at])
+        snapshots.append((process, snapshot))
+    return Response(render_prometheus(snapshots), mimetype='text/plain; version=0.0.4')
+
+
 @app.route("/api/download_images", methods=['GET'])
 @require_auth
 def download_images():
@@ -280,6 +706,18 @@ def download_images():
             'message': '正在压缩中。'
         }), 400
     
+    if not LOCAL_STORAGE:
+        return jsonify({
+            'success': False,
+            'message': '对象存储模式下不支持打包下载。'
+        }), 400
+
+    if CACHE_DIR is None:
+        return jsonify({
+            'success': False,
+            'message': '缩略图打包存储模式下不支持打包下载。'
+        }), 400
+    
     DOWNLOADING = True
     try:
         # 已经设计防止抖动：如果压缩包存在并且修改日期距离现在不超过24小时，则直接返回文件。需要注意该设计需要保持压缩包的名称不变为固定值。
@@ -294,12 +732,21 @@ def download_images():
     
     return send_from_directory(os.path.dirname(ZIP_FILE_PATH), os.path.basename(ZIP_FILE_PATH), as_attachment=True)
 
-if __name__ == '__main__':
+def _generate_missing_cache():
+    from functions.make_cache import generate_cache, generate_packed_cache
     print("进入预检：检查图片缓存中。")
-    base_dir = os.path.dirname(os.path.abspath(__file__))
-    pictures_dir = os.path.join(base_dir, "pictures")
-    cache_dir = os.path.join(base_dir, "cache")
-    generate_cache(pictures_dir, cache_dir)
+    if THUMBNAIL_PACK is not None:
+        generate_packed_cache(PICTURES_DIR, THUMBNAIL_PACK, CACHE_PREFIX)
+    else:
+        generate_cache(PICTURES_DIR, CACHE_DIR)
+
+
+if __name__ == '__main__':
+    if LOCAL_STORAGE:
+        # 补全缺失的缩略图在后台进行，不推迟服务器开始监听的时间
+        threading.Thread(target=_generate_missing_cache, name="generate_cache", daemon=True).start()
+    precompress_directory(STATIC_DIR)
 
     print(f"服务器启动，监听端口 5000")
-    serve(app, host='0.0.0.0', port=5000, threads=10)
+    # 每个 /api/events 连接占用一个线程
+    serve(app, host='0.0.0.0', port=5000, threads=config.get('server_threads', 10))
@@ -0,0 +1,29 @@
+import sqlite3
+import unittest
+
+from functions.database import DatabaseManager
+from functions.migrations import MIGRATIONS, check_query_plans, get_version, migrate
+
+
+class MigrationsTest(unittest.TestCase):
+    def setUp(self):
+        self.conn = sqlite3.connect(":memory:")
+        DatabaseManager.create_tables(self.conn)
+        migrate(self.conn)
+
+    def tearDown(self):
+        self.conn.close()
+
+    def test_migrates_to_latest_version(self):
+        self.assertEqual(get_version(self.conn), MIGRATIONS[-1][0])
+
+    def test_hot_queries_use_indexes(self):
+        # 热点查询退化为全表扫描或临时排序时列出对应的执行计划
+        self.assertEqual(check_query_plans(self.conn), [])
+
+    def test_migrate_is_idempotent(self):
+        self.assertEqual(migrate(self.conn), MIGRATIONS[-1][0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,41 @@
+import threading
+import time
+import unittest
+
+from functions.logger_config import configure_logging
+from functions.pipeline import ImagePipeline, PipelineStage
+
+
+class PipelineOnDoneErrorTest(unittest.TestCase):
+    def setUp(self):
+        # 只输出到控制台，测试不写日志文件
+        configure_logging(None)
+
+    def test_worker_survives_on_done_error(self):
+        finished = []
+        lock = threading.Lock()
+
+        def on_done(task, error):
+            if task["id"] == 0:
+                raise RuntimeError("database is locked")
+            with lock:
+                finished.append(task["id"])
+
+        # 单个工作线程：回调异常导致线程退出时，之后的任务永远不会被处理
+        stage = PipelineStage("only", lambda task: True, workers=1, queue_size=10)
+        pipeline = ImagePipeline([stage], on_done)
+        pipeline.start()
+        try:
+            for index in range(5):
+                pipeline.submit({"id": index})
+            deadline = time.time() + 5
+            while pipeline.in_flight and time.time() < deadline:
+                time.sleep(0.01)
+            self.assertEqual(pipeline.in_flight, 0)
+            self.assertEqual(sorted(finished), [1, 2, 3, 4])
+        finally:
+            pipeline.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
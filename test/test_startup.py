@@ -0,0 +1,33 @@
+import importlib.util
+import tempfile
+import unittest
+
+from benchmark.gen_dataset import write_server_config
+from benchmark.startup import check_budgets, import_report
+
+
+class ImportBudgetTest(unittest.TestCase):
+    def assert_within_budget(self, module, cwd):
+        report = import_report(module, cwd)
+        self.assertIsNone(report["error"], report["error"])
+        # 列出导入时加载了的重量级依赖
+        self.assertEqual(check_budgets([report]), [])
+
+    def test_functions(self):
+        with tempfile.TemporaryDirectory() as workdir:
+            self.assert_within_budget("functions", workdir)
+
+    def test_database(self):
+        with tempfile.TemporaryDirectory() as workdir:
+            self.assert_within_budget("functions.database", workdir)
+
+    @unittest.skipUnless(importlib.util.find_spec("flask"), "未安装 Flask")
+    def test_server(self):
+        # server.py 导入时读取工作目录中的 config.json
+        with tempfile.TemporaryDirectory() as workdir:
+            write_server_config(workdir, "test-token")
+            self.assert_within_budget("server", workdir)
+
+
+if __name__ == "__main__":
+    unittest.main()
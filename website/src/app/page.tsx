@@ -6,7 +6,7 @@ import { GalleryItem } from "@/types/gallery";
 import { Header } from "@/components/Header";
 import { GalleryGrid } from "@/components/GalleryGrid";
 import { ImageModal } from "@/components/ImageModal";
-import { fetchRandomImages, fetchImagesByTime } from "@/lib/api-service";
+import { fetchRandomImages, fetchImagesByTime, subscribeImageEvents } from "@/lib/api-service";
 import { useLoading } from "@/contexts/LoadingContext";
 
 const PAGE_SIZE = 20;
@@ -132,6 +132,21 @@ export default function MasonryGallery() {
     loadImages();
   }, [router]);
 
+  useEffect(() => {
+    if (!isAuthenticated) return;
+
+    // 新入库的图片由服务器推送，插入到最前面；其他页面删除的图片同步移除。
+    // 首页不按时间排列，错过的变更（reset）不影响浏览，不重新加载
+    return subscribeImageEvents({
+      onImage: (item) => {
+        setItems((prev) => (prev.some((existing) => existing.id === item.id) ? prev : [item, ...prev]));
+      },
+      onDelete: (imageId) => {
+        setItems((prev) => prev.filter((existing) => existing.id !== imageId));
+      },
+    });
+  }, [isAuthenticated]);
+
   useEffect(() => {
     if (!isAuthenticated) return;
     
@@ -1,5 +1,5 @@
 import { API_BASE_URL } from '@/lib/api-config';
-import { ApiResponse, GalleryItem } from '@/types/gallery';
+import { ApiImageData, ApiResponse, GalleryItem } from '@/types/gallery';
 
 export interface LoginResponse {
   success: boolean;
@@ -112,25 +112,57 @@ export async function searchImages(keyword: string, offset: number = 0, limit: n
   }
 }
 
+interface DescribeResult {
+  success: boolean;
+  data?: string;
+  job_id?: string;
+  status?: 'pending' | 'running' | 'done' | 'failed';
+  message?: string;
+}
+
+// 细化描述任务的轮询间隔与最长等待时间
+const DESCRIBE_POLL_INTERVAL_MS = 1500;
+const DESCRIBE_TIMEOUT_MS = 180000;
+
+async function fetchDescribeResult(url: string, init?: RequestInit): Promise<DescribeResult> {
+  const response = await fetch(url, { headers: getAuthHeaders(), ...init });
+
+  if (response.status === 401) {
+    window.location.href = '/login';
+    throw new Error('Unauthorized');
+  }
+
+  const result: DescribeResult = await response.json();
+
+  if (!response.ok || !result.success) {
+    throw new Error(result.message || `HTTP error! status: ${response.status}`);
+  }
+
+  return result;
+}
+
 export async function describeImage(imageId: string): Promise<string> {
   try {
-    const response = await fetch(`${API_BASE_URL}api/describe-image`, {
+    // 已有细化描述时直接返回，否则返回任务ID，轮询直到任务结束
+    let result = await fetchDescribeResult(`${API_BASE_URL}api/describe-image`, {
       method: 'POST',
-      headers: getAuthHeaders(),
+      headers: { ...getAuthHeaders(), Prefer: 'respond-async' },
       body: JSON.stringify({ image_id: imageId }),
     });
 
-    if (!response.ok) {
-      if (response.status === 401) {
-        window.location.href = '/login';
-        throw new Error('Unauthorized');
+    const deadline = Date.now() + DESCRIBE_TIMEOUT_MS;
+    while (result.job_id && result.status !== 'done') {
+      if (Date.now() > deadline) {
+        throw new Error('Describe image timed out');
       }
-      throw new Error(`HTTP error! status: ${response.status}`);
+      await new Promise((resolve) => setTimeout(resolve, DESCRIBE_POLL_INTERVAL_MS));
+      result = {
+        ...(await fetchDescribeResult(`${API_BASE_URL}api/describe-image/${result.job_id}`)),
+        job_id: result.job_id,
+      };
     }
 
-    const result: { success: boolean; data: string } = await response.json();
-
-    if (!result.success) {
+    if (!result.data) {
       throw new Error('API request failed');
     }
 
@@ -203,6 +235,135 @@ export async function fetchImagesByTime(offset: number = 0, limit: number = 20):
   }
 }
 
+export interface ImageEventHandlers {
+  onImage: (item: GalleryItem) => void;
+  onDelete?: (imageId: string) => void;
+  // 服务器无法补发断线期间的变更时调用，需要重新加载列表
+  onReset?: () => void;
+}
+
+// 新图片推送服务器连接数已满时，等待较长时间再重试
+const EVENTS_BUSY_RETRY_MS = 60000;
+
+export function subscribeImageEvents(handlers: ImageEventHandlers): () => void {
+  // EventSource 不能设置 Authorization 请求头，使用 fetch 读取 /api/events 的事件流，断线后按 Last-Event-ID 续传
+  const controller = new AbortController();
+  let lastEventId: string | null = null;
+  let retryMs = 3000;
+
+  const dispatch = (event: string, data: string) => {
+    if (event === 'image') {
+      const item: ApiImageData = JSON.parse(data);
+      handlers.onImage({
+        id: item.image_id,
+        src: item.img_webp ? convertImagePath(item.img_webp) : '',
+        category: item.category,
+        description: item.description,
+        create_time: item.create_time,
+        real_src: item.image_path ? convertImagePath(item.image_path) : '',
+      });
+    } else if (event === 'delete') {
+      handlers.onDelete?.(JSON.parse(data).image_id);
+    } else if (event === 'reset') {
+      handlers.onReset?.();
+    }
+  };
+
+  // 读取一次连接的事件流，返回重连前的等待时间
+  const connect = async (): Promise<number> => {
+    const headers = new Headers(getAuthHeaders());
+    if (lastEventId !== null) {
+      headers.set('Last-Event-ID', lastEventId);
+    }
+    const response = await fetch(`${API_BASE_URL}api/events`, {
+      headers,
+      cache: 'no-store',
+      signal: controller.signal,
+    });
+
+    if (response.status === 401) {
+      controller.abort();
+      window.location.href = '/login';
+      throw new Error('Unauthorized');
+    }
+    if (response.status === 503) {
+      return EVENTS_BUSY_RETRY_MS;
+    }
+    if (!response.ok || !response.body) {
+      throw new Error(`HTTP error! status: ${response.status}`);
+    }
+
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let event = '';
+    let data: string[] = [];
+    let id: string | null = null;
+
+    while (true) {
+      const { value, done } = await reader.read();
+      if (done) {
+        return retryMs;
+      }
+      buffer += decoder.decode(value, { stream: true });
+      const lines = buffer.split('\n');
+      buffer = lines.pop() ?? '';
+
+      for (const rawLine of lines) {
+        const line = rawLine.endsWith('\r') ? rawLine.slice(0, -1) : rawLine;
+        if (line === '') {
+          // 空行结束一个事件
+          if (id !== null) {
+            lastEventId = id;
+          }
+          if (data.length > 0) {
+            dispatch(event || 'message', data.join('\n'));
+          }
+          event = '';
+          data = [];
+          id = null;
+          continue;
+        }
+        if (line.startsWith(':')) {
+          continue;
+        }
+        const colon = line.indexOf(':');
+        const field = colon === -1 ? line : line.slice(0, colon);
+        let fieldValue = colon === -1 ? '' : line.slice(colon + 1);
+        if (fieldValue.startsWith(' ')) {
+          fieldValue = fieldValue.slice(1);
+        }
+        if (field === 'event') {
+          event = fieldValue;
+        } else if (field === 'data') {
+          data.push(fieldValue);
+        } else if (field === 'id') {
+          id = fieldValue;
+        } else if (field === 'retry' && /^\d+$/.test(fieldValue)) {
+          retryMs = parseInt(fieldValue, 10);
+        }
+      }
+    }
+  };
+
+  (async () => {
+    while (!controller.signal.aborted) {
+      let delay = retryMs;
+      try {
+        delay = await connect();
+      } catch (error) {
+        if (controller.signal.aborted) {
+          return;
+        }
+        console.error('Image events error:', error);
+      }
+      await new Promise((resolve) => setTimeout(resolve, delay));
+    }
+  })();
+
+  return () => controller.abort();
+}
+
 function convertImagePath(imagePath: string): string {
   const isDevelopment = process.env.NODE_ENV === 'development';
 
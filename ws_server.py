@@ -1,19 +1,199 @@
 import asyncio
+import random
+import re
+import time
 import websockets
-import json
+from typing import Any, Dict
+from functions import json_codec
 from functions.config_loader import load_config
-from functions.logger_config import setup_logger
+from functions.logger_config import setup_logger, configure_logging_from_config
+from functions.metrics import metrics
 from main import PictureSniffer
 
 
 logger = setup_logger("ws_server")
 
+# 断线重连的等待时间：从最短等待时间开始每次翻倍，不超过最长等待时间
+RECONNECT_INITIAL_DELAY = 1.0
+RECONNECT_MAX_DELAY = 60.0
+# 连接保持超过该时间视为稳定，之后断线重新从最短等待时间开始
+STABLE_CONNECTION_SECONDS = 60.0
+
+# 消息帧预过滤：图片片段的JSON中必然出现 "image"，群消息中必然出现 "group"（message_type的值）
+IMAGE_MARKER = b'"image"'
+GROUP_MARKER = b'"group"'
+GROUP_ID_PATTERN = re.compile(rb'"group_id"\s*:\s*"?(\d+)')
+MESSAGE_ID_PATTERN = re.compile(rb'"message_id"\s*:\s*"?(-?\d+)')
+
+
+def reconnect_delay(attempt: int, initial: float, maximum: float) -> float:
+    """
+    计算第attempt次重连前的等待时间（指数退避），乘以0.5~1的随机系数，避免多个进程同时重连
+
+    Args:
+        attempt: 连续失败的次数，从0开始
+        initial: 最短等待时间（秒）
+        maximum: 最长等待时间（秒）
+
+    Returns:
+        float: 等待秒数
+    """
+    return min(maximum, initial * 2 ** min(attempt, 16)) * random.uniform(0.5, 1.0)
+
+
+def save_group_cursors(sniffer: PictureSniffer, last_seen: Dict[str, str], saved: Dict[str, str]):
+    """
+    将WebSocket收到的各群最新消息ID写入数据库，作为重连后补拉消息的起点
+
+    Args:
+        sniffer: PictureSniffer实例
+        last_seen: 群ID到最近收到的消息ID的映射
+        saved: 已写入数据库的游标，写入后同步更新
+    """
+    changed = [(group_id, message_id) for group_id, message_id in last_seen.items() if saved.get(group_id) != message_id]
+    if not changed:
+        return
+    sniffer.db_manager.upsert_groups(changed)
+    saved.update(changed)
+
+
+def catch_up(sniffer: PictureSniffer, last_seen: Dict[str, str], saved: Dict[str, str]):
+    """
+    重连后按群补拉断线期间的消息：只处理本次运行中收到过消息的群，
+    从各群最后收到的消息开始通过 get_new_messages 向后翻页，通常只需要几页历史记录
+
+    Args:
+        sniffer: PictureSniffer实例
+        last_seen: 群ID到最近收到的消息ID的映射，补拉后更新为最新消息ID
+        saved: 已写入数据库的游标
+    """
+    save_group_cursors(sniffer, last_seen, saved)
+    started = time.perf_counter()
+    total = 0
+    for group_id in list(last_seen):
+        try:
+            total += sniffer.process_group(group_id)
+        except Exception as e:
+            logger.error("补拉群 %s 的消息失败: %s", group_id, e)
+            continue
+        latest = sniffer.db_manager.get_group_last_message_id(group_id)
+        if latest:
+            last_seen[group_id] = saved[group_id] = latest
+    metrics.inc("ws_catchup_images_total", total)
+    logger.info("重连后补拉 %s 个群的消息，新增 %s 个图片任务，耗时 %.1f 秒", len(last_seen), total, time.perf_counter() - started)
+    sniffer.process_image_queue()
+
+
+def track_text_frame(frame: bytes, last_seen: Dict[str, str]) -> bool:
+    """
+    不解码JSON，直接从不含图片的群消息帧中取出群ID和消息ID，更新补拉起点
+
+    Args:
+        frame: 原始消息帧
+        last_seen: 群ID到最近收到的消息ID的映射
+
+    Returns:
+        bool: 是否为群消息
+    """
+    if GROUP_MARKER not in frame:
+        return False
+    group_id = GROUP_ID_PATTERN.search(frame)
+    message_id = MESSAGE_ID_PATTERN.search(frame)
+    if group_id is None or message_id is None:
+        return False
+    last_seen[group_id.group(1).decode()] = message_id.group(1).decode()
+    return True
+
+
+async def process_image_event(event: Dict[str, Any], sniffer: PictureSniffer) -> str:
+    """
+    消息中有图片时加入任务队列并处理
+
+    Returns:
+        str: 帧的处理结果，用于 ws_frames_total 计数
+    """
+    image_message = sniffer.data_fetcher.extract_image_message(event)
+    if image_message is None:
+        return "no_image"
+    sniffer.job_queue.enqueue([image_message])
+    # 处理图片期间事件循环继续响应心跳，长时间处理不会导致连接超时断开
+    await asyncio.get_running_loop().run_in_executor(None, sniffer.process_image_queue)
+    return "image"
+
+
+async def handle_group_message(event: Dict[str, Any], sniffer: PictureSniffer, last_seen: Dict[str, str]) -> str:
+    """
+    处理群消息事件：更新补拉起点，有图片时加入任务队列并处理
+
+    Returns:
+        str: 帧的处理结果，用于 ws_frames_total 计数
+    """
+    group_id = str(event.get("group_id", ""))
+    message_id = str(event.get("message_id", ""))
+    if group_id and message_id:
+        last_seen[group_id] = message_id
+    return await process_image_event(event, sniffer)
+
+
+async def handle_private_message(event: Dict[str, Any], sniffer: PictureSniffer, last_seen: Dict[str, str]) -> str:
+    """
+    处理私聊消息事件：有图片时加入任务队列并处理。私聊没有补拉，不更新补拉起点
+
+    Returns:
+        str: 帧的处理结果，用于 ws_frames_total 计数
+    """
+    return await process_image_event(event, sniffer)
+
+
+# 按 (post_type, message_type) 分发事件，未列出的事件（心跳、生命周期、通知等）直接丢弃
+EVENT_HANDLERS = {
+    ("message", "group"): handle_group_message,
+    ("message_sent", "group"): handle_group_message,
+    ("message", "private"): handle_private_message,
+    ("message_sent", "private"): handle_private_message,
+}
+
+
+async def receive_messages(ws, sniffer: PictureSniffer, last_seen: Dict[str, str]):
+    """
+    接收并处理推送的消息，直到连接断开
+
+    不含图片片段的帧（心跳、生命周期事件、文字消息等）不做完整的JSON解码；
+    每个帧的处理结果计入 ws_frames_total{result}
+
+    Args:
+        ws: WebSocket连接
+        sniffer: PictureSniffer实例
+        last_seen: 群ID到最近收到的消息ID的映射
+    """
+    while True:
+        # 不解码为str，预过滤和 orjson 都直接处理字节串
+        frame = await ws.recv(decode=False)
+        if IMAGE_MARKER not in frame:
+            metrics.inc("ws_frames_total", result="text" if track_text_frame(frame, last_seen) else "skipped")
+            continue
+        try:
+            event = json_codec.loads(frame)
+        except ValueError:
+            logger.warning("收到非JSON消息：%s", frame[:200])
+            metrics.inc("ws_frames_total", result="invalid")
+            continue
+        handler = EVENT_HANDLERS.get((event.get("post_type"), event.get("message_type")))
+        if handler is None:
+            metrics.inc("ws_frames_total", result="ignored")
+            continue
+        metrics.inc("ws_frames_total", result=await handler(event, sniffer, last_seen))
+
+
 async def main():
     """
     主函数，用于连接到 NapCat WebSocket 服务器并处理消息。
     复用了大部分 PictureSniffer 的功能，仅对图片消息进行处理。
+    连接断开后按指数退避自动重连，并补拉断线期间各群的消息。
     """
     config = load_config("config.json")
+    # 与 main.py 同时运行，使用单独的日志文件
+    configure_logging_from_config(config, process_name="ws_server")
     sniffer = PictureSniffer(config)
     sniffer.thread_pool_size = 1
     uri = config.get("napcat_ws_uri")
@@ -25,22 +205,47 @@ async def main():
         logger.error("napcat_ws_uri 未配置")
         raise ValueError("napcat_ws_uri 未配置")
     additional_headers = {"Authorization": f"Bearer {token}"}
-    logger.info("尝试连接到 %s ，使用 token 进行认证", uri)
-    async with websockets.connect(uri, additional_headers=additional_headers) as ws:
-        # 接收响应或事件
+    reconnect = config.get("ws_reconnect", True)
+    initial_delay = config.get("ws_reconnect_initial_delay", RECONNECT_INITIAL_DELAY)
+    max_delay = config.get("ws_reconnect_max_delay", RECONNECT_MAX_DELAY)
+    # 本次运行中每个群最近收到的消息ID，以及已写入数据库的部分
+    last_seen: Dict[str, str] = {}
+    saved: Dict[str, str] = {}
+    loop = asyncio.get_running_loop()
+    # 定期在日志中输出指标摘要，并供 server.py 的 /metrics 汇总
+    reporter = sniffer.start_metrics_reporter("ws_server")
+    try:
+        # 先处理上次运行遗留在任务队列中的图片
+        sniffer.process_image_queue()
+        attempt = 0
+        disconnected = False
         while True:
-            msg = await ws.recv()
+            connected_at = None
             try:
-                message = json.loads(msg)
-            except json.JSONDecodeError:
-                logger.warning("收到非JSON消息：%s", msg)
-                continue
-            message_bodies = message.get("message", [])
-            if not message_bodies:
-                continue
-            image_messages = sniffer.data_fetcher.extract_image_messages([message])
-            for image_message in image_messages:
-                sniffer.image_queue.put(image_message)
-            sniffer.process_image_queue()
-
-asyncio.run(main())
\ No newline at end of file
+                logger.info("尝试连接到 %s ，使用 token 进行认证", uri)
+                async with websockets.connect(uri, additional_headers=additional_headers) as ws:
+                    connected_at = time.monotonic()
+                    if disconnected:
+                        metrics.inc("ws_reconnects_total")
+                        # 补拉期间新推送的消息由连接缓存，补拉结束后继续接收
+                        await loop.run_in_executor(None, catch_up, sniffer, last_seen, saved)
+                    await receive_messages(ws, sniffer, last_seen)
+            except (websockets.exceptions.WebSocketException, OSError, asyncio.TimeoutError) as e:
+                if not reconnect:
+                    raise
+                logger.warning("WebSocket 连接断开: %r", e)
+            disconnected = True
+            save_group_cursors(sniffer, last_seen, saved)
+            if connected_at is not None and time.monotonic() - connected_at >= STABLE_CONNECTION_SECONDS:
+                attempt = 0
+            delay = reconnect_delay(attempt, initial_delay, max_delay)
+            attempt += 1
+            logger.info("%.1f 秒后重新连接（第 %s 次）", delay, attempt)
+            await asyncio.sleep(delay)
+    finally:
+        save_group_cursors(sniffer, last_seen, saved)
+        reporter.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())